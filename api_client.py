@@ -0,0 +1,93 @@
+import json
+import os
+import threading
+import time
+import httpx
+
+# Base URL of a running service.py; when set, the Streamlit app sends records there instead of calling OpenAI itself.
+SERVICE_URL = os.getenv("SERVICE_URL", "")
+
+FINISHED_STATUSES = {"done", "blocked", "flagged", "error", "cancelled"}
+# What a call to the service can raise: connection and HTTP status errors, or run() giving up on a job.
+SERVICE_ERRORS = (httpx.HTTPError, TimeoutError)
+
+class ServiceClient:
+    """
+    Client for the service.py HTTP API. Submissions refused with 429 (queue full) are retried after the
+    server's Retry-After, so callers see backpressure as added latency rather than an error.
+    """
+
+    def __init__(self, base_url, token=None, timeout=30.0, submit_patience=120.0):
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        self.http = httpx.Client(base_url=base_url.rstrip("/"), headers=headers, timeout=timeout)
+        self.submit_patience = submit_patience
+
+    def submit(self, record, api_key=None, job_priority="interactive", **options):
+        """Queues a record (options: model, instruction, allow_override, incremental, combined_review, source); returns the job."""
+        body = {"record": record, "priority": job_priority, **options}
+        headers = {"X-OpenAI-Key": api_key} if api_key else {}
+        deadline = time.monotonic() + self.submit_patience
+        while True:
+            response = self.http.post("/v1/summaries", json=body, headers=headers)
+            if response.status_code != 429 or time.monotonic() >= deadline:
+                response.raise_for_status()
+                return response.json()
+            time.sleep(float(response.headers.get("Retry-After") or 1))
+
+    def get(self, job_id, wait=0):
+        """The job; with wait, blocks on the server for up to that many seconds until it finishes."""
+        response = self.http.get(f"/v1/summaries/{job_id}", params={"wait": wait} if wait else None, timeout=wait + 30)
+        response.raise_for_status()
+        return response.json()
+
+    def cancel(self, job_id):
+        response = self.http.delete(f"/v1/summaries/{job_id}")
+        if response.status_code == 409:
+            return False
+        response.raise_for_status()
+        return True
+
+    def events(self, job_id):
+        """Yields the job's status events as they happen, ending with the one that carries the result."""
+        with self.http.stream("GET", f"/v1/summaries/{job_id}/events", timeout=None) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if line.startswith("data: "):
+                    yield json.loads(line[len("data: "):])
+
+    def run(self, record, api_key=None, timeout=600.0, **options):
+        """Submits a record and long-polls until its job finishes; returns the finished job (result under "result")."""
+        job = self.submit(record, api_key, **options)
+        deadline = time.monotonic() + timeout
+        while job["status"] not in FINISHED_STATUSES:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.cancel(job["id"])
+                raise TimeoutError(f"Summary job {job['id']} did not finish within {timeout} seconds")
+            job = self.get(job["id"], wait=min(remaining, 30))
+        return job
+
+    def health(self):
+        response = self.http.get("/healthz")
+        return {"http_status": response.status_code, **response.json()}
+
+    def metrics(self):
+        response = self.http.get("/metrics")
+        response.raise_for_status()
+        return response.json()
+
+    def close(self):
+        self.http.close()
+
+_service_client = None
+_service_client_lock = threading.Lock()
+
+def get_service_client():
+    """Process-wide client for SERVICE_URL (token from SERVICE_TOKEN), or None when the app should run the pipeline itself."""
+    global _service_client
+    if not SERVICE_URL:
+        return None
+    with _service_client_lock:
+        if _service_client is None:
+            _service_client = ServiceClient(SERVICE_URL, os.getenv("SERVICE_TOKEN"))
+        return _service_client
@@ -2,23 +2,36 @@ import os
 import streamlit as st
 import textstat
 import logging
-import json
-import re
 from datetime import datetime
 from openai import OpenAIError
 from summary_generator import (
-    load_patient_data,
     get_discharge_summary,
-    extract_highlights,
+    stream_discharge_summary,
+    update_discharge_summary,
+    stream_summary_update,
     validate_discharge_safety,
+    parse_safety_verdict,
 )
-from utils import is_safe_for_discharge, redact_pii, insert_pii
-
-DEFAULT_SYSTEM_PROMPT = "Write a clear and complete discharge summary in paragraph form for the patient described in this data. Do not use bullet points."
+from llm_cache import get_cache
+from single_flight import get_single_flight
+from scheduler import get_scheduler
+from highlighting import get_highlight_renderer
+from prefetch import get_prefetcher
+from api_client import SERVICE_ERRORS, get_service_client
+from local_highlights import highlight_coverage
+from record_cache import get_record_cache
+from incremental import get_incremental_store, plan_regeneration, save_outputs
+from instrumentation import stage, start_trace, summarize
+from audit_log import get_audit_log
+from summary_store import diagnosis_text, get_summary_store
+from pipeline import DEFAULT_SYSTEM_PROMPT, build_instruction, run_async, run_post_generation_async
 
 st.set_page_config(page_title="Discharge Summary Generator", layout="wide")
 st.title("🏥 LLM-Powered Discharge Summary Generator")
 
+# With SERVICE_URL set, the app is a thin client: records go to service.py, which runs the pipeline.
+service = get_service_client()
+
 if "last_selected_file" not in st.session_state:
     st.session_state.last_selected_file = ""
 if "allow_override" not in st.session_state:
@@ -36,9 +49,65 @@ with st.sidebar:
     model_name = st.selectbox("🧠 Model", ["gpt-4", "gpt-3.5-turbo"])
     temperature = st.slider("🌡️ Temperature", 0.0, 1.0, 0.6)
     st.caption("📘 Temperature controls creativity: lower = more focused, higher = more diverse responses.")
+    stream_output = st.checkbox("⚡ Stream summary as it is generated", value=True)
+    reuse_results = st.checkbox("♻️ Reuse results for unchanged records", value=True)
+    st.caption("Skips LLM calls whose inputs have not changed since the last run for this patient, and updates the previous summary when only new notes or results arrived.")
+    prefetch_draft = st.checkbox("🔮 Prefetch a draft summary on file selection", value=False)
+    st.caption("The pre-generation safety check always starts in the background once a file is selected; this also drafts the summary, at the cost of a discarded call when you change the file or instruction.")
+
+    with st.expander("🗄️ Caches"):
+        cache_stats = get_cache().summary()
+        st.caption(
+            f"LLM responses — hit rate: {int(cache_stats['hit_rate'] * 100)}% "
+            f"({cache_stats['memory_hits'] + cache_stats['disk_hits']} hits / {cache_stats['misses']} misses), "
+            f"{cache_stats['disk_entries']} stored responses."
+        )
+        st.caption("Safety checks and highlights are reused for identical prompts. Summary generation is never cached.")
+        if st.button("🧹 Clear response cache"):
+            get_cache().clear()
+        record_stats = get_record_cache().summary()
+        st.caption(
+            f"Patient records — hit rate: {int(record_stats['hit_rate'] * 100)}% "
+            f"({record_stats['hits']} hits / {record_stats['misses']} misses), "
+            f"{record_stats['entries']} records in memory."
+        )
+        incremental_stats = get_incremental_store().summary()
+        st.caption(
+            f"Incremental regeneration — {incremental_stats['patients']} patients stored; summaries reused "
+            f"{incremental_stats.get('summary_reuse', 0)}, updated {incremental_stats.get('summary_update', 0)}, "
+            f"regenerated {incremental_stats.get('summary_full', 0)}; safety pre-checks reused {incremental_stats.get('safety_pre_reused', 0)}."
+        )
+        flight_stats = get_single_flight().summary()
+        st.caption(
+            f"Request coalescing — {flight_stats['coalesced']} calls shared an identical in-flight request "
+            f"from another session ({flight_stats['leaders']} requests made, {flight_stats['in_flight']} in flight)."
+        )
+        scheduler_stats = get_scheduler().summary()
+        st.caption(
+            f"Rate limits — {scheduler_stats['queued']} calls queued for quota "
+            f"({scheduler_stats['waited_seconds']}s in total), {scheduler_stats['rate_limited']} rate-limited responses retried, "
+            f"{scheduler_stats['downgraded']} highlight calls moved to a cheaper model."
+        )
+        prefetch_stats = get_prefetcher().summary()
+        st.caption(
+            f"Prefetch — {prefetch_stats['used']} of {prefetch_stats['started']} background calls used "
+            f"({prefetch_stats['saved_seconds']}s saved), {prefetch_stats['cancelled']} cancelled, "
+            f"{prefetch_stats['discarded']} discarded after the selection changed."
+        )
+        if service:
+            try:
+                service_stats = service.metrics()["jobs"]
+                st.caption(
+                    f"Summary service — {service_stats['running']} running, {service_stats['queued']} queued, "
+                    f"{service_stats['completed']} completed (p50 {service_stats['latency_p50']}s), {service_stats['rejected']} refused while full."
+                )
+            except SERVICE_ERRORS as e:
+                st.caption(f"Summary service — unavailable ({e}).")
+        if st.button("🧹 Clear stored results"):
+            get_incremental_store().clear()
 
 st.subheader("📂 Generate Summary from Patient Record")
-json_files = [f for f in os.listdir("data") if f.endswith(".json")]
+json_files = get_record_cache().list_json_files("data")
 selected_file = st.selectbox("Select patient data file", json_files)
 
 if selected_file != st.session_state.last_selected_file:
@@ -47,6 +116,8 @@ if selected_file != st.session_state.last_selected_file:
     st.session_state.summary_with_pii = ""
     st.session_state.highlights = []
     st.session_state.safety_validation = ""
+    st.session_state.summary_id = None
+    st.session_state.time_to_first_token = None
     st.session_state.allow_override = False
     st.session_state.generate_clicked = False
     st.session_state.can_generate = False
@@ -55,34 +126,93 @@ if selected_file != st.session_state.last_selected_file:
             del st.session_state[key]
 
 data_path = os.path.join("data", selected_file)
-patient_data = load_patient_data(data_path)
-redacted_data = redact_pii(patient_data)
+# Parsed record, redacted view and keyword screen are cached per file (keyed by mtime/size) across reruns.
+with stage("load", file=selected_file):
+    record = get_record_cache().get(data_path)
+patient_data = record["patient_data"]
+redacted_data = record["redacted_data"]
 
 st.radio("Prompt Method", ["Few-shot with Chain-of-Thought reasoning"], index=0, disabled=True)
 additional_prompt = st.text_area("📝 Optional: Add extra instruction to guide the LLM", placeholder="E.g., Emphasize follow-up plans if any...", height=100)
 st.caption("💡 If you leave this field empty, a default prompt will be used to generate the summary.")
 
+# Start the calls the Generate button will need while the user is still reading the record. A prefetch is keyed by
+# its inputs; when the file, key, model or instruction changes, the stale one is cancelled (or its result dropped).
+prefetches = st.session_state.setdefault("prefetches", {})
+safety_key = (data_path, record["signature"], api_key)
+draft_key = (data_path, record["signature"], api_key, model_name, build_instruction(additional_prompt))
+wanted = {}
+if api_key and record["keyword_safe"] and not service:
+    # Only calls the Generate button would actually make: nothing the incremental store would reuse.
+    prefetch_plan = plan_regeneration(redacted_data, model_name, draft_key[4], count=False) if reuse_results else None
+    if not (prefetch_plan and prefetch_plan["safety_pre"]):
+        wanted["safety_pre"] = (safety_key, validate_discharge_safety, (redacted_data, api_key), {})
+    if prefetch_draft and (prefetch_plan is None or prefetch_plan["summary_mode"] == "full"):
+        wanted["draft"] = (
+            draft_key,
+            get_discharge_summary,
+            (redacted_data, api_key),
+            {"few_shot": True, "model": model_name, "additional_instruction": draft_key[4]},
+        )
+get_prefetcher().sync(prefetches, wanted)
+
 if st.button("📝 Generate Summary"):
     st.session_state.generate_clicked = True
 
 if st.session_state.generate_clicked:
+    start_trace("app")
     if not api_key:
         st.warning("Please enter your OpenAI API key.")
         st.session_state.generate_clicked = False
         st.stop()
 
-    if not is_safe_for_discharge(patient_data):
+    if not record["keyword_safe"]:
         st.error("❌ Keyword-based screen: Patient is not medically safe for discharge (pre-screen).")
         st.session_state.generate_clicked = False
         st.stop()
 
-    safety_pre = validate_discharge_safety(redacted_data, api_key)
+    combined_prompt = build_instruction(additional_prompt)
+    plan = plan_regeneration(redacted_data, model_name, combined_prompt) if reuse_results and not service else None
+    service_result = None
+    if service:
+        # The service stops after the safety check unless overridden; resubmitting with the override reuses its verdict.
+        try:
+            with st.spinner("Waiting for the summary service..."), stage("service", file=selected_file):
+                service_job = service.run(
+                    patient_data,
+                    api_key,
+                    model=model_name,
+                    instruction=additional_prompt,
+                    allow_override=st.session_state.allow_override,
+                    incremental=reuse_results,
+                    source=selected_file,
+                )
+        except SERVICE_ERRORS as e:
+            st.error(f"❌ Summary service unavailable: {e}")
+            st.session_state.generate_clicked = False
+            st.stop()
+        service_result = service_job.get("result") or {}
+        if service_job["status"] in ("error", "cancelled"):
+            st.error(f"❌ Summary service: job {service_job['status']}. {service_result.get('error', '')}")
+            st.session_state.generate_clicked = False
+            st.stop()
+        safety_pre = service_result.get("safety_pre", "")
+    else:
+        with stage("safety_pre", file=selected_file, reused=bool(plan and plan["safety_pre"])):
+            if plan and plan["safety_pre"]:
+                safety_pre = plan["safety_pre"]
+            else:
+                prefetched = get_prefetcher().get(prefetches, "safety_pre", safety_key)
+                safety_pre = get_prefetcher().consume(prefetched) if prefetched else None
+                if safety_pre is None:
+                    safety_pre = validate_discharge_safety(redacted_data, api_key)
+    if plan:
+        save_outputs(plan, safety_pre=safety_pre)
     st.markdown("#### 🛡️ LLM Pre-Generation Safety Check")
     st.markdown(safety_pre)
 
-    verdict_match = re.search(r"(?i)^answer:\s*(yes|no|uncertain)", safety_pre, re.MULTILINE)
-    if verdict_match:
-        final_verdict = verdict_match.group(1).capitalize()
+    final_verdict = parse_safety_verdict(safety_pre)
+    if final_verdict:
         badge_color = {"Yes": "#28a745", "No": "#dc3545", "Uncertain": "#ffc107"}.get(final_verdict, "#6c757d")
         st.markdown(f"<div style='background-color:{badge_color}; color:white; padding:6px 12px; border-radius:6px; display:inline-block;'>🩺 LLM Verdict: {final_verdict}</div>", unsafe_allow_html=True)
 
@@ -101,41 +231,121 @@ if st.session_state.generate_clicked:
 
 if st.session_state.generate_clicked and st.session_state.can_generate:
     try:
-        combined_prompt = DEFAULT_SYSTEM_PROMPT
-        if additional_prompt.strip():
-            combined_prompt += f"\n\n{additional_prompt.strip()}"
-
-        with st.spinner("Generating discharge summary..."):
-            summary_redacted = get_discharge_summary(
-                redacted_data,
-                api_key,
-                few_shot=True,
-                model=model_name,
-                additional_instruction=combined_prompt,
-            )
-            summary_with_pii = insert_pii(summary_redacted, patient_data)
-            highlights = extract_highlights(summary_redacted, api_key)
-            safety_post = validate_discharge_safety(summary_redacted, api_key)
+        summary_mode = service_result.get("summary_mode", "full") if service_result else plan["summary_mode"] if plan else "full"
+        draft_summary = None
+        prefetched = get_prefetcher().get(prefetches, "draft", draft_key) if summary_mode == "full" else None
+        if prefetched:
+            with st.spinner("Finishing the prefetched draft summary..."), stage("summary", file=selected_file, mode=summary_mode, prefetched=True):
+                draft_summary = get_prefetcher().consume(prefetched)
+
+        if service_result is not None:
+            summary_redacted = service_result["summary_redacted"]
+            st.session_state.time_to_first_token = None
+        elif summary_mode == "reuse":
+            with stage("summary", file=selected_file, mode=summary_mode):
+                summary_redacted = plan["summary"]
+            st.info("♻️ The record has not changed since the last summary, so it was reused.")
+            st.session_state.time_to_first_token = None
+        elif draft_summary is not None:
+            summary_redacted = draft_summary
+            st.info("🔮 The summary was drafted in the background when the file was selected.")
+            st.session_state.time_to_first_token = None
+        elif stream_output:
+            # Show tokens as they arrive, then clear the preview; the final summary renders below.
+            stream_box = st.empty()
+            stream_metrics = {}
+            with stream_box.container(), stage("summary", file=selected_file, streamed=True, mode=summary_mode) as summary_span:
+                if summary_mode == "update":
+                    st.markdown("#### ✍️ Updating Discharge Summary with New Information...")
+                    summary_stream = stream_summary_update(
+                        plan["summary"],
+                        plan["new_entries"],
+                        api_key,
+                        model=model_name,
+                        additional_instruction=combined_prompt,
+                        metrics=stream_metrics,
+                    )
+                else:
+                    st.markdown("#### ✍️ Generating Discharge Summary...")
+                    summary_stream = stream_discharge_summary(
+                        redacted_data,
+                        api_key,
+                        few_shot=True,
+                        model=model_name,
+                        additional_instruction=combined_prompt,
+                        metrics=stream_metrics,
+                    )
+                summary_redacted = st.write_stream(summary_stream)
+                summary_span["ttft_seconds"] = stream_metrics.get("ttft")
+            stream_box.empty()
+            st.session_state.time_to_first_token = stream_metrics.get("ttft")
+        else:
+            with st.spinner("Generating discharge summary..."), stage("summary", file=selected_file, streamed=False, mode=summary_mode):
+                if summary_mode == "update":
+                    summary_redacted = update_discharge_summary(
+                        plan["summary"],
+                        plan["new_entries"],
+                        api_key,
+                        model=model_name,
+                        additional_instruction=combined_prompt,
+                    )
+                else:
+                    summary_redacted = get_discharge_summary(
+                        redacted_data,
+                        api_key,
+                        few_shot=True,
+                        model=model_name,
+                        additional_instruction=combined_prompt,
+                    )
+            st.session_state.time_to_first_token = None
+
+        with st.spinner("Extracting highlights and checking discharge safety..."):
+            # Highlights and the post-generation safety check only need the summary: one combined review call.
+            if service_result is not None:
+                summary_with_pii, highlights, safety_post = (service_result[k] for k in ("summary_with_pii", "highlights", "safety_post"))
+            else:
+                summary_with_pii, highlights, safety_post = run_async(
+                    run_post_generation_async(
+                        summary_redacted, patient_data, api_key, plan=plan if summary_mode == "reuse" else None
+                    )
+                )
+            if plan:
+                save_outputs(plan, summary=summary_redacted, highlights=highlights, safety_post=safety_post)
 
             st.session_state.summary_redacted = summary_redacted
             st.session_state.summary_with_pii = summary_with_pii
             st.session_state.highlights = highlights
             st.session_state.safety_validation = safety_post
 
-            for name, output, log_file in [
-                ("REDACTED", summary_redacted, "logs/log_deidentified.log"),
-                ("WITH PII", summary_with_pii, "logs/log_identified.log"),
-            ]:
-                with open(log_file, "a", encoding="utf-8") as f:
-                    f.write("="*60 + f"\n[SUMMARY GENERATED] {datetime.now()} - {name}\n" + "-"*60 + "\n")
-                    f.write(f"FILE: {selected_file}\n")
-                    f.write(f"SYSTEM PROMPT:\n{DEFAULT_SYSTEM_PROMPT}\n")
-                    f.write(f"USER PROMPT:\n{additional_prompt.strip() or '[None]'}\n")
-                    f.write(f"FULL PROMPT SENT TO LLM:\n{combined_prompt}\n")
-                    f.write(f"OUTPUT:\n{output}\n")
-                    f.write(f"HIGHLIGHTS:\n{json.dumps(highlights)}\n")
-                    f.write(f"SAFETY VALIDATION (POST):\n{safety_post}\n")
-                    f.write("="*60 + "\n")
+            st.session_state.summary_model = model_name
+            st.session_state.summary_id = get_summary_store().add_summary(
+                filename=selected_file,
+                patient_id=patient_data.get("patient_id"),
+                model=model_name,
+                diagnosis=diagnosis_text(patient_data),
+                summary_mode=summary_mode,
+                instruction=combined_prompt,
+                summary=summary_redacted,
+                highlights=highlights,
+                safety_post=safety_post,
+                verdict=parse_safety_verdict(safety_post),
+                source="app",
+            )
+
+            # Queued for the background audit writer; nothing here waits on disk I/O.
+            for log_name, output in [("deidentified", summary_redacted), ("identified", summary_with_pii)]:
+                get_audit_log(log_name).write({
+                    "event": "summary_generated",
+                    "file": selected_file,
+                    "model": model_name,
+                    "summary_mode": summary_mode,
+                    "system_prompt": DEFAULT_SYSTEM_PROMPT,
+                    "user_prompt": additional_prompt.strip(),
+                    "full_prompt": combined_prompt,
+                    "output": output,
+                    "highlights": highlights,
+                    "safety_post": safety_post,
+                })
 
     except OpenAIError:
         st.error("❌ OpenAI API Error. Please check your key and try again.")
@@ -145,7 +355,7 @@ st.subheader("🔒 Choose Display Mode")
 view_mode = st.selectbox("Display Format", ["De-Identified View", "Identified View"])
 st.caption("🧾 De-Identified View hides personal info. Identified View restores real names/dates after generation. No PII is ever sent to the LLM in either mode.")
 
-def render_summary(tab_name, state_key, log_file):
+def render_summary(tab_name, state_key, log_name):
     summary_text = st.session_state.get(state_key, "")
     st.markdown(f"### {tab_name} Summary")
 
@@ -164,15 +374,7 @@ def render_summary(tab_name, state_key, log_file):
             st.session_state[edit_key] = False
             st.rerun()
     else:
-        display_text = summary_text
-        for section in ["Patient Information:", "Diagnosis:", "Summary of Care:", "Disposition:", "Follow-up Plan:", "Contact:"]:
-            display_text = re.sub(rf"(^|\n)({re.escape(section)})", r"\1**\2**", display_text)
-        for item in st.session_state.highlights:
-            phrase = re.escape(item["text"])
-            pattern = rf"(?<!\w)({phrase})(?!\w)"
-            display_text = re.sub(pattern, r"**\1**", display_text, flags=re.IGNORECASE)
-
-
+        display_text = get_highlight_renderer().render(summary_text, st.session_state.highlights)
         st.markdown(display_text, unsafe_allow_html=True)
 
         if st.button("✏️ Edit", key=f"{tab_name}_edit_btn"):
@@ -181,10 +383,10 @@ def render_summary(tab_name, state_key, log_file):
     st.markdown("### 🧪 Evaluation Metrics")
     readability = textstat.flesch_reading_ease(summary_text)
     st.metric("📓 Readability", f"{readability:.2f}")
+    if st.session_state.get("time_to_first_token") is not None:
+        st.metric("⏱️ Time to First Token", f"{st.session_state.time_to_first_token:.2f}s")
 
-    expected = {"diagnosis", "medication", "followup_action", "discharge_criteria", "recovery_status"}
-    actual = {item["category"] for item in st.session_state.highlights}
-    coverage = len(expected & actual) / len(expected)
+    coverage = highlight_coverage(st.session_state.highlights)
     st.progress(coverage, text=f"Highlight Coverage: {int(coverage * 100)}%")
 
     if st.session_state.safety_validation:
@@ -217,6 +419,7 @@ def render_summary(tab_name, state_key, log_file):
 
     if st.button(f"📩 Submit Evaluation ({tab_name})", key=f"{tab_name}_submit"):
         eval_data = {
+            "event": "evaluation",
             "tab": tab_name,
             "clarity_rating": clarity,
             "specificity_rating": specificity,
@@ -229,14 +432,42 @@ def render_summary(tab_name, state_key, log_file):
             "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
             "filename": st.session_state.last_selected_file,
         }
-        with open(f"logs/{log_file}", "a", encoding="utf-8") as f:
-            f.write(json.dumps(eval_data, indent=2) + "\n")
+        get_audit_log(log_name).write(eval_data)
+        get_summary_store().add_evaluation(
+            created=eval_data["timestamp"],
+            summary_id=st.session_state.get("summary_id"),
+            filename=st.session_state.last_selected_file,
+            patient_id=patient_data.get("patient_id"),
+            model=st.session_state.get("summary_model"),
+            diagnosis=diagnosis_text(patient_data),
+            view=log_name,
+            clarity=clarity,
+            specificity=specificity,
+            correctness=accuracy,
+            sections=sections,
+            no_pii=no_pii,
+            highlight_coverage=coverage,
+            readability=readability,
+            verdict=parse_safety_verdict(st.session_state.safety_validation),
+            raw=eval_data,
+            source="app",
+        )
         st.success("✅ Evaluation logged.")
 
-if view_mode == "De-Identified View":
-    render_summary("De-Identified", "summary_redacted", "log_deidentified.log")
-elif view_mode == "Identified View":
-    render_summary("Identified", "summary_with_pii", "log_identified.log")
+with stage("render", view=view_mode):
+    if view_mode == "De-Identified View":
+        render_summary("De-Identified", "summary_redacted", "deidentified")
+    elif view_mode == "Identified View":
+        render_summary("Identified", "summary_with_pii", "identified")
+
+with st.sidebar:
+    with st.expander("📊 Performance"):
+        perf_summary = summarize()
+        if perf_summary:
+            st.dataframe(perf_summary, hide_index=True)
+            st.caption(f"Estimated spend since the app started: ${sum(row['cost_usd'] for row in perf_summary):.4f}. Per-stage records are written to logs/metrics.jsonl.")
+        else:
+            st.caption("No stages recorded yet.")
 
 # Reset flags AFTER rendering
 st.session_state.generate_clicked = False
@@ -0,0 +1,181 @@
+import atexit
+import glob
+import gzip
+import json
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+from datetime import datetime
+
+AUDIT_LOG_DIR = os.getenv("AUDIT_LOG_DIR", "logs")
+
+# One JSON-lines file per view, replacing the free-text log_deidentified.log / log_identified.log.
+AUDIT_LOG_FILES = {
+    "deidentified": "audit_deidentified.jsonl",
+    "identified": "audit_identified.jsonl",
+}
+
+_STOP = object()
+
+class AuditLog:
+    """
+    JSON-lines log written by a background thread, so callers never wait on disk I/O.
+    Records go through a bounded queue and are written in batches; the file is rotated when it exceeds
+    max_bytes or is older than max_age seconds, and rotated files are gzip-compressed (keeping `backups`).
+    If the queue is full the record is dropped and counted rather than blocking the caller.
+    """
+
+    def __init__(self, path, max_bytes=10 * 1024 * 1024, max_age=24 * 3600, backups=20,
+                 queue_size=10000, batch_size=256, flush_interval=0.5):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.backups = backups
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.lock = threading.Lock()
+        self.stats = {"written": 0, "dropped": 0, "batches": 0, "rotations": 0, "errors": 0}
+        self.file = None
+        self.opened_at = 0.0
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, name=f"audit-log-{os.path.basename(path)}", daemon=True)
+        self.thread.start()
+
+    def write(self, record):
+        """Queues one record (a JSON-serializable dict); a "timestamp" field is added if missing."""
+        if self.closed:
+            return False
+        if "timestamp" not in record:
+            record = {"timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), **record}
+        try:
+            self.queue.put_nowait(record)
+            return True
+        except queue.Full:
+            with self.lock:
+                self.stats["dropped"] += 1
+            logging.error(f"Audit log queue full, dropped a record for {self.path}")
+            return False
+
+    def flush(self, timeout=5.0):
+        """Waits until every record queued so far is written and flushed to the OS."""
+        done = threading.Event()
+        try:
+            self.queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def close(self, timeout=5.0):
+        """Writes out the queue, fsyncs and stops the writer thread. Called for every log at interpreter exit."""
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            logging.error(f"Audit log queue still full at shutdown for {self.path}")
+        self.thread.join(timeout)
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size and batch[-1] is not _STOP and not isinstance(batch[-1], threading.Event):
+                try:
+                    batch.append(self.queue.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+            records = [item for item in batch if isinstance(item, dict)]
+            if records:
+                self._write_batch(records)
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    item.set()
+            if batch[-1] is _STOP:
+                self._close_file(sync=True)
+                return
+
+    def _write_batch(self, records):
+        lines = []
+        for record in records:
+            try:
+                lines.append(json.dumps(record, ensure_ascii=False, default=str))
+            except (TypeError, ValueError) as e:
+                logging.error(f"Audit record not serializable: {e}")
+                with self.lock:
+                    self.stats["errors"] += 1
+        try:
+            if self.file is None:
+                self._open_file()
+            self.file.write("\n".join(lines) + "\n")
+            self.file.flush()
+            with self.lock:
+                self.stats["written"] += len(lines)
+                self.stats["batches"] += 1
+            if self.file.tell() >= self.max_bytes or time.time() - self.opened_at >= self.max_age:
+                self._rotate()
+        except OSError as e:
+            logging.error(f"Could not write audit log {self.path}: {e}")
+            with self.lock:
+                self.stats["errors"] += 1
+            self._close_file()
+
+    def _open_file(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.file = open(self.path, "a", encoding="utf-8")
+        # A file carried over from a previous run keeps its age, so time-based rotation still applies.
+        self.opened_at = os.path.getmtime(self.path) if self.file.tell() else time.time()
+
+    def _close_file(self, sync=False):
+        if self.file is None:
+            return
+        try:
+            self.file.flush()
+            if sync:
+                os.fsync(self.file.fileno())
+            self.file.close()
+        except OSError as e:
+            logging.error(f"Could not close audit log {self.path}: {e}")
+        self.file = None
+
+    def _rotate(self):
+        self._close_file(sync=True)
+        rotated = f"{self.path}.{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}"
+        os.replace(self.path, rotated)
+        with open(rotated, "rb") as source, gzip.open(rotated + ".gz", "wb") as target:
+            shutil.copyfileobj(source, target)
+        os.remove(rotated)
+        for old in sorted(glob.glob(glob.escape(self.path) + ".*.gz"))[:-self.backups or None]:
+            os.remove(old)
+        with self.lock:
+            self.stats["rotations"] += 1
+
+    def summary(self):
+        with self.lock:
+            stats = dict(self.stats)
+        stats["queued"] = self.queue.qsize()
+        return stats
+
+_audit_logs = {}
+_audit_logs_lock = threading.Lock()
+
+def get_audit_log(name):
+    """Process-wide audit log for a view ("deidentified" or "identified"), shared by all Streamlit sessions."""
+    with _audit_logs_lock:
+        log = _audit_logs.get(name)
+        if log is None:
+            log = AuditLog(os.path.join(AUDIT_LOG_DIR, AUDIT_LOG_FILES[name]))
+            _audit_logs[name] = log
+        return log
+
+@atexit.register
+def close_audit_logs():
+    """Flushes and closes every open audit log (registered to run at interpreter exit)."""
+    with _audit_logs_lock:
+        logs = list(_audit_logs.values())
+    for log in logs:
+        log.close()
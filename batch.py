@@ -0,0 +1,168 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from dotenv import load_dotenv
+from ingest import is_bundle, list_bundle, split_ref
+from instrumentation import percentile
+from pipeline import run_async, run_pipeline_async
+from record_store import get_record_store, is_record_store_ref, split_store_ref
+from scheduler import priority
+from summary_generator import configure_clients
+
+# Records in these states are not re-run when a batch is resumed; "error" records are retried.
+FINISHED_STATUSES = {"done", "blocked", "flagged"}
+
+def list_records(source):
+    """
+    Returns patient record paths from a directory of .json files, an NDJSON bundle (one patient per line),
+    a record store (record_store.py) or a manifest (one path per line). Bundles, given directly or found in a
+    directory or manifest, expand to one "bundle.ndjson#N" reference per record; a store to one reference per patient.
+    """
+    if is_bundle(source):
+        return list_bundle(source)
+    if source.endswith(".sqlite"):
+        return get_record_store(source).refs()
+    if os.path.isdir(source):
+        paths = sorted(
+            os.path.join(source, f) for f in os.listdir(source) if f.endswith(".json") or is_bundle(f)
+        )
+    else:
+        base_dir = os.path.dirname(os.path.abspath(source))
+        paths = []
+        with open(source, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                paths.append(line if os.path.isabs(line) else os.path.join(base_dir, line))
+    records = []
+    for path in paths:
+        records.extend(list_bundle(path) if is_bundle(path) else [path])
+    return records
+
+def output_path(out_dir, record_path):
+    """Stable per-record output file, unique even when two manifest entries share a filename."""
+    bundle_path, line_number = split_ref(record_path)
+    stem = os.path.splitext(os.path.basename(bundle_path))[0]
+    if line_number is not None:
+        stem += f"-{line_number}"
+    if is_record_store_ref(record_path):
+        stem = "".join(c if c.isalnum() or c in "-_" else "_" for c in split_store_ref(record_path)[1])
+    digest = hashlib.sha1(os.path.abspath(record_path).encode("utf-8")).hexdigest()[:10]
+    return os.path.join(out_dir, f"{stem}-{digest}.json")
+
+def write_result(path, result):
+    # Write-then-rename so a crash never leaves a half-written result that looks finished.
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    os.replace(tmp_path, path)
+
+def is_finished(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f).get("status") in FINISHED_STATUSES
+    except (OSError, ValueError):
+        return False
+
+async def process_record(record_path, out_dir, api_key, model, additional_prompt, allow_override, incremental=True):
+    start = time.perf_counter()
+    try:
+        result = await run_pipeline_async(record_path, api_key, model, additional_prompt, allow_override, incremental=incremental)
+    except Exception as e:
+        # A malformed record or a failed call marks that record "error" (retried on resume), never ends the batch.
+        logging.error(f"Batch record failed: {record_path}: {type(e).__name__}: {e}")
+        result = {"file": record_path, "model": model, "status": "error", "error": str(e)}
+    result["latency"] = round(time.perf_counter() - start, 4)
+    result["completed_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    write_result(output_path(out_dir, record_path), result)
+    return result
+
+async def _run_records(pending, out_dir, api_key, model, workers, additional_prompt, allow_override, incremental):
+    # One event loop for the whole batch, so every record shares the same pooled API client.
+    semaphore = asyncio.Semaphore(workers)
+
+    async def bounded(record_path):
+        async with semaphore:
+            return await process_record(record_path, out_dir, api_key, model, additional_prompt, allow_override, incremental)
+
+    results = []
+    for done, next_result in enumerate(asyncio.as_completed([bounded(r) for r in pending]), 1):
+        result = await next_result
+        results.append(result)
+        print(f"[{done}/{len(pending)}] {result['status']:8} {result['latency']:.2f}s {result['file']}")
+    return results
+
+def run_batch(source, out_dir, api_key, model="gpt-4", workers=4, additional_prompt="", allow_override=False, incremental=True):
+    """Runs the pipeline over every record in source, skipping records already finished in out_dir."""
+    os.makedirs(out_dir, exist_ok=True)
+    records = list_records(source)
+    pending = [r for r in records if not is_finished(output_path(out_dir, r))]
+    skipped = len(records) - len(pending)
+
+    start = time.perf_counter()
+    # Batch calls queue behind interactive ones when both share the process's rate-limit budgets.
+    with priority("batch"):
+        results = run_async(_run_records(pending, out_dir, api_key, model, workers, additional_prompt, allow_override, incremental))
+
+    statuses = {}
+    summary_modes = {}
+    for result in results:
+        statuses[result["status"]] = statuses.get(result["status"], 0) + 1
+        if "summary_mode" in result:
+            summary_modes[result["summary_mode"]] = summary_modes.get(result["summary_mode"], 0) + 1
+    latencies = [result["latency"] for result in results]
+
+    elapsed = time.perf_counter() - start
+    report = {
+        "source": source,
+        "model": model,
+        "workers": workers,
+        "total_records": len(records),
+        "skipped_finished": skipped,
+        "processed": len(pending),
+        "statuses": statuses,
+        "summary_modes": summary_modes,
+        "elapsed_seconds": round(elapsed, 3),
+        "records_per_second": round(len(pending) / elapsed, 3) if elapsed > 0 else 0.0,
+        "latency_p50": percentile(latencies, 50),
+        "latency_p95": percentile(latencies, 95),
+        "latency_max": max(latencies) if latencies else 0.0,
+        "finished_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    write_result(os.path.join(out_dir, "_report.json"), report)
+    return report
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Generate discharge summaries for a directory or manifest of patient records.")
+    parser.add_argument("source", help="Directory of patient .json files, a record store (.sqlite), or a manifest file listing one path per line")
+    parser.add_argument("--out", default="outputs", help="Directory for per-record results (default: outputs)")
+    parser.add_argument("--model", default="gpt-4", choices=["gpt-4", "gpt-3.5-turbo"])
+    parser.add_argument("--workers", type=int, default=4, help="Maximum records processed concurrently")
+    parser.add_argument("--instruction", default="", help="Extra instruction appended to the default prompt")
+    parser.add_argument("--allow-override", action="store_true", help="Generate even when the pre-generation safety verdict is No/Uncertain")
+    parser.add_argument("--full", action="store_true", help="Regenerate everything instead of reusing results stored for unchanged records")
+    parser.add_argument("--api-key", default=None, help="OpenAI API key (default: OPENAI_API_KEY)")
+    parser.add_argument("--base-url", default=None, help="OpenAI-compatible endpoint, e.g. a local stand-in server (default: OPENAI_BASE_URL)")
+    args = parser.parse_args()
+
+    api_key = args.api_key or os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        parser.error("an OpenAI API key is required (--api-key or OPENAI_API_KEY)")
+
+    client_settings = {"max_connections": max(args.workers * 2, 10)}
+    if args.base_url:
+        client_settings["base_url"] = args.base_url
+    configure_clients(**client_settings)
+
+    report = run_batch(args.source, args.out, api_key, args.model, max(1, args.workers), args.instruction, args.allow_override, not args.full)
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
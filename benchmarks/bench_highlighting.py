@@ -0,0 +1,75 @@
+"""
+Benchmark: single-pass highlight rendering (highlighting.py) versus the previous per-highlight re.sub loop
+in app.render_summary, on long summaries with hundreds of (partly overlapping) highlight phrases.
+
+    python benchmarks/bench_highlighting.py [--copies 20] [--highlights 300] [--repeat 5]
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from highlighting import SECTION_HEADERS, HighlightRenderer, compile_matcher, highlight_phrases, render_highlights
+from mock_server import CANNED_SUMMARY
+
+def legacy_render(summary_text, highlights):
+    """The previous render_summary loop: one re.sub per section header, then one per highlight item."""
+    display_text = summary_text
+    for section in SECTION_HEADERS:
+        display_text = re.sub(rf"(^|\n)({re.escape(section)})", r"\1**\2**", display_text)
+    for item in highlights:
+        phrase = re.escape(item["text"])
+        pattern = rf"(?<!\w)({phrase})(?!\w)"
+        display_text = re.sub(pattern, r"**\1**", display_text, flags=re.IGNORECASE)
+    return display_text
+
+def long_summary(copies):
+    # The mock summary with its bold headers removed (as a plain-text summary would be), repeated with numbered days.
+    plain = CANNED_SUMMARY.replace("**", "")
+    return "\n\n".join(plain.replace("48 hours", f"{48 + i} hours") for i in range(copies))
+
+def synthetic_highlights(text, count, seed=7):
+    """Phrases of 1-5 words taken from the text, so many overlap or contain one another."""
+    rng = random.Random(seed)
+    words = re.findall(r"[\w-]+", text)
+    highlights = []
+    while len(highlights) < count:
+        start = rng.randrange(len(words) - 5)
+        highlights.append({"text": " ".join(words[start:start + rng.randint(1, 5)]), "category": "clinical_trend"})
+    return highlights
+
+def broken_markup(markdown):
+    """Number of places where ** markers were nested or doubled (e.g. "****" or an odd count on a line)."""
+    return markdown.count("****") + sum(line.count("**") % 2 for line in markdown.split("\n"))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--copies", type=int, default=20, help="Copies of the mock summary joined into one long summary")
+    parser.add_argument("--highlights", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    text = long_summary(args.copies)
+    highlights = synthetic_highlights(text, args.highlights)
+    print(f"Summary: {len(text):,} characters, {len(highlights)} highlights ({len(highlight_phrases(highlights))} distinct)")
+
+    legacy = min(timeit.repeat(lambda: legacy_render(text, highlights), number=1, repeat=args.repeat))
+    compile_time = min(timeit.repeat(lambda: compile_matcher(highlight_phrases(highlights)), number=1, repeat=args.repeat))
+    matcher = compile_matcher(highlight_phrases(highlights))
+    single_pass = min(timeit.repeat(lambda: render_highlights(text, matcher), number=1, repeat=args.repeat))
+    renderer = HighlightRenderer()
+    renderer.render(text, highlights)
+    cached = min(timeit.repeat(lambda: renderer.render(text, highlights), number=1, repeat=args.repeat))
+
+    print(f"{'legacy re.sub loop':24} {legacy * 1000:9.2f} ms  broken markup: {broken_markup(legacy_render(text, highlights))}")
+    print(f"{'compile matcher':24} {compile_time * 1000:9.2f} ms")
+    print(f"{'single pass':24} {single_pass * 1000:9.2f} ms  broken markup: {broken_markup(render_highlights(text, matcher))}")
+    print(f"{'cached (rerun)':24} {cached * 1000:9.2f} ms")
+    print(f"Speed-up (compile + render): {legacy / (compile_time + single_pass):.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Benchmark: peak RSS and load time of ingest.load_record / iter_records versus json.load, on a synthetic
+record with dense flowsheets and labs, and on an NDJSON bundle of many such patients. Each case runs in a
+fresh subprocess so its peak RSS is measured on its own.
+
+    python benchmarks/bench_ingest.py [--flowsheet-rows 200000] [--patients 50] [--keep]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ingest import iter_records, load_record
+from utils import is_safe_for_discharge
+from bench_redaction import synthetic_record
+
+# The sections the request's "prompt only" case needs: diagnoses, medication orders and notes.
+PROMPT_SECTIONS = ("patient_id", "patient_demographics", "diagnoses", "med_orders", "notes", "ward_round_notes")
+SCREEN_SECTIONS = ("patient_id", "notes", "ward_round_notes")
+
+def _legacy_bundle(path):
+    # The straightforward approach: parse every line up front, then process the list.
+    with open(path, "r", encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    return sum(is_safe_for_discharge(r) for r in records)
+
+CASES = {
+    "record: json.load": lambda path: json.load(open(path, "r")),
+    "record: all sections": lambda path: load_record(path, None),
+    "record: prompt sections": lambda path: load_record(path, PROMPT_SECTIONS),
+    "record: screen sections": lambda path: load_record(path, SCREEN_SECTIONS),
+    "bundle: parse all lines": _legacy_bundle,
+    "bundle: iter_records": lambda path: sum(is_safe_for_discharge(r) for r in iter_records(path)),
+    "bundle: iter_records screen": lambda path: sum(is_safe_for_discharge(r) for r in iter_records(path, SCREEN_SECTIONS)),
+}
+
+def _proc_status_kib(field):
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+def peak_rss_kib():
+    # VmHWM is per process image; ru_maxrss on Linux also carries over the parent's peak across fork/exec.
+    peak = _proc_status_kib("VmHWM")
+    return peak if peak is not None else resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def current_rss_kib():
+    current = _proc_status_kib("VmRSS")
+    return current if current is not None else peak_rss_kib()
+
+def measure(case, path):
+    """Runs in the child process: prints how far peak RSS rose above the RSS before the case, and its time."""
+    baseline = current_rss_kib()
+    start = time.perf_counter()
+    result = CASES[case](path)
+    seconds = time.perf_counter() - start
+    print(json.dumps({"rss_kib": peak_rss_kib() - baseline, "seconds": seconds}))
+    del result
+
+def run_case(case, path):
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--measure", case, path],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--flowsheet-rows", type=int, default=200000)
+    parser.add_argument("--bundle-rows", type=int, default=5000, help="flowsheet rows per bundled patient")
+    parser.add_argument("--patients", type=int, default=50)
+    parser.add_argument("--keep", action="store_true", help="keep the generated files")
+    parser.add_argument("--measure", nargs=2, metavar=("CASE", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(*args.measure)
+        return
+
+    work_dir = tempfile.mkdtemp(prefix="bench_ingest_")
+    record_path = os.path.join(work_dir, "record.json")
+    bundle_path = os.path.join(work_dir, "bundle.ndjson")
+    record = synthetic_record(args.flowsheet_rows, 500)
+    with open(record_path, "w", encoding="utf-8") as f:
+        json.dump(record, f, indent=2)
+    del record
+    with open(bundle_path, "w", encoding="utf-8") as f:
+        for i in range(args.patients):
+            patient = synthetic_record(args.bundle_rows, 50)
+            patient["patient_id"] = str(100000 + i)
+            f.write(json.dumps(patient) + "\n")
+
+    print(f"Record: {os.path.getsize(record_path) / 2**20:.1f} MiB ({args.flowsheet_rows:,} flowsheet rows); "
+          f"bundle: {os.path.getsize(bundle_path) / 2**20:.1f} MiB ({args.patients} patients)")
+    print(f"{'case':<30}{'peak RSS MiB':>14}{'seconds':>10}")
+    for case in CASES:
+        path = bundle_path if case.startswith("bundle") else record_path
+        result = run_case(case, path)
+        print(f"{case:<30}{result['rss_kib'] / 1024:>14.1f}{result['seconds']:>10.3f}")
+
+    if not args.keep:
+        os.remove(record_path)
+        os.remove(bundle_path)
+        os.rmdir(work_dir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Benchmark: end-to-end pipeline throughput, latency and memory against the local mock OpenAI server
+(mock_server.py), so no API key or network access is needed. Runs batch.run_batch over copies of the
+data/ records and over synthetic scaled-up records, with and without injected 429/500 errors. Each case
+runs in a fresh subprocess with its own empty caches.
+
+    python benchmarks/bench_pipeline.py [--repeat 5] [--synthetic 20] [--flowsheet-rows 20000] [--workers 8] [--latency-ms 300]
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from mock_server import MockServer
+from bench_ingest import current_rss_kib, peak_rss_kib
+from bench_redaction import synthetic_record
+
+def cases(data_dir, synthetic_dir):
+    """(name, records directory, mock server settings) for each benchmark case."""
+    return [
+        ("data/ records", data_dir, {}),
+        ("data/ records, 5% 429 + 5% 500", data_dir, {"error_429_rate": 0.05, "error_500_rate": 0.05}),
+        ("synthetic records", synthetic_dir, {}),
+    ]
+
+def measure(records_dir, base_url, workers, model):
+    """Runs in the child process: one batch over records_dir, printing the batch report plus memory as JSON."""
+    work_dir = tempfile.mkdtemp(prefix="bench_pipeline_run_")
+    os.environ["LLM_CACHE_PATH"] = os.path.join(work_dir, "llm_cache.sqlite")
+    os.environ["INCREMENTAL_STORE_PATH"] = os.path.join(work_dir, "incremental.sqlite")
+    os.environ["METRICS_LOG_PATH"] = os.path.join(work_dir, "metrics.jsonl")
+    os.makedirs(os.path.join(work_dir, "logs"))
+    os.chdir(work_dir)  # summary_generator logs to logs/ under the working directory
+
+    from batch import run_batch
+    from scheduler import get_scheduler
+    from summary_generator import configure_clients
+
+    configure_clients(base_url=base_url, max_connections=max(workers * 2, 10))
+    get_scheduler().configure({})  # the mock server has no quotas; measure the pipeline, not our own limits
+    baseline = current_rss_kib()
+    report = run_batch(records_dir, os.path.join(work_dir, "outputs"), "mock-key", model, workers, incremental=False)
+    report["rss_kib"] = peak_rss_kib() - baseline
+    print(json.dumps(report))
+    os.chdir(ROOT)
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+def run_case(records_dir, base_url, workers, model):
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--measure", records_dir, base_url, "--workers", str(workers), "--model", model],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def prepare_records(work_dir, repeat, synthetic, flowsheet_rows):
+    """Copies of the data/ records (repeat times each) and synthetic records, in two directories."""
+    data_dir = os.path.join(work_dir, "data")
+    synthetic_dir = os.path.join(work_dir, "synthetic")
+    os.makedirs(data_dir)
+    os.makedirs(synthetic_dir)
+    source_dir = os.path.join(ROOT, "data")
+    for name in sorted(f for f in os.listdir(source_dir) if f.endswith(".json")):
+        for i in range(repeat):
+            shutil.copy(os.path.join(source_dir, name), os.path.join(data_dir, f"{os.path.splitext(name)[0]}_{i}.json"))
+    for i in range(synthetic):
+        record = synthetic_record(flowsheet_rows, 50)
+        record["patient_id"] = str(200000 + i)
+        with open(os.path.join(synthetic_dir, f"synthetic_{i}.json"), "w", encoding="utf-8") as f:
+            json.dump(record, f)
+    return data_dir, synthetic_dir
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5, help="copies of each data/ record")
+    parser.add_argument("--synthetic", type=int, default=20, help="number of synthetic records")
+    parser.add_argument("--flowsheet-rows", type=int, default=20000, help="flowsheet rows per synthetic record")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--model", default="gpt-4")
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="median mock time to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=60.0, help="mock completion speed")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--measure", nargs=2, metavar=("RECORDS_DIR", "BASE_URL"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(*args.measure, args.workers, args.model)
+        return
+
+    work_dir = tempfile.mkdtemp(prefix="bench_pipeline_")
+    data_dir, synthetic_dir = prepare_records(work_dir, args.repeat, args.synthetic, args.flowsheet_rows)
+    server = MockServer(latency_ms=args.latency_ms, tokens_per_second=args.tokens_per_second, seed=args.seed).start()
+    print(f"Mock server {server.url}: median latency {args.latency_ms:.0f} ms, {args.tokens_per_second:.0f} tokens/s; "
+          f"{args.workers} workers; synthetic records have {args.flowsheet_rows:,} flowsheet rows")
+    print(f"{'case':<34}{'records':>8}{'rec/s':>8}{'p50 s':>8}{'p95 s':>8}{'peak RSS MiB':>14}  statuses")
+    try:
+        for name, records_dir, settings in cases(data_dir, synthetic_dir):
+            server.configure(**{"error_429_rate": 0.0, "error_500_rate": 0.0, "timeout_rate": 0.0, "seed": args.seed, **settings})
+            report = run_case(records_dir, server.url, args.workers, args.model)
+            print(f"{name:<34}{report['processed']:>8}{report['records_per_second']:>8.2f}{report['latency_p50']:>8.2f}"
+                  f"{report['latency_p95']:>8.2f}{report['rss_kib'] / 1024:>14.1f}  {report['statuses']}")
+        print(f"Mock server requests: {server.summary()}")
+    finally:
+        server.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
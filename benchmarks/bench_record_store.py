@@ -0,0 +1,90 @@
+"""
+Benchmark: record_store.RecordStore against scanning a directory of JSON files, on synthetic patients with
+varied ids, dates and diagnosis codes. Times the ingest, a lookup by patient_id, a page of records with one
+diagnosis code, a date-ordered page starting in November, and loading only the notes of one record.
+
+    python benchmarks/bench_record_store.py [--patients 2000] [--flowsheet-rows 200] [--lookups 200]
+"""
+import argparse
+import copy
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from record_store import RecordStore
+from bench_redaction import synthetic_record
+
+CODES = ["J18.1", "I21.0", "I61.9", "N39.0", "K35.8", "E11.9", "I50.9", "J44.1"]
+
+def write_patients(directory, count, flowsheet_rows):
+    base = synthetic_record(flowsheet_rows, notes=20)
+    for i in range(count):
+        record = copy.deepcopy(base)
+        record["patient_id"] = f"P{i:06d}"
+        record["patient_demographics"].update(admission_date=f"2024-{1 + i % 12:02d}-{1 + i % 28:02d}", discharge_date=f"2024-{1 + i % 12:02d}-{1 + (i + 4) % 28:02d}")
+        record["diagnoses"][0]["diagnosis_code"] = CODES[i % len(CODES)]
+        with open(os.path.join(directory, f"patient_{i:06d}.json"), "w", encoding="utf-8") as f:
+            json.dump(record, f)
+
+def scan(directory, match):
+    # The current approach: open and parse every file to find the ones that match.
+    found = []
+    for name in sorted(os.listdir(directory)):
+        with open(os.path.join(directory, name), "r", encoding="utf-8") as f:
+            record = json.load(f)
+        if match(record):
+            found.append(record)
+    return found
+
+def timed(func, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return (time.perf_counter() - start) / repeat, result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--patients", type=int, default=2000)
+    parser.add_argument("--flowsheet-rows", type=int, default=200)
+    parser.add_argument("--lookups", type=int, default=200, help="Store lookups averaged per timing")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="bench_record_store_")
+    data_dir = os.path.join(work_dir, "data")
+    os.makedirs(data_dir)
+    write_patients(data_dir, args.patients, args.flowsheet_rows)
+    json_bytes = sum(os.path.getsize(os.path.join(data_dir, name)) for name in os.listdir(data_dir))
+
+    store = RecordStore(os.path.join(work_dir, "records.sqlite"))
+    ingest_seconds, report = timed(lambda: store.ingest(data_dir))
+    reingest_seconds, _ = timed(lambda: store.ingest(data_dir))
+    ids = [f"P{i:06d}" for i in random.Random(0).sample(range(args.patients), min(args.lookups, args.patients))]
+    target = ids[0]
+
+    rows = [
+        ("lookup by patient_id", timed(lambda: scan(data_dir, lambda r: r["patient_id"] == target))[0],
+         timed(lambda: [store.get(i) for i in ids])[0] / len(ids)),
+        ("50 records with code I21.0", timed(lambda: scan(data_dir, lambda r: r["diagnoses"][0]["diagnosis_code"] == "I21.0")[:50])[0],
+         timed(lambda: store.page(diagnosis_code="I21.0", limit=50), args.lookups)[0]),
+        ("page from Nov by admission", None,
+         timed(lambda: store.page("admission_date", ["2024-11-01", "P000000"], 50), args.lookups)[0]),
+        ("notes of one record", None,
+         timed(lambda: [store.get(i, ["notes"]) for i in ids])[0] / len(ids)),
+    ]
+
+    print(f"{args.patients} patients, {json_bytes / 1e6:.1f} MB of JSON -> {store.summary()['stored_bytes'] / 1e6:.1f} MB of section blobs")
+    print(f"ingest {ingest_seconds:.2f}s ({report['records']} records), re-ingest of unchanged files {reingest_seconds:.3f}s")
+    print(f"{'':28} {'scan ms':>10} {'store ms':>10}")
+    for name, scan_seconds, store_seconds in rows:
+        scan_text = f"{scan_seconds * 1000:10.1f}" if scan_seconds is not None else f"{'-':>10}"
+        print(f"{name:28} {scan_text} {store_seconds * 1000:10.3f}")
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Benchmark: copy-on-write redaction (utils.redact_pii) versus the previous copy.deepcopy approach
+on synthetic records with large flowsheet/lab sections.
+
+    python benchmarks/bench_redaction.py [--flowsheet-rows 20000] [--notes 500] [--repeat 5]
+"""
+import argparse
+import copy
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import redact_pii
+
+def legacy_redact_pii(data):
+    """The deepcopy-based redaction, applying the same fields as redaction.PII_FIELD_PATHS."""
+    redacted = copy.deepcopy(data)
+    demographics = redacted.get("patient_demographics", {})
+    for field, placeholder in [("name", "REDACTED_NAME"), ("gender", "REDACTED_GENDER"), ("age", "REDACTED_AGE")]:
+        if field in demographics:
+            demographics[field] = placeholder
+    for note in redacted.get("notes", []) + redacted.get("ward_round_notes", []):
+        if "author" in note:
+            note["author"] = "REDACTED_DOCTOR"
+    return redacted
+
+def synthetic_record(flowsheet_rows, notes):
+    return {
+        "patient_id": "123456",
+        "patient_demographics": {"name": "John Doe", "age": 70, "gender": "Male"},
+        "diagnoses": [{"date": "2024-02-10", "diagnosis_code": "J18.1", "description": "Lobar pneumonia, unspecified organism"}],
+        "flowsheets": [
+            {
+                "date": f"2024-02-{10 + i // 1440 % 18:02d}",
+                "time": f"{i // 60 % 24:02d}:{i % 60:02d}",
+                "temperature": f"{36.5 + (i % 20) / 10:.1f}°C",
+                "heart_rate": f"{70 + i % 30} bpm",
+                "blood_pressure": f"{110 + i % 30}/{70 + i % 15} mmHg",
+                "respiratory_rate": f"{14 + i % 8} breaths/min",
+                "oxygen_saturation": f"{92 + i % 7}%",
+            }
+            for i in range(flowsheet_rows)
+        ],
+        "labs": [
+            {"date": f"2024-02-{10 + i % 18:02d}", "tests": [
+                {"name": "CRP", "result": f"{60 - i % 50} mg/L"},
+                {"name": "WBC", "result": f"{12 - i % 5} x10^9/L"},
+            ]}
+            for i in range(flowsheet_rows // 10)
+        ],
+        "notes": [
+            {"date": f"2024-02-{10 + i % 18:02d}", "author": "Dr. Smith", "note_type": "Ward Round Note",
+             "content": f"Ward round {i}: patient stable, observations within range, continue current plan."}
+            for i in range(notes)
+        ],
+    }
+
+def peak_kib(func):
+    tracemalloc.start()
+    result = func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del result
+    return peak / 1024
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--flowsheet-rows", type=int, default=20000)
+    parser.add_argument("--notes", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    record = synthetic_record(args.flowsheet_rows, args.notes)
+    assert redact_pii(record) == legacy_redact_pii(record)
+
+    print(f"Record: {args.flowsheet_rows:,} flowsheet rows, {len(record['labs']):,} lab panels, {args.notes:,} notes")
+    print(f"{'approach':<16}{'best ms':>10}{'peak KiB':>12}")
+    for name, func in [("deepcopy", lambda: legacy_redact_pii(record)), ("copy-on-write", lambda: redact_pii(record))]:
+        best_ms = min(timeit.repeat(func, number=1, repeat=args.repeat)) * 1000
+        print(f"{name:<16}{best_ms:>10.2f}{peak_kib(func):>12.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Benchmark: the combined highlights + safety review call (summary_generator.review_summary_async) versus the
+separate extract_highlights_async and validate_discharge_safety_async calls, sent concurrently as before.
+Prompt tokens are counted offline; completion tokens and latency come from the local mock server.
+
+    python benchmarks/bench_review.py [--rounds 10] [--summary-length 3] [--latency-ms 800] [--tokens-per-second 40]
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from mock_server import CANNED_SUMMARY, MockServer
+
+def summaries(rounds, length):
+    # Distinct texts, so no call is answered from the cache or coalesced with another. The mock summary is short
+    # (about 250 tokens); length=3 repeats its body for a summary about the size gpt-4 writes for our records.
+    header, body = CANNED_SUMMARY.split("\n\n", 1)
+    return [header + "\n\n" + "\n\n".join([body.replace("48 hours", f"{48 + i} hours")] * length) for i in range(rounds)]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--summary-length", type=int, default=3, help="Copies of the mock summary body per summary")
+    parser.add_argument("--latency-ms", type=float, default=800.0)
+    parser.add_argument("--tokens-per-second", type=float, default=40.0)
+    parser.add_argument("--model", default="gpt-4")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="bench_review_")
+    os.makedirs(os.path.join(work_dir, "logs"))
+    os.chdir(work_dir)  # summary_generator logs to logs/ under the working directory
+
+    from instrumentation import percentile
+    from prompt_builder import count_tokens
+    from scheduler import get_scheduler
+    from summary_generator import (
+        REVIEW_TOOL,
+        build_highlights_prompt,
+        build_review_prompt,
+        build_safety_prompt,
+        configure_clients,
+        extract_highlights_async,
+        review_summary_async,
+        validate_discharge_safety_async,
+    )
+    from pipeline import run_async
+
+    async def separate(text):
+        await asyncio.gather(
+            extract_highlights_async(text, "mock-key", args.model, use_cache=False),
+            validate_discharge_safety_async(text, "mock-key", args.model, use_cache=False),
+        )
+
+    async def combined(text):
+        await review_summary_async(text, "mock-key", args.model, use_cache=False)
+
+    def prompt_tokens(name, text):
+        if name == "separate":
+            return count_tokens(build_highlights_prompt(text), args.model) + count_tokens(build_safety_prompt(text), args.model)
+        return count_tokens(build_review_prompt(text) + json.dumps(REVIEW_TOOL), args.model)
+
+    rows = {}
+    with MockServer(latency_ms=args.latency_ms, distribution="fixed", tokens_per_second=args.tokens_per_second) as server:
+        configure_clients(base_url=server.url)
+        get_scheduler().configure({})  # the mock server has no quotas
+        for name, run in [("separate", separate), ("combined", combined)]:
+            texts = summaries(args.rounds, args.summary_length)
+            before = server.summary()
+            latencies = []
+            for text in texts:
+                start = time.perf_counter()
+                run_async(run(text))
+                latencies.append(time.perf_counter() - start)
+            after = server.summary()
+            rows[name] = {
+                "requests": (after["requests"] - before["requests"]) / args.rounds,
+                "prompt_tokens": sum(prompt_tokens(name, text) for text in texts) / args.rounds,
+                "completion_tokens": (after["completion_tokens"] - before["completion_tokens"]) / args.rounds,
+                "p50": percentile(latencies, 50),
+                "p95": percentile(latencies, 95),
+            }
+
+    print(f"{'':10} {'requests':>9} {'prompt tok':>11} {'completion tok':>15} {'p50 s':>7} {'p95 s':>7}")
+    for name, row in rows.items():
+        print(f"{name:10} {row['requests']:9.1f} {row['prompt_tokens']:11.0f} {row['completion_tokens']:15.0f} {row['p50']:7.2f} {row['p95']:7.2f}")
+    saved = 1 - rows["combined"]["prompt_tokens"] / rows["separate"]["prompt_tokens"]
+    print(f"Prompt tokens saved per summary: {saved:.0%}")
+    os.chdir(ROOT)
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
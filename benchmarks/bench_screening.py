@@ -0,0 +1,125 @@
+"""
+Benchmark: compiled-regex discharge screen (screening.ScreeningEngine) versus the previous full sort
+and per-phrase substring loop, on synthetic records with many notes and a long phrase list.
+
+    python benchmarks/bench_screening.py [--notes 2000] [--phrases 200] [--repeat 5]
+"""
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from screening import ScreeningEngine, get_screening_engine
+
+# (note, expected is_safe) for the configured negation cues; the screen must never clear these by accident.
+NEGATION_CASES = [
+    ("Fever not resolved, condition remains critical.", False),
+    ("Patient is not eating and requires close monitoring.", False),
+    ("Denies chest pain but condition remains critical", False),
+    ("Never required oxygen; condition remains critical.", False),
+    ("Patient no longer stable, requires close monitoring.", False),
+    ("Unfit for discharged home today.", False),
+    ("Not medically stable-ish overnight.", False),
+    ("Patient no longer requires close monitoring.", True),
+    ("no longer requires close monitoring", True),
+    ("Sepsis ruled out. Patient no longer requires close monitoring, plan discharge.", True),
+]
+
+# (notes of one day, expected is_safe with recent_limit=1): the latest note decides, with "Evening" after "Morning".
+NOTE_ORDER_CASES = [
+    ([("Morning", "Condition remains critical."), ("Evening", "Stable, plan discharge.")], True),
+    ([("Evening", "Condition remains critical."), ("Morning", "Stable, plan discharge.")], False),
+    ([("Night", "Requires close monitoring."), ("14:30", "Stable, plan discharge.")], False),
+    ([("Afternoon", "Stable, plan discharge."), ("9:15", "Not safe for discharge.")], True),
+]
+
+def check_negation(engine):
+    for text, expected in NEGATION_CASES:
+        result = engine.is_safe({"notes": [{"date": "2024-01-01", "content": text}]})
+        assert result == expected, f"is_safe({text!r}) returned {result}, expected {expected}"
+
+def check_note_order(engine):
+    for notes, expected in NOTE_ORDER_CASES:
+        data = {"notes": [{"date": "2024-01-01", "time": time, "content": text} for time, text in notes]}
+        result = engine.is_safe(data, recent_limit=1)
+        assert result == expected, f"is_safe({notes!r}, recent_limit=1) returned {result}, expected {expected}"
+
+def legacy_is_safe(data, phrases, recent_limit=2):
+    all_notes = data.get("notes", []) + data.get("ward_round_notes", [])
+    recent_notes = sorted(all_notes, key=lambda x: x.get("date", "") + x.get("time", ""), reverse=True)[:recent_limit]
+    for note in recent_notes:
+        content = note.get("content") or note.get("note", "")
+        for phrase in phrases:
+            if phrase in content.lower():
+                return False
+    return True
+
+def synthetic_phrases(count, seed=0):
+    rng = random.Random(seed)
+    words = ["acute", "unstable", "deteriorating", "escalation", "requires", "pending", "review", "oxygen",
+             "sepsis", "critical", "monitoring", "transfer", "icu", "worsening", "failure", "support"]
+    phrases = list(get_screening_engine().warning_phrases)
+    while len(phrases) < count:
+        phrase = " ".join(rng.sample(words, 3))
+        if phrase not in phrases:
+            phrases.append(phrase)
+    return phrases
+
+def synthetic_record(notes, phrases, seed=0, flagged_rate=0.3):
+    """Notes with HH:MM times, so the legacy string sort and the parsed datetime order agree."""
+    rng = random.Random(seed)
+    filler = "Patient reviewed on ward round, observations stable, tolerating diet, plan discussed with family. "
+    records = []
+    for i in range(notes):
+        content = filler * rng.randint(2, 6)
+        if rng.random() < flagged_rate:
+            content += f"Impression: {rng.choice(phrases)}."
+        records.append({
+            "date": f"2024-{1 + i % 12:02d}-{1 + i % 28:02d}",
+            "time": f"{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}",
+            "author": "Dr. Smith",
+            "content": content,
+        })
+    rng.shuffle(records)
+    return {"notes": records[: notes // 2], "ward_round_notes": records[notes // 2:]}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--notes", type=int, default=2000)
+    parser.add_argument("--phrases", type=int, default=200)
+    parser.add_argument("--records", type=int, default=20, help="distinct synthetic records for the equivalence check")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    check_negation(get_screening_engine())
+    check_note_order(get_screening_engine())
+    print(f"Negation cases: {len(NEGATION_CASES)} passed, note order cases: {len(NOTE_ORDER_CASES)} passed")
+    phrases = synthetic_phrases(args.phrases)
+    engine = ScreeningEngine(phrases)
+    records = [synthetic_record(args.notes, phrases, seed) for seed in range(args.records)]
+    for record in records:
+        for limit in (2, 10, None):
+            legacy_limit = len(record["notes"]) + len(record["ward_round_notes"]) if limit is None else limit
+            assert engine.is_safe(record, limit) == legacy_is_safe(record, phrases, legacy_limit)
+
+    record = records[0]
+    clean = synthetic_record(args.notes, phrases, flagged_rate=0)
+    total = len(record["notes"]) + len(record["ward_round_notes"])
+    print(f"Record: {total:,} notes, {len(phrases)} phrases, {args.repeat} runs each (best time)")
+    print(f"{'case':<26}{'legacy ms':>12}{'engine ms':>12}{'speedup':>10}")
+    cases = [
+        ("recent 2 notes", lambda: legacy_is_safe(record, phrases, 2), lambda: engine.is_safe(record, 2)),
+        ("recent 50 notes", lambda: legacy_is_safe(record, phrases, 50), lambda: engine.is_safe(record, 50)),
+        ("full history, flagged", lambda: legacy_is_safe(record, phrases, total), lambda: engine.is_safe(record, None)),
+        ("full history, clean", lambda: legacy_is_safe(clean, phrases, total), lambda: engine.is_safe(clean, None)),
+    ]
+    for name, legacy, current in cases:
+        legacy_ms = min(timeit.repeat(legacy, number=1, repeat=args.repeat)) * 1000
+        current_ms = min(timeit.repeat(current, number=1, repeat=args.repeat)) * 1000
+        print(f"{name:<26}{legacy_ms:>12.3f}{current_ms:>12.3f}{legacy_ms / current_ms:>9.1f}x")
+
+if __name__ == "__main__":
+    main()
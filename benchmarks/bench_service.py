@@ -0,0 +1,80 @@
+"""
+Benchmark: load test of the HTTP service (service.py) against the local mock OpenAI server. Client threads
+submit distinct copies of data/data.json through api_client.ServiceClient and wait for each result; reports
+throughput, end-to-end and queueing latency, and how many submissions the bounded queue refused (retried by the client).
+
+    python benchmarks/bench_service.py [--clients 16] [--requests 64] [--workers 4] [--queue-size 8] [--latency-ms 300]
+"""
+import argparse
+import copy
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from mock_server import MockServer
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--clients", type=int, default=16, help="Concurrent client threads")
+    parser.add_argument("--requests", type=int, default=64, help="Records submitted in total")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--queue-size", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=300.0)
+    parser.add_argument("--model", default="gpt-4")
+    args = parser.parse_args()
+
+    with open(os.path.join(ROOT, "data", "data.json"), "r", encoding="utf-8") as f:
+        record = json.load(f)
+    work_dir = tempfile.mkdtemp(prefix="bench_service_")
+    os.environ["LLM_CACHE_PATH"] = os.path.join(work_dir, "llm_cache.sqlite")
+    os.environ["METRICS_LOG_PATH"] = os.path.join(work_dir, "metrics.jsonl")
+    os.makedirs(os.path.join(work_dir, "logs"))
+    os.chdir(work_dir)  # summary_generator logs to logs/ under the working directory
+
+    from api_client import ServiceClient
+    from instrumentation import percentile
+    from scheduler import get_scheduler
+    from service import SummaryService
+    from summary_generator import configure_clients
+
+    def submit(i):
+        # A distinct patient_id per request, so no call is answered from the cache or coalesced with another.
+        patient = copy.deepcopy(record)
+        patient["patient_id"] = f"{record.get('patient_id', 'P')}-{i}"
+        job = client.run(patient, "mock-key", model=args.model, incremental=False)
+        return job["status"], job["latency"], job["queue_seconds"]
+
+    with MockServer(latency_ms=args.latency_ms, distribution="lognormal") as server:
+        configure_clients(base_url=server.url, max_connections=max(args.workers * 2, 10))
+        get_scheduler().configure({})  # the mock server has no quotas
+        with SummaryService(workers=args.workers, queue_size=args.queue_size) as service:
+            client = ServiceClient(service.url, submit_patience=600)
+            start = time.perf_counter()
+            with ThreadPoolExecutor(args.clients) as pool:
+                results = list(pool.map(submit, range(args.requests)))
+            elapsed = time.perf_counter() - start
+            jobs = service.pool.summary()
+
+    statuses = {}
+    for status, _, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    latencies = [latency for _, latency, _ in results]
+    waits = [wait for _, _, wait in results]
+    print(f"{args.requests} records, {args.clients} clients, {args.workers} workers, queue of {args.queue_size}")
+    print(f"statuses: {statuses}")
+    print(f"throughput: {args.requests / elapsed:.2f} records/s over {elapsed:.1f}s")
+    print(f"latency p50 {percentile(latencies, 50):.2f}s  p95 {percentile(latencies, 95):.2f}s  max {max(latencies):.2f}s")
+    print(f"queued  p50 {percentile(waits, 50):.2f}s  p95 {percentile(waits, 95):.2f}s")
+    print(f"submissions refused while the queue was full: {jobs['rejected']}")
+    os.chdir(ROOT)
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
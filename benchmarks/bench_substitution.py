@@ -0,0 +1,76 @@
+"""
+Micro-benchmark: single-pass placeholder substitution (placeholders.substitute) versus the previous
+per-placeholder re.sub spacing fix and sequential str.replace PII insertion.
+
+    python benchmarks/bench_substitution.py [--paragraphs 2000] [--repeat 5]
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from placeholders import PLACEHOLDERS, fix_placeholder_spacing, substitute
+
+REPLACEMENTS = {
+    "REDACTED_NAME": "John Doe",
+    "REDACTED_GENDER": "Male",
+    "REDACTED_AGE": "70",
+    "REDACTED_ADMIT_DATE": "2024-02-10",
+    "REDACTED_DISCHARGE_DATE": "2024-02-14",
+    "REDACTED_DOCTOR": "Dr. Smith",
+}
+
+def legacy_fix_placeholder_spacing(result):
+    for ph in PLACEHOLDERS:
+        result = re.sub(rf'([a-zA-Z]){ph}', r'\1 ' + ph, result)
+        result = re.sub(rf'{ph}([a-zA-Z])', ph + r' \1', result)
+    return result
+
+def legacy_insert_pii(text, replacements):
+    for placeholder, actual in replacements.items():
+        text = text.replace(placeholder, actual)
+    return text
+
+def synthetic_summary(paragraphs, seed=0):
+    """Summary-like text with placeholders, some of them missing their surrounding spaces."""
+    rng = random.Random(seed)
+    sentences = [
+        "{ph} was admitted with fever and productive cough.",
+        "Chest X-ray showed consolidation and {ph}was started on IV antibiotics.",
+        "By day three {ph} was afebrile and tolerating oral intake.",
+        "The patient was discharged on{ph} with follow-up in two weeks.",
+        "Inflammatory markers declined steadily throughout the admission.",
+    ]
+    out = []
+    for _ in range(paragraphs):
+        out.append(" ".join(s.format(ph=rng.choice(PLACEHOLDERS)) for s in rng.sample(sentences, 4)))
+    return "\n\n".join(out)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--paragraphs", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    text = synthetic_summary(args.paragraphs)
+    assert fix_placeholder_spacing(text) == legacy_fix_placeholder_spacing(text)
+    assert substitute(text, REPLACEMENTS) == legacy_insert_pii(legacy_fix_placeholder_spacing(text), REPLACEMENTS)
+
+    cases = [
+        ("spacing fix", lambda: legacy_fix_placeholder_spacing(text), lambda: fix_placeholder_spacing(text)),
+        ("PII insertion", lambda: legacy_insert_pii(text, REPLACEMENTS), lambda: substitute(text, REPLACEMENTS, fix_spacing=False)),
+        ("fix + insert", lambda: legacy_insert_pii(legacy_fix_placeholder_spacing(text), REPLACEMENTS), lambda: substitute(text, REPLACEMENTS)),
+    ]
+    print(f"Summary size: {len(text):,} characters, {args.repeat} runs each (best time)")
+    print(f"{'case':<15}{'legacy ms':>12}{'single-pass ms':>16}{'speedup':>10}")
+    for name, legacy, current in cases:
+        legacy_ms = min(timeit.repeat(legacy, number=1, repeat=args.repeat)) * 1000
+        current_ms = min(timeit.repeat(current, number=1, repeat=args.repeat)) * 1000
+        print(f"{name:<15}{legacy_ms:>12.2f}{current_ms:>16.2f}{legacy_ms / current_ms:>9.1f}x")
+
+if __name__ == "__main__":
+    main()
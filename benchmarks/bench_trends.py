@@ -0,0 +1,42 @@
+"""
+Benchmark: trend extraction with vitals.trend_lines (typed NumPy columns) versus the string series of
+prompt_builder.lab_trends/vital_trends, on a synthetic record with dense flowsheets and labs.
+Reports time per call and the prompt tokens each trends block costs.
+
+    python benchmarks/bench_trends.py [--flowsheet-rows 200000] [--repeat 3]
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from prompt_builder import count_tokens, lab_trends, vital_trends
+from vitals import trend_lines
+from bench_redaction import synthetic_record
+
+def legacy_trends(data):
+    return "\n".join(lab_trends(data) + vital_trends(data))
+
+def columnar_trends(data):
+    lines, covered = trend_lines(data)
+    return "\n".join(lines + lab_trends(data, covered) + vital_trends(data, covered))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--flowsheet-rows", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    record = synthetic_record(args.flowsheet_rows, 10)
+    print(f"Record: {len(record['flowsheets']):,} flowsheet rows, {len(record['labs']):,} lab panels")
+    print(f"{'approach':<22}{'seconds/call':>14}{'tokens':>10}")
+    for name, build in [("string series", legacy_trends), ("typed columns", columnar_trends)]:
+        seconds = min(timeit.repeat(lambda: build(record), number=1, repeat=args.repeat))
+        print(f"{name:<22}{seconds:>14.3f}{count_tokens(build(record)):>10}")
+    print()
+    print(columnar_trends(record))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import re
+import threading
+from collections import OrderedDict
+from phrase_regex import compile_phrase_regex
+
+SECTION_HEADERS = ("Patient Information:", "Diagnosis:", "Summary of Care:", "Disposition:", "Follow-up Plan:", "Contact:")
+
+def highlight_phrases(highlights):
+    """The distinct, non-empty "text" values of a highlight list, lowercased and sorted (the cache key)."""
+    phrases = set()
+    for item in highlights or []:
+        text = item.get("text") if isinstance(item, dict) else None
+        if isinstance(text, str) and text.strip():
+            phrases.add(text.strip().lower())
+    return tuple(sorted(phrases))
+
+def compile_matcher(phrases):
+    """
+    One regex for the section headers, existing **bold** runs and every phrase. finditer over it yields
+    non-overlapping spans, leftmost and then longest first.
+    """
+    headers = "|".join(re.escape(header) for header in SECTION_HEADERS)
+    parts = [rf"(?P<header>(?:^|(?<=\n))(?:{headers}))", r"(?P<bold>\*\*[^*\n]+?\*\*)"]
+
+    def build(pattern):
+        if not phrases:
+            return "|".join(parts)
+        return "|".join(parts + [rf"(?<!\w)(?P<phrase>(?i:{pattern(phrases)}))(?!\w)"])
+
+    return compile_phrase_regex(build)
+
+def render_highlights(summary_text, matcher):
+    """Wraps section headers and highlight phrases in ** in one pass; text already in **bold** is left as is."""
+    out = []
+    last = 0
+    for match in matcher.finditer(summary_text):
+        if match.lastgroup == "bold":
+            continue
+        out.append(summary_text[last:match.start()])
+        out.append(f"**{match.group()}**")
+        last = match.end()
+    out.append(summary_text[last:])
+    return "".join(out)
+
+class HighlightRenderer:
+    """
+    LRU caches of compiled matchers (per set of highlight phrases) and rendered markdown (per summary and phrases),
+    so a Streamlit rerun of an unchanged summary does no regex work. Shared across sessions.
+    """
+
+    def __init__(self, max_entries=64, max_matchers=32):
+        self.max_entries = max_entries
+        self.max_matchers = max_matchers
+        self.entries = OrderedDict()
+        self.matchers = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "compiled": 0, "evictions": 0}
+
+    def matcher(self, phrases):
+        with self.lock:
+            matcher = self.matchers.get(phrases)
+            if matcher is not None:
+                self.matchers.move_to_end(phrases)
+                return matcher
+        matcher = compile_matcher(phrases)
+        with self.lock:
+            self.stats["compiled"] += 1
+            self.matchers[phrases] = matcher
+            while len(self.matchers) > self.max_matchers:
+                self.matchers.popitem(last=False)
+        return matcher
+
+    def render(self, summary_text, highlights):
+        phrases = highlight_phrases(highlights)
+        key = (summary_text, phrases)
+        with self.lock:
+            rendered = self.entries.get(key)
+            if rendered is not None:
+                self.entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return rendered
+            self.stats["misses"] += 1
+        rendered = render_highlights(summary_text, self.matcher(phrases))
+        with self.lock:
+            self.entries[key] = rendered
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.stats["evictions"] += 1
+        return rendered
+
+    def summary(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats["entries"] = len(self.entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        return stats
+
+_highlight_renderer = None
+_highlight_renderer_lock = threading.Lock()
+
+def get_highlight_renderer():
+    """Process-wide highlight renderer shared by all Streamlit sessions."""
+    global _highlight_renderer
+    with _highlight_renderer_lock:
+        if _highlight_renderer is None:
+            _highlight_renderer = HighlightRenderer()
+        return _highlight_renderer
@@ -0,0 +1,222 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from summary_generator import parse_safety_verdict
+
+DEFAULT_STORE_PATH = os.getenv("INCREMENTAL_STORE_PATH", "cache/incremental.sqlite")
+
+# Sections fingerprinted individually; everything else in the record is folded into "other".
+SECTIONS = ("diagnoses", "med_orders", "notes", "ward_round_notes", "labs", "flowsheets")
+# Sections where new information usually arrives as extra entries, so a summary can be updated
+# with just those entries instead of being rewritten from the whole record.
+APPEND_SECTIONS = ("notes", "ward_round_notes", "labs", "flowsheets")
+# The pre-generation verdict is reused while these are unchanged. New labs or vitals alone do not
+# re-run it; the post-generation check still runs on any summary that changes.
+SAFETY_PRE_INPUTS = ("diagnoses", "notes", "ward_round_notes")
+# After this many narrow updates in a row the summary is regenerated from the full record.
+MAX_CHAINED_UPDATES = 3
+
+def _digest(value):
+    payload = json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def fingerprint(redacted_data):
+    """
+    Per-section digests of a redacted record, plus one digest per entry of the append sections.
+    {"sections": {"notes": "...", ..., "other": "..."}, "items": {"notes": ["...", ...], ...}}
+    """
+    sections = {name: _digest(redacted_data.get(name)) for name in SECTIONS}
+    sections["other"] = _digest({k: v for k, v in redacted_data.items() if k not in SECTIONS})
+    items = {name: [_digest(entry) for entry in redacted_data.get(name) or []] for name in APPEND_SECTIONS}
+    return {"sections": sections, "items": items}
+
+def changed_sections(previous, current):
+    return [name for name, digest in current["sections"].items() if previous["sections"].get(name) != digest]
+
+def appended_entries(previous, current, redacted_data):
+    """
+    {section: [entries added since previous]} when every change is new entries in an append section,
+    or None when anything was edited, removed or changed outside those sections.
+    """
+    added = {}
+    for name in changed_sections(previous, current):
+        if name not in APPEND_SECTIONS:
+            return None
+        remaining = Counter(previous["items"].get(name, []))
+        entries = []
+        for digest, entry in zip(current["items"][name], redacted_data.get(name) or []):
+            if remaining[digest] > 0:
+                remaining[digest] -= 1
+            else:
+                entries.append(entry)
+        if +remaining:
+            return None
+        added[name] = entries
+    return added
+
+def _safety_pre_key(fp):
+    return _digest([fp["sections"][name] for name in SAFETY_PRE_INPUTS])
+
+def summary_settings(model, instruction, compact=True):
+    """Digest of everything besides the record that shapes the summary; a stored summary is only reused under the same settings."""
+    return _digest([model, instruction.strip(), compact])
+
+class IncrementalStore:
+    """
+    Latest de-identified outputs per patient_id (pre-safety verdict, summary, highlights, post-safety verdict),
+    each stored with the fingerprint of the inputs it was produced from. Nothing with PII is stored.
+    """
+
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.stats = Counter()
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS states (patient_id TEXT PRIMARY KEY, state TEXT, updated REAL)")
+        self.conn.commit()
+
+    def get(self, patient_id):
+        with self.lock:
+            row = self.conn.execute("SELECT state FROM states WHERE patient_id = ?", (patient_id,)).fetchone()
+        return json.loads(row[0]) if row else {}
+
+    def put(self, patient_id, state):
+        with self.lock:
+            self._write(patient_id, state)
+            self.conn.commit()
+
+    def _write(self, patient_id, state):
+        # Caller holds the lock and commits.
+        self.conn.execute(
+            "INSERT OR REPLACE INTO states (patient_id, state, updated) VALUES (?, ?, ?)",
+            (patient_id, json.dumps(state, ensure_ascii=False), time.time()),
+        )
+
+    def update(self, patient_id, change):
+        """
+        Read-modify-write of one patient's state: change(state) edits it in place. The read and the write share a
+        BEGIN IMMEDIATE transaction, so runs in other sessions, batch workers or processes never drop each other's outputs.
+        """
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute("SELECT state FROM states WHERE patient_id = ?", (patient_id,)).fetchone()
+                state = json.loads(row[0]) if row else {}
+                change(state)
+                self._write(patient_id, state)
+            except BaseException:
+                self.conn.rollback()
+                raise
+            self.conn.commit()
+
+    def count(self, outcome):
+        with self.lock:
+            self.stats[outcome] += 1
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM states")
+            self.conn.commit()
+
+    def summary(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats["patients"] = self.conn.execute("SELECT COUNT(*) FROM states").fetchone()[0]
+        return stats
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_incremental_store():
+    """Process-wide store shared by the app, the pipeline and batch runs."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = IncrementalStore()
+        return _store
+
+def plan_regeneration(redacted_data, model, instruction, compact=True, store=None, count=True):
+    """
+    Compares the record with the outputs stored for its patient_id and decides what can be skipped:
+      safety_pre   previous verdict text if SAFETY_PRE_INPUTS are unchanged, else None
+      summary_mode "reuse" (nothing changed), "update" (only new entries in APPEND_SECTIONS) or "full"
+      summary      previous redacted summary for "reuse" and "update"
+      new_entries  {section: [entries]} to fold into the previous summary for "update"
+      highlights / safety_post  previous results when the summary is reused, else None
+    count=False leaves the reuse stats alone (for a look-ahead such as deciding what to prefetch).
+    """
+    store = store or get_incremental_store()
+    patient_id = str(redacted_data.get("patient_id", ""))
+    fp = fingerprint(redacted_data)
+    settings = summary_settings(model, instruction, compact)
+    plan = {
+        "patient_id": patient_id,
+        "fingerprint": fp,
+        "settings": settings,
+        "changed": list(fp["sections"]),
+        "safety_pre": None,
+        "summary_mode": "full",
+        "summary": None,
+        "updates": 0,
+        "new_entries": {},
+        "highlights": None,
+        "safety_post": None,
+    }
+    state = store.get(patient_id) if patient_id else {}
+
+    pre = state.get("safety_pre")
+    if pre and pre["key"] == _safety_pre_key(fp) and parse_safety_verdict(pre["output"]):
+        plan["safety_pre"] = pre["output"]
+
+    previous = state.get("summary")
+    if previous and previous["settings"] == settings:
+        plan["changed"] = changed_sections(previous["fingerprint"], fp)
+        added = appended_entries(previous["fingerprint"], fp, redacted_data)
+        if added is not None and not any(added.values()):
+            # Unchanged, or only reordered.
+            plan.update(summary_mode="reuse", summary=previous["output"], updates=previous.get("updates", 0))
+            post = state.get("post")
+            if post and post["key"] == _digest(previous["output"]):
+                plan.update(highlights=post["highlights"], safety_post=post["safety_post"])
+        elif added is not None and previous.get("updates", 0) < MAX_CHAINED_UPDATES:
+            plan.update(summary_mode="update", summary=previous["output"], updates=previous.get("updates", 0) + 1,
+                        new_entries={name: entries for name, entries in added.items() if entries})
+
+    if count:
+        store.count("safety_pre_reused" if plan["safety_pre"] else "safety_pre_run")
+        store.count(f"summary_{plan['summary_mode']}")
+    return plan
+
+def save_outputs(plan, safety_pre=None, summary=None, highlights=None, safety_post=None, store=None):
+    """
+    Stores whichever outputs were produced for the planned record. Fallbacks (no parseable verdict,
+    empty highlights after a timeout) are not stored, so they are retried next time.
+    """
+    if not plan["patient_id"]:
+        return
+    store = store or get_incremental_store()
+    fp = plan["fingerprint"]
+
+    def change(state):
+        if safety_pre is not None and parse_safety_verdict(safety_pre):
+            state["safety_pre"] = {"key": _safety_pre_key(fp), "output": safety_pre}
+        if summary is not None:
+            if summary != (state.get("summary") or {}).get("output"):
+                state.pop("post", None)
+            state["summary"] = {
+                "settings": plan["settings"],
+                "fingerprint": fp,
+                "output": summary,
+                "updates": plan["updates"] if plan["summary_mode"] != "full" else 0,
+            }
+            if highlights and parse_safety_verdict(safety_post):
+                state["post"] = {"key": _digest(summary), "highlights": highlights, "safety_post": safety_post}
+
+    store.update(plan["patient_id"], change)
@@ -0,0 +1,185 @@
+import json
+import mmap
+import os
+import re
+import threading
+
+# Files holding many patients, one JSON record per line.
+BUNDLE_EXTENSIONS = (".ndjson", ".jsonl")
+# Scanned pages of a memory-mapped record are handed back to the OS every this many bytes,
+# so skipping a large section does not keep the whole file resident.
+RELEASE_EVERY = 16 * 1024 * 1024
+
+_STRING = rb'"[^"\\]*(?:\\.[^"\\]*)*"'
+_string = re.compile(_STRING)
+# Everything up to the next bracket, stepping over whole strings (which may contain brackets).
+# (Unrolled, so a failed match backtracks linearly.)
+_FILLER = rb'[^"\[\]{}]*(?:' + _STRING + rb'[^"\[\]{}]*)*'
+_filler = re.compile(_FILLER)
+_flat = re.compile(rb'[\[{]' + _FILLER + rb'[\]}]')
+_scalar = re.compile(rb'[^,}\]\s]+')
+_whitespace = re.compile(rb"\s*")
+_can_release = hasattr(mmap, "MADV_DONTNEED")
+
+def _release(buf, released, pos):
+    """Drops mapped pages in [released, pos) from the process's resident set; returns the new released offset."""
+    if not _can_release or not isinstance(buf, mmap.mmap) or pos - released < RELEASE_EVERY:
+        return released
+    start = released - released % mmap.PAGESIZE
+    length = (pos - start) // mmap.PAGESIZE * mmap.PAGESIZE
+    buf.madvise(mmap.MADV_DONTNEED, start, length)
+    return start + length
+
+def _skip_value(buf, pos, released=0):
+    """Returns (end, released) for the JSON value starting at pos, without building it."""
+    first = buf[pos:pos + 1]
+    if first == b'"':
+        match = _string.match(buf, pos)
+        if not match:
+            raise ValueError(f"Unterminated string at byte {pos}")
+        return match.end(), released
+    if first not in (b"{", b"["):
+        match = _scalar.match(buf, pos)
+        if not match:
+            raise ValueError(f"Expected a JSON value at byte {pos}")
+        return match.end(), released
+
+    depth = 0
+    size = len(buf)
+    while pos < size:
+        char = buf[pos]
+        if char in b"{[":
+            # Containers without nested containers (e.g. one flowsheet row) are skipped in a single match.
+            flat = _flat.match(buf, pos)
+            if flat:
+                pos = flat.end()
+            else:
+                depth += 1
+                pos += 1
+        elif char in b"}]":
+            depth -= 1
+            pos += 1
+        else:
+            raise ValueError(f"Unterminated string at byte {pos}")
+        if depth == 0:
+            return pos, released
+        pos = _filler.match(buf, pos).end()
+        released = _release(buf, released, pos)
+    raise ValueError("Unexpected end of JSON record")
+
+def _expect(buf, pos, token):
+    pos = _whitespace.match(buf, pos).end()
+    if buf[pos:pos + 1] != token:
+        raise ValueError(f"Expected {token.decode()!r} at byte {pos}")
+    return _whitespace.match(buf, pos + 1).end()
+
+def iter_sections(buf):
+    """
+    Yields (key, start, end) byte offsets for each member of the top-level JSON object in buf
+    (bytes or an mmap). Only the keys are decoded.
+    """
+    pos = _expect(buf, 0, b"{")
+    if buf[pos:pos + 1] == b"}":
+        return
+    released = 0
+    while True:
+        match = _string.match(buf, pos)
+        if not match:
+            raise ValueError(f"Expected a key at byte {pos}")
+        key = json.loads(match.group())
+        pos = _expect(buf, match.end(), b":")
+        end, released = _skip_value(buf, pos, released)
+        yield key, pos, end
+        pos = _whitespace.match(buf, end).end()
+        if buf[pos:pos + 1] == b"}":
+            return
+        pos = _expect(buf, pos, b",")
+
+def select_sections(buf, sections):
+    """
+    Builds a dict of just the requested top-level sections of the JSON object in buf.
+    Skipped sections are only checked for balanced brackets and terminated strings.
+    """
+    wanted = set(sections)
+    record = {}
+    for key, start, end in iter_sections(buf):
+        if key in wanted:
+            record[key] = json.loads(buf[start:end])
+    return record
+
+def is_bundle(path):
+    return path.lower().endswith(BUNDLE_EXTENSIONS)
+
+def record_ref(bundle_path, line_number):
+    """Reference to one record of an NDJSON bundle, usable wherever a record path is ("bundle.ndjson#3")."""
+    return f"{bundle_path}#{line_number}"
+
+def split_ref(ref):
+    """("bundle.ndjson", 3) for a bundle reference, (path, None) for a plain record path."""
+    path, sep, line = ref.rpartition("#")
+    if sep and line.isdigit() and is_bundle(path) and not os.path.exists(ref):
+        return path, int(line)
+    return ref, None
+
+_bundle_indexes = {}
+_bundle_lock = threading.Lock()
+
+def bundle_index(path):
+    """Byte offsets of the non-empty lines of a bundle, cached until the file's mtime or size changes."""
+    stat = os.stat(path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    with _bundle_lock:
+        cached = _bundle_indexes.get(path)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+    offsets = []
+    with open(path, "rb") as f:
+        offset = 0
+        for line in f:
+            if line.strip():
+                offsets.append(offset)
+            offset += len(line)
+    with _bundle_lock:
+        _bundle_indexes[path] = (signature, offsets)
+    return offsets
+
+def _parse(buf, sections):
+    return json.loads(buf) if sections is None else select_sections(buf, sections)
+
+def load_record(path, sections=None):
+    """
+    Parses one patient record: a .json file, or a bundle reference from record_ref.
+    With sections (e.g. ("patient_id", "notes")), the file is memory-mapped and only those top-level
+    sections are built; large sections such as flowsheets are skipped without being parsed.
+    """
+    path, line_number = split_ref(path)
+    if line_number is not None:
+        offsets = bundle_index(path)
+        if not 0 <= line_number < len(offsets):
+            raise ValueError(f"{path} has no record {line_number}")
+        with open(path, "rb") as f:
+            f.seek(offsets[line_number])
+            return _parse(f.readline(), sections)
+
+    if sections is None:
+        with open(path, "r") as f:
+            return json.load(f)
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ValueError(f"{path} is empty")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            return select_sections(buf, sections)
+
+def iter_records(path, sections=None):
+    """Yields the records in a bundle one line at a time (a plain .json file yields its single record)."""
+    if not is_bundle(path):
+        yield load_record(path, sections)
+        return
+    with open(path, "rb") as f:
+        for line in f:
+            if line.strip():
+                yield _parse(line, sections)
+
+def list_bundle(path):
+    """Record references for every record in a bundle."""
+    return [record_ref(path, i) for i in range(len(bundle_index(path)))]
@@ -0,0 +1,137 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+METRICS_LOG = os.getenv("METRICS_LOG_PATH", "logs/metrics.jsonl")
+
+# USD per 1K tokens (prompt, completion). Unknown models are costed as 0.
+MODEL_PRICES = {
+    "gpt-4": (0.03, 0.06),
+    "gpt-4-turbo": (0.01, 0.03),
+    "gpt-4o": (0.005, 0.015),
+    "gpt-4o-mini": (0.00015, 0.0006),
+    "gpt-3.5-turbo": (0.0005, 0.0015),
+}
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+_records = deque(maxlen=5000)
+_write_lock = threading.Lock()
+
+def estimate_cost(model, prompt_tokens, completion_tokens):
+    prompt_price, completion_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    return round(prompt_tokens / 1000 * prompt_price + completion_tokens / 1000 * completion_price, 6)
+
+def start_trace(name=""):
+    """Starts a new trace id; every stage recorded afterwards in this context shares it."""
+    trace_id = f"{name}-{uuid.uuid4().hex[:8]}" if name else uuid.uuid4().hex[:12]
+    _current_trace.set(trace_id)
+    return trace_id
+
+def annotate(**fields):
+    """Adds fields (model, cache status, ...) to the innermost running stage, if any."""
+    span = _current_span.get()
+    if span is not None:
+        span.update(fields)
+
+def record_usage(model, usage):
+    """Attaches token counts and estimated cost from an OpenAI `usage` object to the running stage."""
+    span = _current_span.get()
+    if span is None:
+        return
+    prompt_tokens = (getattr(usage, "prompt_tokens", 0) or 0) if usage else 0
+    completion_tokens = (getattr(usage, "completion_tokens", 0) or 0) if usage else 0
+    span["model"] = model
+    span["prompt_tokens"] = span.get("prompt_tokens", 0) + prompt_tokens
+    span["completion_tokens"] = span.get("completion_tokens", 0) + completion_tokens
+    span["cost_usd"] = round(span.get("cost_usd", 0.0) + estimate_cost(model, prompt_tokens, completion_tokens), 6)
+
+@contextmanager
+def stage(name, **attrs):
+    """
+    Times a pipeline stage and records it as one JSON line in METRICS_LOG.
+    LLM helpers running inside the stage add model, tokens, cost and cache status via annotate/record_usage.
+    """
+    parent = _current_span.get()
+    span = {
+        "stage": name,
+        "trace": _current_trace.get(),
+        "parent": parent["stage"] if parent else None,
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        **attrs,
+    }
+    token = _current_span.set(span)
+    start = time.perf_counter()
+    try:
+        yield span
+    except Exception as e:
+        span["error"] = type(e).__name__
+        raise
+    finally:
+        span["wall_seconds"] = round(time.perf_counter() - start, 4)
+        _current_span.reset(token)
+        _emit(span)
+
+def _emit(span):
+    _records.append(span)
+    try:
+        with _write_lock:
+            os.makedirs(os.path.dirname(METRICS_LOG) or ".", exist_ok=True)
+            with open(METRICS_LOG, "a", encoding="utf-8") as f:
+                f.write(json.dumps(span) + "\n")
+    except OSError as e:
+        logging.error(f"Could not write metrics record: {e}")
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def summarize(records=None):
+    """Aggregates stage records (default: those recorded in this process) into per-stage p50/p95/p99, tokens and cost."""
+    records = list(_records) if records is None else records
+    by_stage = {}
+    for record in records:
+        by_stage.setdefault(record["stage"], []).append(record)
+
+    summary = []
+    for name, items in by_stage.items():
+        walls = [r["wall_seconds"] for r in items]
+        cached = [r for r in items if r.get("cache") in ("hit", "miss")]
+        summary.append({
+            "stage": name,
+            "count": len(items),
+            "p50_s": percentile(walls, 50),
+            "p95_s": percentile(walls, 95),
+            "p99_s": percentile(walls, 99),
+            "prompt_tokens": sum(r.get("prompt_tokens", 0) for r in items),
+            "completion_tokens": sum(r.get("completion_tokens", 0) for r in items),
+            "cost_usd": round(sum(r.get("cost_usd", 0.0) for r in items), 4),
+            "prompt_tokens_saved": sum(r.get("prompt_tokens_saved", 0) for r in items),
+            "cache_hit_rate": round(sum(1 for r in cached if r["cache"] == "hit") / len(cached), 3) if cached else None,
+            "errors": sum(1 for r in items if "error" in r),
+        })
+    return summary
+
+def load_records(path=METRICS_LOG):
+    """Reads stage records back from a metrics JSON-lines file (e.g. to summarize a past batch run)."""
+    records = []
+    if not os.path.exists(path):
+        return records
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+    return records
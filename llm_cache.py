@@ -0,0 +1,120 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "cache/llm_cache.sqlite")
+
+def cache_key(model, temperature, prompt, base_url=None):
+    """
+    Content address for one chat call: the same model, temperature and prompt sent to the same endpoint
+    always map to the same key (so a mock server's replies are never served for the real API, or vice versa).
+    """
+    payload = json.dumps([model, float(temperature), prompt, base_url], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """
+    Two-level cache for LLM responses: an in-memory LRU in front of a SQLite table.
+    Entries expire after `ttl` seconds; the disk table is trimmed to `max_entries` (least recently used first).
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, memory_size=256, ttl=7 * 24 * 3600, max_entries=5000):
+        self.path = path
+        self.memory_size = memory_size
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, model TEXT, response TEXT, created REAL, accessed REAL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses (accessed)")
+        self.conn.commit()
+
+    def _remember(self, key, response, created):
+        self.memory[key] = (response, created)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_size:
+            self.memory.popitem(last=False)
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry and now - entry[1] < self.ttl:
+                self.memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return entry[0]
+
+            row = self.conn.execute(
+                "SELECT response, created FROM responses WHERE key = ? AND created > ?",
+                (key, now - self.ttl),
+            ).fetchone()
+            if row is None:
+                self.memory.pop(key, None)
+                self.stats["misses"] += 1
+                return None
+
+            self.conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self.conn.commit()
+            self._remember(key, row[0], row[1])
+            self.stats["disk_hits"] += 1
+            return row[0]
+
+    def set(self, key, response, model=""):
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, model, response, now, now),
+            )
+            self._remember(key, response, now)
+            self.stats["writes"] += 1
+            self._evict(now)
+            self.conn.commit()
+
+    def _evict(self, now):
+        removed = self.conn.execute("DELETE FROM responses WHERE created <= ?", (now - self.ttl,)).rowcount
+        count = self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        if count > self.max_entries:
+            removed += self.conn.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed ASC LIMIT ?)",
+                (count - self.max_entries,),
+            ).rowcount
+        self.stats["evictions"] += removed
+
+    def clear(self):
+        with self.lock:
+            self.memory.clear()
+            self.conn.execute("DELETE FROM responses")
+            self.conn.commit()
+
+    def summary(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats["disk_entries"] = self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        stats["memory_entries"] = len(self.memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 3) if lookups else 0.0
+        return stats
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache():
+    """Process-wide cache shared by all summary_generator calls (and all Streamlit sessions)."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+        return _cache
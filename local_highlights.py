@@ -0,0 +1,117 @@
+import os
+import re
+from phrase_regex import compile_phrase_regex
+
+# Categories the app's highlight coverage metric looks for.
+COVERAGE_CATEGORIES = ("diagnosis", "medication", "followup_action", "discharge_criteria", "recovery_status")
+
+# Share of the expected categories the local extractor must find before its highlights replace the LLM call.
+LOCAL_HIGHLIGHT_THRESHOLD = float(os.getenv("LOCAL_HIGHLIGHT_THRESHOLD", "0.8"))
+
+_NUMBER = r"(?:\d+|one|two|three|four|five|six|seven|eight|nine|ten|twelve|fourteen)"
+_UNIT = r"(?:days?|weeks?|months?|hours?)"
+
+# Phrases that do not come from the record, per category (from extract_highlights' category set). At one position the
+# first alternative that matches wins, so these come before the record phrases ("CRP declined" over "CRP").
+CUE_PATTERNS = {
+    "followup_timing": rf"(?:in|within|after) (?:the next )?{_NUMBER}[ -]{_UNIT}|scheduled for \d{{4}}-\d\d-\d\d",
+    "duration": rf"{_NUMBER}[ -](?:more |further )?{_UNIT}(?: course)?",
+    "followup_action": (
+        r"(?:follow[- ]up|outpatient) (?:[a-z]+ ){0,3}?(?:appointment|visit|clinic|review)"
+        r"|repeat (?:CT|MRI|imaging|blood tests?|labs?)(?: scan)?"
+    ),
+    "red_flag_instruction": (
+        r"(?:return|seek (?:urgent |immediate )?medical (?:attention|advice)) if [^.\n]+"
+        r"|watch for (?:signs )?(?:such as )?[^.\n]+"
+    ),
+    "discharge_criteria": (
+        r"medically fit for discharge|tolerating oral intake|breathing comfortably"
+        r"|met (?:standard )?discharge criteria|stable for discharge"
+    ),
+    "recovery_status": (
+        r"afebrile(?: for (?:over |more than )?\d+ hours)?|(?:clinically|hemodynamically|neurologically) stable"
+        r"|symptoms? (?:had )?(?:resolved|improved)|(?:gradual )?improvement in [a-z]+(?: and [a-z]+)?"
+    ),
+    "clinical_trend": (
+        r"(?:temperature|inflammatory markers|oxygen saturation|cardiac enzymes|troponin|CRP|WBC)(?: levels?)?"
+        r" (?:normali[sz]ed|declined|decreased|trended down|rose|improved)"
+    ),
+}
+
+_ROUTES = re.compile(r"(?i)\b(?:IV|PO|IM|SC|oral|intravenous)\b")
+_QUALIFIER = re.compile(r"(?i),?\s*\b(?:unspecified|not elsewhere classified)\b.*$")
+
+def _variants(text, strip_routes=False):
+    """The phrase plus the shorter forms a summary is likely to use ("Lobar pneumonia" for "Lobar pneumonia, unspecified organism")."""
+    text = " ".join((text or "").split())
+    variants = {text, _QUALIFIER.sub("", text), text.split(",")[0], re.sub(r"\s*\(.*?\)", "", text)}
+    if strip_routes:
+        variants.add(" ".join(_ROUTES.sub("", text).split()))
+    return {v.strip().lower() for v in variants if len(v.strip()) >= 3}
+
+def record_phrases(record):
+    """{lowercase phrase: category} for the record's diagnoses, medications, imaging findings, lab names and follow-up care."""
+    phrases = {}
+
+    def add(texts, category, strip_routes=False):
+        for text in texts:
+            for phrase in _variants(text, strip_routes):
+                phrases.setdefault(phrase, category)
+
+    add([d.get("description") for d in record.get("diagnoses", [])], "diagnosis")
+    add([(record.get("drg") or {}).get("description")], "diagnosis")
+    add([m.get("medication") for m in record.get("med_orders", [])], "medication", strip_routes=True)
+    add([i.get("findings") for i in record.get("imaging", [])], "investigation_result")
+    add([t.get("name") for lab in record.get("labs", []) for t in lab.get("tests", [])], "lab_result")
+    add([f.get("type") for f in record.get("follow_up_care") or []], "followup_action")
+    return phrases
+
+def compile_extractor(record):
+    """One case-insensitive regex over every cue pattern and record phrase; returns (regex, phrase categories)."""
+    phrases = record_phrases(record)
+    labs = sorted(p for p, category in phrases.items() if category == "lab_result")
+
+    def build(phrase_pattern):
+        parts = [f"(?P<{category}>{pattern})" for category, pattern in CUE_PATTERNS.items()]
+        if labs:
+            lab = phrase_pattern(labs)
+            parts.insert(0, rf"(?P<lab_result>(?:elevated|raised|high|low|decreased|rising|falling) {lab}(?: and {lab})?)")
+        if phrases:
+            parts.append(f"(?P<phrase>{phrase_pattern(phrases)})")
+        return r"(?i)(?<!\w)(?:" + "|".join(parts) + r")(?!\w)"
+
+    return compile_phrase_regex(build), phrases
+
+def expected_categories(record):
+    """The coverage categories a summary of this record should have highlights for."""
+    expected = set(COVERAGE_CATEGORIES)
+    if not record.get("diagnoses"):
+        expected.discard("diagnosis")
+    if not record.get("med_orders"):
+        expected.discard("medication")
+    return expected
+
+def highlight_coverage(highlights, expected=COVERAGE_CATEGORIES):
+    """Share of the expected categories that have at least one highlight (the app's coverage metric)."""
+    expected = set(expected)
+    if not expected:
+        return 1.0
+    found = {item.get("category") for item in highlights or [] if isinstance(item, dict)}
+    return len(expected & found) / len(expected)
+
+def extract_local_highlights(summary_text, record):
+    """
+    Highlights found without an LLM: spans of the summary matching the record's phrases or the cue patterns,
+    in one pass, tagged with extract_highlights' categories. Returns (highlights, confidence), where confidence
+    is the share of expected_categories(record) found; compare it with LOCAL_HIGHLIGHT_THRESHOLD.
+    """
+    matcher, phrases = compile_extractor(record)
+    highlights = []
+    seen = set()
+    for match in matcher.finditer(summary_text or ""):
+        text = match.group()
+        category = phrases.get(text.lower()) if match.lastgroup == "phrase" else match.lastgroup
+        if category and text.lower() not in seen:
+            seen.add(text.lower())
+            highlights.append({"text": text, "category": category})
+    return highlights, highlight_coverage(highlights, expected_categories(record))
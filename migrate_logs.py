@@ -0,0 +1,199 @@
+import argparse
+import glob
+import gzip
+import hashlib
+import json
+import os
+import re
+from ingest import load_record
+from summary_generator import parse_safety_verdict
+from summary_store import DEFAULT_SUMMARY_STORE_PATH, RATINGS, SummaryStore, diagnosis_text
+
+SEPARATOR = "=" * 60
+_header = re.compile(r"^\[SUMMARY GENERATED\] (\S+ \d\d:\d\d:\d\d)")
+_inline_field = re.compile(r"^(FILE|SUMMARY MODE|MODEL):\s*(.*)$")
+_block_field = re.compile(r"^(SYSTEM PROMPT|USER PROMPT|FULL PROMPT SENT TO LLM|OUTPUT(?: \(.+\))?|HIGHLIGHTS|SAFETY VALIDATION(?: \(POST\))?):$")
+_leading_verdict = re.compile(r"(?i)^\W*(yes|no|uncertain)\b")
+
+# Rating keys of the current app, and of the older yes/no checklist (booleans, not migrated as ratings).
+_RATING_KEYS = {rating: f"{rating}_rating" for rating in RATINGS}
+
+def legacy_verdict(text):
+    """parse_safety_verdict, falling back to a leading Yes/No/Uncertain as in the earliest log entries."""
+    verdict = parse_safety_verdict(text)
+    if verdict is None and text:
+        match = _leading_verdict.match(text)
+        verdict = match.group(1).capitalize() if match else None
+    return verdict
+
+def _key(path, text):
+    return hashlib.sha1(f"{os.path.basename(path)}\n{text}".encode("utf-8")).hexdigest()
+
+def _decode(line):
+    # Entries written on Windows before the logs were opened as UTF-8 are cp1252 ("\x92" apostrophes).
+    try:
+        return line.decode("utf-8").rstrip("\r")
+    except UnicodeDecodeError:
+        return line.decode("cp1252", errors="replace").rstrip("\r")
+
+def parse_text_log(path):
+    """
+    Yields ("summary", fields) and ("evaluation", fields) entries from a free-text log_*.log file:
+    "[SUMMARY GENERATED]" blocks with FILE:/OUTPUT:/... sections, and pretty-printed evaluation JSON.
+    """
+    summary = None
+    field = None
+    json_lines = None
+    with open(path, "rb") as f:
+        lines = [_decode(line) for line in f.read().split(b"\n")]
+    for line in lines + [SEPARATOR]:
+        if json_lines is not None:
+            json_lines.append(line)
+            if line == "}":
+                text = "\n".join(json_lines)
+                json_lines = None
+                try:
+                    yield "evaluation", {**json.loads(text), "source_key": _key(path, text)}
+                except ValueError:
+                    continue
+            continue
+        if line == SEPARATOR or line == "{" or _header.match(line):
+            if summary is not None:
+                text = json.dumps(summary, sort_keys=True)
+                yield "summary", {**{k: v.strip() for k, v in summary.items()}, "source_key": _key(path, text)}
+                summary = None
+            if line == "{":
+                json_lines = [line]
+            header = _header.match(line)
+            if header:
+                summary = {"created": header.group(1)}
+                field = None
+            continue
+        if summary is None or line == "-" * 60:
+            continue
+        inline = _inline_field.match(line)
+        block = _block_field.match(line)
+        if inline:
+            summary[inline.group(1)] = inline.group(2)
+            field = None
+        elif block:
+            field = block.group(1)
+            summary[field] = ""
+        elif field:
+            summary[field] += line + "\n"
+
+def parse_audit_log(path):
+    """Yields entries from an audit_*.jsonl file (and its rotated .gz files) written by audit_log.py."""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            kind = "summary" if record.get("event") == "summary_generated" else "evaluation"
+            yield kind, {**record, "source_key": _key(path, line.strip())}
+
+class RecordInfo:
+    """patient_id and diagnosis per data filename, read from the records that still exist."""
+
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+        self.cache = {}
+
+    def get(self, filename):
+        if filename not in self.cache:
+            path = os.path.join(self.data_dir, os.path.basename(filename or ""))
+            try:
+                record = load_record(path, ("patient_id", "diagnoses"))
+                self.cache[filename] = (record.get("patient_id"), diagnosis_text(record))
+            except (OSError, ValueError):
+                self.cache[filename] = (None, None)
+        return self.cache[filename]
+
+def _summary_row(entry, record_info, source):
+    if "output" in entry:  # audit_log.py record
+        output, filename = entry.get("output"), entry.get("file")
+        highlights, safety_post = entry.get("highlights"), entry.get("safety_post")
+        instruction, mode, model = entry.get("full_prompt"), entry.get("summary_mode"), entry.get("model")
+    else:
+        output = next((v for k, v in entry.items() if k.startswith("OUTPUT")), "")
+        filename = entry.get("FILE")
+        highlights = entry.get("HIGHLIGHTS")
+        safety_post = entry.get("SAFETY VALIDATION (POST)", entry.get("SAFETY VALIDATION"))
+        instruction, mode, model = entry.get("FULL PROMPT SENT TO LLM"), entry.get("SUMMARY MODE"), entry.get("MODEL")
+    patient_id, diagnosis = record_info.get(filename)
+    return {
+        "created": entry.get("created") or entry.get("timestamp"),
+        "filename": filename,
+        "patient_id": patient_id,
+        "model": model or None,
+        "diagnosis": diagnosis,
+        "summary_mode": mode or None,
+        "instruction": instruction,
+        "summary": output,
+        "highlights": highlights,
+        "safety_post": safety_post,
+        "verdict": legacy_verdict(safety_post),
+        "source": source,
+        "source_key": entry["source_key"],
+    }
+
+def _evaluation_row(entry, record_info, source, view, store):
+    filename = entry.get("filename")
+    patient_id, diagnosis = record_info.get(filename)
+    summary_id, model = store.summary_before(filename, entry.get("timestamp"))
+    ratings = {}
+    for rating, key in _RATING_KEYS.items():
+        value = entry.get(key)
+        ratings[rating] = value if isinstance(value, int) and not isinstance(value, bool) else None
+    return {
+        "created": entry.get("timestamp"),
+        "summary_id": entry.get("summary_id") or summary_id,
+        "filename": filename,
+        "patient_id": patient_id,
+        "model": entry.get("model") or model,
+        "diagnosis": diagnosis,
+        "view": view,
+        **ratings,
+        "highlight_coverage": entry.get("highlight_coverage"),
+        "readability": entry.get("readability_score"),
+        "verdict": legacy_verdict(entry.get("safety_validation")),
+        "raw": {k: v for k, v in entry.items() if k != "source_key"},
+        "source": source,
+        "source_key": entry["source_key"],
+    }
+
+def migrate(logs_dir, store, data_dir="data"):
+    """
+    Back-fills the store from every log in logs_dir; already migrated entries are skipped, so it can be re-run.
+    Summaries come only from the de-identified logs. Returns {"summaries": n, "evaluations": n} inserted.
+    """
+    record_info = RecordInfo(data_dir)
+    inserted = {"summaries": 0, "evaluations": 0}
+    sources = [(path, parse_text_log) for path in sorted(glob.glob(os.path.join(logs_dir, "log_*.log")))]
+    sources += [(path, parse_audit_log) for path in sorted(glob.glob(os.path.join(logs_dir, "audit_*.jsonl*")))]
+    for path, parse in sources:
+        view = "identified" if "_identified" in os.path.basename(path) else "deidentified"
+        source = os.path.basename(path)
+        for kind, entry in parse(path):
+            if kind == "summary":
+                if view == "deidentified" and store.add_summary(**_summary_row(entry, record_info, source)):
+                    inserted["summaries"] += 1
+            elif store.add_evaluation(**_evaluation_row(entry, record_info, source, view, store)):
+                inserted["evaluations"] += 1
+    return inserted
+
+def main():
+    parser = argparse.ArgumentParser(description="Back-fill the summary store from the app's log files.")
+    parser.add_argument("--logs", default="logs", help="Directory holding log_*.log and audit_*.jsonl files (default: logs)")
+    parser.add_argument("--data", default="data", help="Patient records, used to look up patient_id and diagnosis (default: data)")
+    parser.add_argument("--store", default=DEFAULT_SUMMARY_STORE_PATH, help=f"SQLite store (default: {DEFAULT_SUMMARY_STORE_PATH})")
+    args = parser.parse_args()
+
+    store = SummaryStore(args.store)
+    inserted = migrate(args.logs, store, args.data)
+    print(json.dumps({"inserted": inserted, "store": store.summary()}, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,336 @@
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from prompt_builder import count_tokens
+
+# Latency before the first token is "fixed" (latency_ms), "uniform" (latency_ms +/- jitter_ms) or
+# "lognormal" (median latency_ms, spread sigma). Error rates are per request and checked in the order listed.
+DEFAULT_MOCK_SETTINGS = {
+    "latency_ms": 300.0,
+    "jitter_ms": 100.0,
+    "distribution": "lognormal",
+    "sigma": 0.5,
+    "tokens_per_second": 60.0,
+    "error_429_rate": 0.0,
+    "error_500_rate": 0.0,
+    "timeout_rate": 0.0,
+    "hang_seconds": 300.0,
+    "retry_after": 1,
+    "safety_verdict": "Yes",
+    "malformed_rate": 0.0,
+    "seed": None,
+}
+
+CANNED_SUMMARY = """
+**Patient Information:**
+REDACTED_NAME is a REDACTED_AGE-year-old REDACTED_GENDER admitted for inpatient care and discharged after clinical improvement.
+
+**Diagnosis:**
+Lobar pneumonia, unspecified organism (ICD-10: J18.1)
+
+**Summary of Care:**
+The patient presented with fever, productive cough and shortness of breath. Blood tests showed elevated WBC and CRP, which declined with treatment. The patient was treated with IV Amoxicillin and Paracetamol and transitioned to oral antibiotics once clinically stable.
+
+**Disposition:**
+At discharge, the patient was afebrile for over 48 hours, breathing comfortably and tolerating oral intake. The care team determined the patient was medically fit for discharge.
+
+**Follow-up Plan:**
+The patient was advised to complete 5 more days of oral antibiotics and attend a follow-up clinic appointment in two weeks. The patient should return if fever or breathlessness recurs.
+
+**Contact:**
+For any concerns, the patient was instructed to contact the clinic.
+Sincerely,
+REDACTED_DOCTOR
+""".strip()
+
+# Highlight phrases are taken from the summary itself, so they can be located when rendering.
+_HIGHLIGHT_PATTERNS = [
+    (re.compile(r"(?i)\b(?:diagnosed with|admitted with|presented with) [^.,\n]+"), "diagnosis"),
+    (re.compile(r"(?i)\b\d+ (?:more )?(?:days|weeks)\b"), "duration"),
+    (re.compile(r"(?i)\b(?:IV|oral) [A-Za-z]+"), "medication"),
+    (re.compile(r"(?i)\belevated [A-Za-z]+(?: and [A-Za-z]+)?"), "lab_result"),
+    (re.compile(r"(?i)\bafebrile for [^.,\n]+"), "recovery_status"),
+    (re.compile(r"(?i)\bfollow-up [^.,\n]+"), "followup_action"),
+    (re.compile(r"(?i)\breturn if [^.,\n]+"), "red_flag_instruction"),
+]
+
+_CANNED_REASONING = (
+    "The diagnosis was confirmed, treatment was completed and objective markers normalized. "
+    "Discharge criteria are documented."
+)
+
+def canned_highlights(summary_text):
+    highlights = []
+    for pattern, category in _HIGHLIGHT_PATTERNS:
+        match = pattern.search(summary_text)
+        if match:
+            highlights.append({"text": match.group().strip(), "category": category})
+    return highlights
+
+def canned_reply(prompt, settings=None):
+    """The reply a real model would give, in the format summary_generator parses for this kind of prompt."""
+    settings = {**DEFAULT_MOCK_SETTINGS, **(settings or {})}
+    if "extract a JSON list of important clinical highlights" in prompt:
+        summary_text = prompt.rsplit("SUMMARY:", 1)[-1]
+        return json.dumps(canned_highlights(summary_text), indent=2)
+    if 'Return one of: "Yes", "No", or "Uncertain"' in prompt:
+        return f"Reasoning:\n{_CANNED_REASONING}\n\nAnswer: {settings['safety_verdict']}"
+    return CANNED_SUMMARY
+
+def canned_review(prompt, settings=None):
+    """Arguments of the combined review function call (summary_generator.REVIEW_TOOL) for this prompt."""
+    settings = {**DEFAULT_MOCK_SETTINGS, **(settings or {})}
+    summary_text = prompt.rsplit("SUMMARY:", 1)[-1]
+    return {"highlights": canned_highlights(summary_text), "reasoning": _CANNED_REASONING, "verdict": settings["safety_verdict"]}
+
+def _message(content, tools):
+    if not tools:
+        return {"role": "assistant", "content": content}
+    call = {"id": f"call_{uuid.uuid4().hex[:12]}", "type": "function", "function": {"name": tools[0]["function"]["name"], "arguments": content}}
+    return {"role": "assistant", "content": None, "tool_calls": [call]}
+
+def _error_body(status, message, kind):
+    return {"error": {"message": message, "type": kind, "param": None, "code": str(status)}}
+
+class MockServer:
+    """
+    Threaded HTTP server answering POST /v1/chat/completions (plain and streamed) with canned replies.
+    Latency, token rate and injected failures come from settings (see DEFAULT_MOCK_SETTINGS) and can be
+    changed while it runs with configure().
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, **settings):
+        unknown = set(settings) - set(DEFAULT_MOCK_SETTINGS)
+        if unknown:
+            raise ValueError(f"Unknown mock settings: {sorted(unknown)}")
+        self.settings = {**DEFAULT_MOCK_SETTINGS, **settings}
+        self.random = random.Random(self.settings["seed"])
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "streamed": 0, "errors_429": 0, "errors_500": 0, "timeouts": 0, "completion_tokens": 0}
+        self.httpd = ThreadingHTTPServer((host, port), _handler(self))
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def configure(self, **settings):
+        unknown = set(settings) - set(DEFAULT_MOCK_SETTINGS)
+        if unknown:
+            raise ValueError(f"Unknown mock settings: {sorted(unknown)}")
+        with self.lock:
+            self.settings.update(settings)
+            if "seed" in settings:
+                self.random.seed(settings["seed"])
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="mock-openai", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _count(self, name, amount=1):
+        with self.lock:
+            self.stats[name] += amount
+
+    def plan_request(self):
+        """Draws this request's outcome ("ok", "429", "500" or "timeout") and first-token latency in seconds."""
+        with self.lock:
+            settings = dict(self.settings)
+            draw = self.random.random()
+            latency = settings["latency_ms"]
+            if settings["distribution"] == "uniform":
+                latency += self.random.uniform(-settings["jitter_ms"], settings["jitter_ms"])
+            elif settings["distribution"] == "lognormal" and latency > 0:
+                latency = self.random.lognormvariate(math.log(latency), settings["sigma"])
+        outcome = "ok"
+        for name, rate in [("429", settings["error_429_rate"]), ("500", settings["error_500_rate"]), ("timeout", settings["timeout_rate"])]:
+            if draw < rate:
+                outcome = name
+                break
+            draw -= rate
+        return outcome, max(latency, 0.0) / 1000, settings
+
+    def malformed(self):
+        """Whether this function-call reply should be cut short (invalid JSON), per malformed_rate."""
+        with self.lock:
+            return self.random.random() < self.settings["malformed_rate"]
+
+    def summary(self):
+        with self.lock:
+            return dict(self.stats)
+
+def _handler(server):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status, body, headers=None):
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            if self.path.rstrip("/").endswith("/models"):
+                self._send_json(200, {"object": "list", "data": [{"id": "gpt-4", "object": "model"}, {"id": "gpt-3.5-turbo", "object": "model"}]})
+            else:
+                self._send_json(404, _error_body(404, f"Unknown path {self.path}", "invalid_request_error"))
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            try:
+                request = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError:
+                self._send_json(400, _error_body(400, "Request body is not valid JSON", "invalid_request_error"))
+                return
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send_json(404, _error_body(404, f"Unknown path {self.path}", "invalid_request_error"))
+                return
+
+            server._count("requests")
+            outcome, latency, settings = server.plan_request()
+            if outcome == "429":
+                server._count("errors_429")
+                self._send_json(429, _error_body(429, "Rate limit reached (mock)", "rate_limit_exceeded"), {"Retry-After": str(settings["retry_after"])})
+                return
+            if outcome == "500":
+                server._count("errors_500")
+                self._send_json(500, _error_body(500, "The server had an error (mock)", "server_error"))
+                return
+            if outcome == "timeout":
+                server._count("timeouts")
+                time.sleep(settings["hang_seconds"])
+                self.close_connection = True
+                return
+
+            messages = request.get("messages") or [{}]
+            prompt = "\n".join(str(message.get("content", "")) for message in messages)
+            tools = request.get("tools")
+            if tools:
+                # Forced function call (the combined review): the JSON arguments stand in for the content.
+                content = json.dumps(canned_review(messages[-1].get("content", "") or "", settings))
+                if server.malformed():
+                    content = content[:len(content) // 2]
+                prompt += "\n" + json.dumps(tools)
+            else:
+                content = canned_reply(messages[-1].get("content", "") or "", settings)
+            model = request.get("model", "gpt-4")
+            usage = {
+                "prompt_tokens": count_tokens(prompt, model),
+                "completion_tokens": count_tokens(content, model),
+            }
+            usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+            server._count("completion_tokens", usage["completion_tokens"])
+            time.sleep(latency)
+            if request.get("stream"):
+                server._count("streamed")
+                self._stream(request, model, content, usage, settings)
+                return
+            if settings["tokens_per_second"] > 0:
+                time.sleep(usage["completion_tokens"] / settings["tokens_per_second"])
+            self._send_json(200, {
+                "id": f"chatcmpl-mock-{uuid.uuid4().hex[:12]}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": _message(content, tools), "finish_reason": "tool_calls" if tools else "stop"}],
+                "usage": usage,
+            })
+
+        def _stream(self, request, model, content, usage, settings):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+            chunk_id = f"chatcmpl-mock-{uuid.uuid4().hex[:12]}"
+
+            def event(choices, chunk_usage=None):
+                body = {"id": chunk_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model, "choices": choices}
+                if chunk_usage is not None:
+                    body["usage"] = chunk_usage
+                self.wfile.write(b"data: " + json.dumps(body).encode("utf-8") + b"\n\n")
+                self.wfile.flush()
+
+            # Words (with their trailing whitespace) approximate tokens closely enough for pacing.
+            pieces = re.findall(r"\S+\s*|\s+", content)
+            delay = usage["completion_tokens"] / settings["tokens_per_second"] / max(len(pieces), 1) if settings["tokens_per_second"] > 0 else 0
+            try:
+                event([{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}])
+                for piece in pieces:
+                    time.sleep(delay)
+                    event([{"index": 0, "delta": {"content": piece}, "finish_reason": None}])
+                event([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+                if (request.get("stream_options") or {}).get("include_usage"):
+                    event([], usage)
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+    return Handler
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the OpenAI chat-completions endpoint.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency-ms", type=float, default=DEFAULT_MOCK_SETTINGS["latency_ms"], help="Median time to first token")
+    parser.add_argument("--jitter-ms", type=float, default=DEFAULT_MOCK_SETTINGS["jitter_ms"], help="Spread for --distribution uniform")
+    parser.add_argument("--distribution", default=DEFAULT_MOCK_SETTINGS["distribution"], choices=["fixed", "uniform", "lognormal"])
+    parser.add_argument("--sigma", type=float, default=DEFAULT_MOCK_SETTINGS["sigma"], help="Spread for --distribution lognormal")
+    parser.add_argument("--tokens-per-second", type=float, default=DEFAULT_MOCK_SETTINGS["tokens_per_second"], help="Completion speed (0: instant)")
+    parser.add_argument("--error-429", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--error-500", type=float, default=0.0, help="Fraction of requests answered with 500")
+    parser.add_argument("--timeouts", type=float, default=0.0, help="Fraction of requests that hang for --hang-seconds")
+    parser.add_argument("--hang-seconds", type=float, default=DEFAULT_MOCK_SETTINGS["hang_seconds"])
+    parser.add_argument("--safety-verdict", default="Yes", choices=["Yes", "No", "Uncertain"])
+    parser.add_argument("--malformed", type=float, default=0.0, help="Fraction of function-call replies cut short (invalid JSON)")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    server = MockServer(
+        args.host, args.port,
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, distribution=args.distribution, sigma=args.sigma,
+        tokens_per_second=args.tokens_per_second, error_429_rate=args.error_429, error_500_rate=args.error_500,
+        timeout_rate=args.timeouts, hang_seconds=args.hang_seconds, safety_verdict=args.safety_verdict,
+        malformed_rate=args.malformed, seed=args.seed,
+    )
+    print(f"Mock OpenAI endpoint on {server.url} (set OPENAI_BASE_URL to this)")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+        print(json.dumps(server.summary(), indent=2))
+
+if __name__ == "__main__":
+    main()
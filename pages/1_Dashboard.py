@@ -0,0 +1,48 @@
+import streamlit as st
+from summary_store import GROUP_COLUMNS, get_summary_store
+
+st.set_page_config(page_title="Summary Dashboard", layout="wide")
+st.title("📊 Summaries and Evaluations")
+
+store = get_summary_store()
+counts = store.summary()
+if not counts["summaries"] and not counts["evaluations"]:
+    st.info("Nothing stored yet. Generate a summary in the main page, or back-fill from old logs with `python migrate_logs.py`.")
+    st.stop()
+
+with st.sidebar:
+    st.header("🔎 Filters")
+    model = st.selectbox("Model", ["All"] + store.distinct("model"))
+    diagnosis = st.text_input("Diagnosis contains", placeholder="e.g. pneumonia")
+    view = st.selectbox("Evaluated view", ["All", "deidentified", "identified"])
+    group_by = st.multiselect("Group by", [c for c in GROUP_COLUMNS if c not in ("patient_id", "verdict")], default=["model"])
+
+filters = {
+    "model": None if model == "All" else model,
+    "diagnosis": diagnosis.strip() or None,
+}
+
+col1, col2 = st.columns(2)
+col1.metric("Stored summaries", counts["summaries"])
+col2.metric("Evaluations", counts["evaluations"])
+
+st.subheader("✅ Average ratings (1-5)")
+ratings = store.rating_averages(tuple(group_by), **filters, view=None if view == "All" else view)
+if ratings and ratings[0]["evaluations"]:
+    st.dataframe(ratings, hide_index=True)
+else:
+    st.caption("No evaluations match these filters.")
+
+st.subheader("🛡️ Post-generation safety verdicts")
+verdicts = store.verdict_counts(tuple(c for c in group_by if c != "view"), **filters)
+if verdicts and verdicts[0]["summaries"]:
+    st.dataframe(verdicts, hide_index=True)
+else:
+    st.caption("No summaries match these filters.")
+
+st.subheader("🗂️ Recent summaries")
+for row in store.recent_summaries(20, **filters):
+    title = f"{row['created']} · {row['filename']} · {row['model'] or 'model unknown'} · verdict {row['verdict'] or '?'}"
+    with st.expander(title):
+        st.caption(row["diagnosis"] or "Diagnosis unknown")
+        st.markdown(row["summary"] or "")
@@ -0,0 +1,49 @@
+import re
+
+def _normalize(phrase, any_space):
+    phrase = phrase.lower()
+    return " ".join(phrase.split()) if any_space else phrase
+
+def _atom(char, any_space):
+    return r"\s+" if any_space and char == " " else re.escape(char)
+
+def _trie_pattern(node, any_space):
+    # Shared prefixes become one branch, so the regex engine tries a single path per character instead of
+    # every phrase at every position (the regex equivalent of an Aho-Corasick trie). A phrase ending here makes
+    # the rest optional; greedy `?` prefers the longest phrase and backtracks to a shorter one when the longer
+    # match fails the caller's boundary check.
+    branches = [_atom(char, any_space) + _trie_pattern(child, any_space) for char, child in sorted(node.items()) if char]
+    if not branches:
+        return ""
+    body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+    return f"(?:{body})?" if "" in node else body
+
+def phrase_pattern(phrases, any_space=False):
+    """
+    Regex source matching any of the phrases (lowercased), as a trie so hundreds of phrases cost about as much
+    as one; at one position the longest phrase wins. With any_space, runs of whitespace in a phrase match any
+    whitespace. Empty string for no phrases.
+    """
+    trie = {}
+    for phrase in phrases:
+        node = trie
+        for char in _normalize(phrase, any_space):
+            node = node.setdefault(char, {})
+        node[""] = {}
+    return _trie_pattern(trie, any_space)
+
+def plain_pattern(phrases, any_space=False):
+    """phrase_pattern as a flat alternation, longest first so it still wins at one position."""
+    phrases = sorted({_normalize(phrase, any_space) for phrase in phrases}, key=lambda p: (-len(p), p))
+    return "|".join("".join(_atom(char, any_space) for char in phrase) for phrase in phrases)
+
+def compile_phrase_regex(build):
+    """
+    re.compile(build(phrase_pattern)), where build makes the regex source from a phrase-pattern function.
+    The trie recurses once per character, so a phrase of a few hundred characters raises RecursionError
+    (building it or in the regex parser); the regex is then built with plain_pattern instead.
+    """
+    try:
+        return re.compile(build(phrase_pattern))
+    except (RecursionError, re.error):
+        return re.compile(build(plain_pattern))
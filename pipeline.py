@@ -0,0 +1,195 @@
+import asyncio
+import logging
+from instrumentation import stage, start_trace
+from summary_generator import (
+    load_patient_data,
+    get_discharge_summary_async,
+    update_discharge_summary_async,
+    extract_highlights_async,
+    validate_discharge_safety_async,
+    review_summary_async,
+    parse_safety_verdict,
+    close_async_clients,
+)
+from incremental import plan_regeneration, save_outputs
+from local_highlights import LOCAL_HIGHLIGHT_THRESHOLD, extract_local_highlights
+from utils import is_safe_for_discharge, redact_pii, insert_pii
+
+DEFAULT_SYSTEM_PROMPT = "Write a clear and complete discharge summary in paragraph form for the patient described in this data. Do not use bullet points."
+
+# Per-stage timeouts in seconds. Stages that only decorate the summary fall back instead of failing.
+STAGE_TIMEOUTS = {
+    "safety_pre": 90,
+    "summary": 180,
+    "highlights": 90,
+    "safety_post": 90,
+    "review": 120,
+}
+
+def build_instruction(additional_prompt=""):
+    """Combines the default system prompt with an optional user instruction, as sent to the LLM."""
+    combined_prompt = DEFAULT_SYSTEM_PROMPT
+    if additional_prompt.strip():
+        combined_prompt += f"\n\n{additional_prompt.strip()}"
+    return combined_prompt
+
+def _timed(timings, name, func, *args, **kwargs):
+    span = {}
+    try:
+        with stage(name) as span:
+            return func(*args, **kwargs)
+    finally:
+        timings[name] = span.get("wall_seconds")
+
+async def _timed_async(timings, name, coro, timeouts, **attrs):
+    span = {}
+    try:
+        with stage(name, **attrs) as span:
+            return await asyncio.wait_for(coro, timeouts.get(name))
+    finally:
+        timings[name] = span.get("wall_seconds")
+
+async def _reuse(value):
+    return value
+
+def _stage_call(plan, name, make_call):
+    """The stored result for a stage when the regeneration plan allows reusing it, otherwise the LLM call."""
+    if plan and plan.get(name) is not None:
+        return _reuse(plan[name]), {"reused": True}
+    return make_call(), {}
+
+async def run_post_generation_async(summary_redacted, patient_data, api_key, timings=None, timeouts=None, plan=None, combined=True):
+    """
+    Runs the stages that depend only on the generated summary. Highlights are first extracted locally from the
+    record's own phrases; when those cover enough (LOCAL_HIGHLIGHT_THRESHOLD), only the safety check is sent.
+    Otherwise, with combined=True, highlights and the safety check come from one structured "review" call
+    (falling back to the separate calls if its reply stays invalid); with combined=False the two calls run concurrently.
+    With a regeneration plan (incremental.plan_regeneration) for an unchanged summary, stored results are reused.
+    Returns (summary_with_pii, highlights, safety_post).
+    """
+    timings = {} if timings is None else timings
+    timeouts = {**STAGE_TIMEOUTS, **(timeouts or {})}
+
+    summary_with_pii = _timed(timings, "insert_pii", insert_pii, summary_redacted, patient_data)
+    local, confidence = _timed(timings, "local_highlights", extract_local_highlights, summary_redacted, patient_data)
+    use_local = confidence >= LOCAL_HIGHLIGHT_THRESHOLD and not (plan and plan.get("highlights") is not None)
+    reusable = plan and (plan.get("highlights") is not None or plan.get("safety_post") is not None)
+    if combined and not reusable and not use_local:
+        try:
+            review = await _timed_async(timings, "review", review_summary_async(summary_redacted, api_key), timeouts)
+            return summary_with_pii, review["highlights"], review["safety"]
+        except asyncio.TimeoutError:
+            logging.error(f"Combined highlights and safety review timed out after {timeouts['review']}s")
+            return summary_with_pii, [], f"Safety validation timed out after {timeouts['review']} seconds. Please review manually."
+        except ValueError as e:
+            logging.error(f"Combined review failed, using separate highlight and safety calls: {e}")
+
+    if use_local:
+        highlights_call, highlights_attrs = _reuse(local), {"local": True, "confidence": round(confidence, 2)}
+    else:
+        highlights_call, highlights_attrs = _stage_call(plan, "highlights", lambda: extract_highlights_async(summary_redacted, api_key))
+    safety_call, safety_attrs = _stage_call(plan, "safety_post", lambda: validate_discharge_safety_async(summary_redacted, api_key))
+    highlights, safety_post = await asyncio.gather(
+        _timed_async(timings, "highlights", highlights_call, timeouts, **highlights_attrs),
+        _timed_async(timings, "safety_post", safety_call, timeouts, **safety_attrs),
+        return_exceptions=True,
+    )
+
+    if isinstance(highlights, asyncio.TimeoutError):
+        logging.error(f"Highlight extraction timed out after {timeouts['highlights']}s")
+        highlights = []
+    elif isinstance(highlights, BaseException):
+        raise highlights
+
+    if isinstance(safety_post, asyncio.TimeoutError):
+        logging.error(f"Post-generation safety check timed out after {timeouts['safety_post']}s")
+        safety_post = f"Safety validation timed out after {timeouts['safety_post']} seconds. Please review manually."
+    elif isinstance(safety_post, BaseException):
+        raise safety_post
+
+    return summary_with_pii, highlights, safety_post
+
+async def run_pipeline_async(filepath, api_key, model="gpt-4", additional_prompt="", allow_override=False, timeouts=None, incremental=True, combined_review=True):
+    """
+    Runs the full generation pipeline for one patient record without any UI.
+    Stops early (status "blocked" or "flagged") where app.py would stop and wait for the user.
+    With incremental=True, results stored for an unchanged record are reused and a record with only new
+    notes/results gets a narrow summary update (see incremental.py); result["summary_mode"] says which.
+    combined_review=False sends the highlight and safety calls separately (see run_post_generation_async).
+    """
+    timings = {}
+    start_trace("pipeline")
+    patient_data = _timed(timings, "load", load_patient_data, filepath)
+    return await _run_loaded_async(
+        patient_data, filepath, timings, api_key, model, additional_prompt, allow_override, timeouts, incremental, combined_review
+    )
+
+async def run_record_async(patient_data, api_key, model="gpt-4", additional_prompt="", allow_override=False, timeouts=None, incremental=True, combined_review=True, source=""):
+    """Same as run_pipeline_async for a record already in memory (e.g. one posted to service.py); source names it in the result."""
+    start_trace("pipeline")
+    return await _run_loaded_async(
+        patient_data, source, {}, api_key, model, additional_prompt, allow_override, timeouts, incremental, combined_review
+    )
+
+async def _run_loaded_async(patient_data, source, timings, api_key, model, additional_prompt, allow_override, timeouts, incremental, combined_review):
+    timeouts = {**STAGE_TIMEOUTS, **(timeouts or {})}
+    result = {"file": source, "model": model, "status": "", "timings": timings}
+
+    redacted_data = _timed(timings, "redact", redact_pii, patient_data)
+    result["patient_id"] = patient_data.get("patient_id", "")
+
+    if not _timed(timings, "keyword_screen", is_safe_for_discharge, patient_data):
+        result["status"] = "blocked"
+        return result
+
+    instruction = build_instruction(additional_prompt)
+    plan = _timed(timings, "plan", plan_regeneration, redacted_data, model, instruction) if incremental else None
+
+    safety_call, safety_attrs = _stage_call(plan, "safety_pre", lambda: validate_discharge_safety_async(redacted_data, api_key))
+    safety_pre = await _timed_async(timings, "safety_pre", safety_call, timeouts, **safety_attrs)
+    verdict = parse_safety_verdict(safety_pre)
+    result["safety_pre"] = safety_pre
+    result["verdict_pre"] = verdict
+    if plan:
+        save_outputs(plan, safety_pre=safety_pre)
+    if verdict is None or (verdict in ["No", "Uncertain"] and not allow_override):
+        result["status"] = "flagged"
+        return result
+
+    summary_mode = plan["summary_mode"] if plan else "full"
+    if summary_mode == "reuse":
+        summary_call = _reuse(plan["summary"])
+    elif summary_mode == "update":
+        summary_call = update_discharge_summary_async(plan["summary"], plan["new_entries"], api_key, model=model, additional_instruction=instruction)
+    else:
+        summary_call = get_discharge_summary_async(redacted_data, api_key, few_shot=True, model=model, additional_instruction=instruction)
+    summary_redacted = await _timed_async(timings, "summary", summary_call, timeouts, mode=summary_mode)
+    summary_with_pii, highlights, safety_post = await run_post_generation_async(
+        summary_redacted, patient_data, api_key, timings, timeouts, plan if summary_mode == "reuse" else None, combined_review
+    )
+    if plan:
+        save_outputs(plan, summary=summary_redacted, highlights=highlights, safety_post=safety_post)
+
+    result.update({
+        "status": "done",
+        "summary_mode": summary_mode,
+        "summary_redacted": summary_redacted,
+        "summary_with_pii": summary_with_pii,
+        "highlights": highlights,
+        "safety_post": safety_post,
+        "verdict_post": parse_safety_verdict(safety_post),
+    })
+    return result
+
+def run_async(coro):
+    """Runs a coroutine on a fresh event loop from synchronous code, closing the pooled async clients it opened."""
+    async def runner():
+        try:
+            return await coro
+        finally:
+            await close_async_clients()
+    return asyncio.run(runner())
+
+def run_pipeline(filepath, api_key, model="gpt-4", additional_prompt="", allow_override=False, timeouts=None, incremental=True, combined_review=True):
+    """Synchronous wrapper around run_pipeline_async."""
+    return run_async(run_pipeline_async(filepath, api_key, model, additional_prompt, allow_override, timeouts, incremental, combined_review))
@@ -0,0 +1,44 @@
+import re
+from string import ascii_letters
+
+PLACEHOLDERS = [
+    "REDACTED_NAME", "REDACTED_AGE", "REDACTED_GENDER",
+    "REDACTED_ADMIT_DATE", "REDACTED_DISCHARGE_DATE", "REDACTED_DOCTOR"
+]
+
+# One alternation for every placeholder, longest first, compiled once at import.
+PLACEHOLDER_PATTERN = re.compile("|".join(re.escape(ph) for ph in sorted(PLACEHOLDERS, key=len, reverse=True)))
+
+_letters = frozenset(ascii_letters)
+
+def substitute(text, replacements=None, fix_spacing=True):
+    """
+    Single pass over text that handles every placeholder occurrence at once:
+    - fix_spacing: puts back the space the model sometimes drops next to a placeholder ("REDACTED_NAMEis")
+    - replacements: swaps placeholders for real values; inserted values are never re-scanned,
+      so a name that itself contains a placeholder token cannot cascade.
+    """
+    if not fix_spacing:
+        if not replacements:
+            return text
+        return PLACEHOLDER_PATTERN.sub(lambda m: replacements.get(m.group(), m.group()), text)
+
+    parts = []
+    last_end = 0
+    for match in PLACEHOLDER_PATTERN.finditer(text):
+        start, end = match.span()
+        parts.append(text[last_end:start])
+        placeholder = match.group()
+        # A run of adjacent placeholders gets one space between them (added after the first).
+        if start > 0 and start != last_end and text[start - 1] in _letters:
+            parts.append(" ")
+        parts.append(replacements.get(placeholder, placeholder) if replacements else placeholder)
+        if end < len(text) and text[end] in _letters:
+            parts.append(" ")
+        last_end = end
+    parts.append(text[last_end:])
+    return "".join(parts)
+
+def fix_placeholder_spacing(text):
+    """Re-inserts the spaces the model sometimes drops around placeholders (e.g. "REDACTED_NAMEis")."""
+    return substitute(text)
@@ -0,0 +1,115 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from instrumentation import annotate, stage
+from scheduler import priority
+
+class Prefetch:
+    """One speculative call: its key (what it was computed for), future, and when it started and finished running."""
+
+    def __init__(self, name, key):
+        self.name = name
+        self.key = key
+        self.future = None
+        self.started = None
+        self.finished = None
+        self.consumed = False
+
+class Prefetcher:
+    """
+    Starts LLM calls speculatively on a shared thread pool, before the user asks for them (e.g. the pre-generation
+    safety check as soon as a record is selected). Each Streamlit session keeps its Prefetch handles in a dict in
+    session state; sync() starts missing ones and cancels or discards those whose key no longer matches.
+    Prefetched calls run at "batch" priority, so they never hold up a call a user is waiting for.
+    """
+
+    def __init__(self, max_workers=4):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+        self.lock = threading.Lock()
+        self.stats = {"started": 0, "used": 0, "cancelled": 0, "discarded": 0, "failed": 0, "saved_seconds": 0.0}
+
+    def start(self, name, key, func, *args, **kwargs):
+        prefetch = Prefetch(name, key)
+
+        def run():
+            prefetch.started = time.perf_counter()
+            try:
+                with priority("batch"), stage(f"prefetch_{name}"):
+                    return func(*args, **kwargs)
+            finally:
+                prefetch.finished = time.perf_counter()
+
+        prefetch.future = self.executor.submit(run)
+        with self.lock:
+            self.stats["started"] += 1
+        return prefetch
+
+    def discard(self, prefetch):
+        """Cancels a call that has not started yet; a running one finishes in the background and its result is dropped."""
+        cancelled = prefetch.future.cancel()
+        with self.lock:
+            if cancelled:
+                self.stats["cancelled"] += 1
+            elif not prefetch.consumed:
+                self.stats["discarded"] += 1
+
+    def sync(self, prefetches, wanted):
+        """
+        Makes prefetches ({name: Prefetch}, kept in session state) match wanted ({name: (key, func, args, kwargs)}):
+        handles whose key changed or that are no longer wanted are discarded, missing ones are started.
+        """
+        for name in list(prefetches):
+            if name not in wanted or prefetches[name].key != wanted[name][0]:
+                self.discard(prefetches.pop(name))
+        for name, (key, func, args, kwargs) in wanted.items():
+            if name not in prefetches:
+                prefetches[name] = self.start(name, key, func, *args, **kwargs)
+        return prefetches
+
+    def get(self, prefetches, name, key):
+        """The prefetch for name if it was started for this key, else None."""
+        prefetch = prefetches.get(name)
+        return prefetch if prefetch is not None and prefetch.key == key else None
+
+    def consume(self, prefetch, timeout=None):
+        """
+        Waits for the prefetched result (None if the call failed, so the caller makes it itself) and records on the
+        running stage how many seconds of the call had already run before it was needed.
+        """
+        asked = time.perf_counter()
+        try:
+            result = prefetch.future.result(timeout)
+        except Exception as e:
+            logging.warning(f"Prefetched {prefetch.name} failed: {e}")
+            with self.lock:
+                if not prefetch.consumed:
+                    self.stats["failed"] += 1
+                prefetch.consumed = True
+            annotate(prefetched="failed")
+            return None
+        saved = max(min(prefetch.finished, asked) - prefetch.started, 0.0)
+        annotate(prefetched=True, prefetch_saved_seconds=round(saved, 4))
+        with self.lock:
+            if not prefetch.consumed:
+                self.stats["used"] += 1
+                self.stats["saved_seconds"] += saved
+            prefetch.consumed = True
+        return result
+
+    def summary(self):
+        with self.lock:
+            stats = dict(self.stats)
+        stats["saved_seconds"] = round(stats["saved_seconds"], 2)
+        return stats
+
+_prefetcher = None
+_prefetcher_lock = threading.Lock()
+
+def get_prefetcher():
+    """Process-wide prefetch pool shared by all Streamlit sessions."""
+    global _prefetcher
+    with _prefetcher_lock:
+        if _prefetcher is None:
+            _prefetcher = Prefetcher()
+        return _prefetcher
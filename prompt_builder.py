@@ -0,0 +1,182 @@
+import re
+
+try:
+    import tiktoken
+except ImportError:  # optional: fall back to a character-based estimate
+    tiktoken = None
+
+try:
+    from vitals import trend_lines
+except ImportError:  # NumPy not installed: fall back to the string series below
+    trend_lines = None
+
+# Prompt token budgets per model: the context window minus room for the completion.
+MODEL_PROMPT_BUDGETS = {
+    "gpt-4": 6000,
+    "gpt-4-turbo": 100000,
+    "gpt-4o": 100000,
+    "gpt-4o-mini": 100000,
+    "gpt-3.5-turbo": 12000,
+}
+DEFAULT_PROMPT_BUDGET = 6000
+
+_encodings = {}
+_word_pattern = re.compile(r"\w+|[^\w\s]")
+
+def count_tokens(text, model="gpt-4"):
+    """Counts prompt tokens offline: tiktoken when it is installed and its encoding is cached, otherwise an estimate."""
+    if tiktoken is not None:
+        encoding = _encodings.get(model)
+        if encoding is None:
+            try:
+                encoding = tiktoken.encoding_for_model(model)
+            except Exception:
+                encoding = False
+            _encodings[model] = encoding
+        if encoding:
+            return len(encoding.encode(text))
+    # Roughly one token per word or punctuation mark, plus one per six characters of long words and codes.
+    return sum(1 + len(w) // 6 for w in _word_pattern.findall(text))
+
+def prompt_budget(model):
+    return MODEL_PROMPT_BUDGETS.get(model, DEFAULT_PROMPT_BUDGET)
+
+def _terms(text):
+    return {w for w in re.findall(r"[a-z]{3,}", text.lower())}
+
+def select_examples(examples, query, limit):
+    """Returns up to `limit` examples, most relevant first, by word overlap with the query (e.g. the diagnoses)."""
+    query_terms = _terms(query)
+    scored = sorted(
+        enumerate(examples),
+        key=lambda item: (-len(query_terms & _terms(item[1])), item[0]),
+    )
+    return [example for _, example in scored[:limit]]
+
+def select_safety_examples(examples, query, limit):
+    """Like select_examples, but always keeps at least one "Yes" and one "No" example when limit allows."""
+    ranked = select_examples(examples, query, len(examples))
+    chosen = []
+    if limit >= 2:
+        chosen = [next(e for e in ranked if answer in e) for answer in ["Answer: Yes", "Answer: No"]]
+    for example in ranked:
+        if len(chosen) >= limit:
+            break
+        if example not in chosen:
+            chosen.append(example)
+    # Keep the original order so the examples read the same way as in the full prompt.
+    return [e for e in examples if e in chosen]
+
+def dedupe_notes(notes):
+    """Drops notes whose text repeats an earlier note (ignoring case and whitespace), keeping the first."""
+    seen = set()
+    unique = []
+    for note in notes:
+        text = note.get("content", note.get("note", ""))
+        key = " ".join(text.lower().split())
+        if key in seen:
+            continue
+        seen.add(key)
+        unique.append(note)
+    return unique
+
+def format_notes(notes):
+    return "\n".join([
+        f"{n.get('date', '')}: {n.get('content', n.get('note', ''))}"
+        for n in notes
+    ])
+
+def format_meds(med_orders, dedupe=False):
+    """One line per order; with dedupe=True, orders repeated on later days are listed once."""
+    lines = [f"{m['medication']} {m['dose']} ({m.get('frequency', 'N/A')})" for m in med_orders]
+    if dedupe:
+        lines = list(dict.fromkeys(lines))
+    return "\n".join(lines)
+
+def condense_notes(notes, keep_recent):
+    """Keeps the first (admission) note and the most recent ones, with a marker for what was left out."""
+    if len(notes) <= keep_recent + 1:
+        return format_notes(notes)
+    omitted = len(notes) - keep_recent - 1
+    return (
+        format_notes(notes[:1])
+        + f"\n[{omitted} intermediate notes omitted]\n"
+        + format_notes(notes[-keep_recent:])
+    )
+
+def _series(values):
+    """Collapses consecutive repeats: ["60 mg/L", "60 mg/L", "20 mg/L"] -> "60 mg/L -> 20 mg/L"."""
+    collapsed = []
+    for value in values:
+        if not collapsed or collapsed[-1] != value:
+            collapsed.append(value)
+    if len(collapsed) > 4:
+        collapsed = collapsed[:2] + ["..."] + collapsed[-2:]
+    return " -> ".join(collapsed)
+
+def lab_trends(data, exclude=()):
+    series = {}
+    dates = {}
+    for entry in data.get("labs", []):
+        for test in entry.get("tests", []):
+            if test["name"] in exclude:
+                continue
+            series.setdefault(test["name"], []).append(str(test.get("result", "")))
+            dates.setdefault(test["name"], []).append(entry.get("date", ""))
+    return [
+        f"{name}: {_series(values)} ({dates[name][0]} to {dates[name][-1]})" if len(values) > 1
+        else f"{name}: {values[0]} ({dates[name][0]})"
+        for name, values in series.items()
+    ]
+
+def vital_trends(data, exclude=()):
+    series = {}
+    for row in data.get("flowsheets", []):
+        for field, value in row.items():
+            if field in ("date", "time") or field in exclude:
+                continue
+            series.setdefault(field, []).append(str(value))
+    return [f"{field.replace('_', ' ').capitalize()}: {_series(values)}" for field, values in series.items()]
+
+def condense_trends(data):
+    """
+    Compact lab and vital trend lines, one per test or vital sign. Numeric results are parsed and summarized
+    by vitals.trend_lines (first -> last, range, slope, fever and SpO2 course); free-text results keep the string series.
+    """
+    if trend_lines is None:
+        return "\n".join(lab_trends(data) + vital_trends(data))
+    lines, covered = trend_lines(data)
+    return "\n".join(lines + lab_trends(data, covered) + vital_trends(data, covered))
+
+# Sections rendered explicitly (or deliberately left out) by format_record.
+_RECORD_SKIP = {"patient_id", "patient_demographics", "patient", "diagnoses", "med_orders", "notes", "ward_round_notes", "labs", "flowsheets"}
+
+def format_record(data):
+    """
+    Compact plain-text rendering of a (redacted) record for the pre-generation safety check,
+    in place of the Python repr of the whole dict.
+    """
+    lines = [
+        f"Admission Date: {data.get('admit_date', data.get('patient_demographics', {}).get('admission_date', ''))}",
+        "Diagnosis: " + ", ".join(f"{d['description']} ({d.get('diagnosis_code', '')})" for d in data.get("diagnoses", [])),
+        "",
+        "Clinical Notes:",
+        format_notes(dedupe_notes(data.get("notes", []) + data.get("ward_round_notes", []))),
+        "",
+        "Medications:",
+        format_meds(data.get("med_orders", []), dedupe=True),
+    ]
+    trends = condense_trends(data)
+    if trends:
+        lines += ["", "Lab and Vital Trends:", trends]
+    for section, value in data.items():
+        if section in _RECORD_SKIP or not value:
+            continue
+        entries = value if isinstance(value, list) else [value]
+        lines += ["", f"{section.replace('_', ' ').capitalize()}:"]
+        for entry in entries:
+            if isinstance(entry, dict):
+                lines.append("; ".join(f"{k}: {v}" for k, v in entry.items()))
+            else:
+                lines.append(str(entry))
+    return "\n".join(lines).strip()
@@ -0,0 +1,90 @@
+import os
+import threading
+from collections import OrderedDict
+from instrumentation import annotate, stage
+from summary_generator import load_patient_data
+from utils import is_safe_for_discharge, redact_pii
+
+class RecordCache:
+    """
+    LRU cache of parsed patient records, keyed by path and invalidated when the file's mtime or size changes.
+    Each entry holds the parsed record, its redacted view and the keyword pre-screen result.
+    Entries are shared across Streamlit sessions, so callers must not mutate them.
+    """
+
+    def __init__(self, max_entries=32):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.listings = {}
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0, "evictions": 0}
+
+    def get(self, path):
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is not None and entry["signature"] == signature:
+                self.entries.move_to_end(path)
+                self.stats["hits"] += 1
+                annotate(cache="hit")
+                return entry
+            if entry is not None:
+                self.stats["invalidations"] += 1
+            self.stats["misses"] += 1
+        annotate(cache="miss")
+
+        # Parse outside the lock so one large file does not block other sessions.
+        with stage("parse"):
+            patient_data = load_patient_data(path)
+        with stage("redact"):
+            redacted_data = redact_pii(patient_data)
+        with stage("keyword_screen"):
+            keyword_safe = is_safe_for_discharge(patient_data)
+        entry = {
+            "signature": signature,
+            "patient_data": patient_data,
+            "redacted_data": redacted_data,
+            "keyword_safe": keyword_safe,
+        }
+
+        with self.lock:
+            self.entries[path] = entry
+            self.entries.move_to_end(path)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.stats["evictions"] += 1
+        return entry
+
+    def list_json_files(self, directory):
+        """Sorted .json filenames in directory, re-listed only when the directory's mtime changes."""
+        mtime = os.stat(directory).st_mtime_ns
+        with self.lock:
+            cached = self.listings.get(directory)
+            if cached is not None and cached[0] == mtime:
+                return cached[1]
+        files = sorted(f for f in os.listdir(directory) if f.endswith(".json"))
+        with self.lock:
+            self.listings[directory] = (mtime, files)
+        return files
+
+    def summary(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats["entries"] = len(self.entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        return stats
+
+_record_cache = None
+_record_cache_lock = threading.Lock()
+
+def get_record_cache():
+    """Process-wide record cache shared by all Streamlit sessions."""
+    global _record_cache
+    with _record_cache_lock:
+        if _record_cache is None:
+            _record_cache = RecordCache()
+        return _record_cache
@@ -0,0 +1,366 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import zlib
+from datetime import datetime
+from ingest import is_bundle, iter_records, record_ref
+
+DEFAULT_RECORD_STORE_PATH = os.getenv("RECORD_STORE_PATH", "cache/records.sqlite")
+
+# Sections every normalized record has (empty when the source had none), so consumers can index them directly.
+CORE_SECTIONS = ("diagnoses", "med_orders", "notes", "labs")
+# Index columns a page can be ordered by; the two dates are bounded by since/until.
+PAGE_ORDERS = ("patient_id", "admission_date", "discharge_date")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    patient_id TEXT PRIMARY KEY,
+    source TEXT NOT NULL,
+    source_file TEXT NOT NULL,
+    admission_date TEXT,
+    discharge_date TEXT,
+    diagnosis_codes TEXT,
+    sections TEXT NOT NULL,
+    stored_bytes INTEGER NOT NULL,
+    ingested TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_records_admission ON records (admission_date, patient_id);
+CREATE INDEX IF NOT EXISTS idx_records_discharge ON records (discharge_date, patient_id);
+CREATE INDEX IF NOT EXISTS idx_records_source_file ON records (source_file);
+
+CREATE TABLE IF NOT EXISTS record_sections (
+    patient_id TEXT NOT NULL,
+    section TEXT NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (patient_id, section)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS record_diagnoses (
+    diagnosis_code TEXT NOT NULL,
+    patient_id TEXT NOT NULL,
+    PRIMARY KEY (diagnosis_code, patient_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS record_sources (
+    path TEXT PRIMARY KEY,
+    signature TEXT NOT NULL
+);
+"""
+
+def _now():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+def _note(note, default_type=None):
+    # One note shape: the text always under "content" (older records use "note").
+    normalized = {key: value for key, value in note.items() if key != "note"}
+    normalized["content"] = note.get("content") or note.get("note") or ""
+    if default_type and not normalized.get("note_type"):
+        normalized["note_type"] = default_type
+    return normalized
+
+def normalize_record(raw):
+    """
+    The canonical form of a patient record:
+      - demographics under "patient_demographics" (older records use "patient"), with admission_date and
+        discharge_date filled from top-level admit_date/discharge_date when only those are given
+      - ward_round_notes folded into "notes" (note_type "Ward round"), every note's text under "content"
+      - CORE_SECTIONS always present; other sections are kept as they are
+    The result is still a valid input for the pipeline and the app.
+    """
+    record = {"patient_id": str(raw.get("patient_id") or "")}
+    if not record["patient_id"]:
+        raise ValueError("record has no patient_id")
+    demographics = dict(raw.get("patient_demographics") or raw.get("patient") or {})
+    for key, alias in (("admission_date", "admit_date"), ("discharge_date", "discharge_date")):
+        if not demographics.get(key) and raw.get(alias):
+            demographics[key] = raw[alias]
+    record["patient_demographics"] = demographics
+    for section, value in raw.items():
+        if section not in ("patient_id", "patient_demographics", "patient", "notes", "ward_round_notes"):
+            record[section] = value
+    record["notes"] = [_note(n) for n in raw.get("notes") or []]
+    record["notes"] += [_note(n, "Ward round") for n in raw.get("ward_round_notes") or []]
+    for section in CORE_SECTIONS:
+        record.setdefault(section, [])
+    return record
+
+def index_fields(record):
+    """(admission_date, discharge_date, diagnosis codes) of a normalized record; the expected discharge date stands in for a missing one."""
+    demographics = record["patient_demographics"]
+    discharge = demographics.get("discharge_date") or demographics.get("expected_discharge_date")
+    codes = sorted({d["diagnosis_code"] for d in record["diagnoses"] if isinstance(d, dict) and d.get("diagnosis_code")})
+    return demographics.get("admission_date"), discharge, codes
+
+def encode_section(value):
+    return zlib.compress(json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+def decode_section(blob):
+    return json.loads(zlib.decompress(blob))
+
+def is_record_store_ref(ref):
+    return ".sqlite#" in ref
+
+def store_ref(store_path, patient_id):
+    """Reference to one stored record, usable wherever a record path is ("cache/records.sqlite#P001")."""
+    return f"{store_path}#{patient_id}"
+
+def split_store_ref(ref):
+    """("cache/records.sqlite", "P001") for a store reference."""
+    index = ref.index(".sqlite#") + len(".sqlite")
+    return ref[:index], ref[index + 1:]
+
+def source_files(source):
+    """The .json files and NDJSON bundles in a directory, or the single file given."""
+    if os.path.isdir(source):
+        return sorted(os.path.join(source, f) for f in os.listdir(source) if f.endswith(".json") or is_bundle(f))
+    return [source]
+
+class RecordStore:
+    """
+    SQLite store of normalized patient records (see normalize_record). Each top-level section is a separate
+    zlib-compressed JSON blob, so a lookup builds only the sections it asks for. The index on patient_id,
+    admission/discharge date and diagnosis code serves lookups and keyset-paged listings from B-tree
+    indexes, without opening any record.
+    """
+
+    def __init__(self, path=DEFAULT_RECORD_STORE_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+        self.conn.commit()
+
+    def _delete(self, where, params):
+        # Caller holds the lock.
+        ids = [row[0] for row in self.conn.execute(f"SELECT patient_id FROM records WHERE {where}", params)]
+        for patient_id in ids:
+            self.conn.execute("DELETE FROM record_sections WHERE patient_id = ?", (patient_id,))
+            self.conn.execute("DELETE FROM record_diagnoses WHERE patient_id = ?", (patient_id,))
+            self.conn.execute("DELETE FROM records WHERE patient_id = ?", (patient_id,))
+
+    def _owner(self, patient_id):
+        # Caller holds the lock. The file the stored record with this patient_id came from, or None.
+        row = self.conn.execute("SELECT source_file FROM records WHERE patient_id = ?", (patient_id,)).fetchone()
+        return row["source_file"] if row else None
+
+    def put(self, raw, source, source_file=None):
+        """
+        Normalizes and stores one record, replacing the stored record with the same patient_id from the same
+        source file. Returns the patient_id; ValueError if another file's record already has that patient_id.
+        """
+        record = normalize_record(raw)
+        admission, discharge, codes = index_fields(record)
+        blobs = {section: encode_section(value) for section, value in record.items() if section != "patient_id"}
+        source_file = source_file or source
+        with self.lock:
+            owner = self._owner(record["patient_id"])
+            if owner is not None and owner != source_file:
+                raise ValueError(f"patient_id {record['patient_id']} is already stored from {owner}")
+            self._put(record["patient_id"], source, source_file, admission, discharge, codes, blobs)
+            self.conn.commit()
+        return record["patient_id"]
+
+    def _put(self, patient_id, source, source_file, admission, discharge, codes, blobs):
+        # Caller holds the lock and commits.
+        self._delete("patient_id = ?", (patient_id,))
+        self.conn.execute(
+            "INSERT INTO records (patient_id, source, source_file, admission_date, discharge_date, diagnosis_codes, "
+            "sections, stored_bytes, ingested) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (patient_id, source, source_file, admission, discharge, ",".join(codes), json.dumps(sorted(blobs)),
+             sum(len(blob) for blob in blobs.values()), _now()),
+        )
+        self.conn.executemany(
+            "INSERT INTO record_sections (patient_id, section, data) VALUES (?, ?, ?)",
+            [(patient_id, section, blob) for section, blob in blobs.items()],
+        )
+        self.conn.executemany(
+            "INSERT INTO record_diagnoses (diagnosis_code, patient_id) VALUES (?, ?)",
+            [(code, patient_id) for code in codes],
+        )
+
+    def ingest(self, source):
+        """
+        Stores every record in source (a directory, a .json file or an NDJSON bundle). Files whose mtime and size
+        match the last ingest are skipped; a changed file replaces the records it held. A record whose patient_id
+        is already stored from another file (or earlier in the same bundle) is not stored: the first one ingested
+        is kept and the duplicate is reported under "errors". Returns counts and errors.
+        """
+        report = {"files": 0, "unchanged": 0, "records": 0, "errors": []}
+        for path in source_files(source):
+            stat = os.stat(path)
+            signature = f"{stat.st_mtime_ns}:{stat.st_size}"
+            with self.lock:
+                row = self.conn.execute("SELECT signature FROM record_sources WHERE path = ?", (path,)).fetchone()
+            if row and row["signature"] == signature:
+                report["unchanged"] += 1
+                continue
+            # Parse and compress outside the lock; one transaction per file.
+            prepared = []
+            try:
+                for i, raw in enumerate(iter_records(path)):
+                    ref = record_ref(path, i) if is_bundle(path) else path
+                    try:
+                        record = normalize_record(raw)
+                    except (ValueError, AttributeError, TypeError) as e:
+                        report["errors"].append({"source": ref, "error": str(e)})
+                        continue
+                    blobs = {section: encode_section(value) for section, value in record.items() if section != "patient_id"}
+                    prepared.append((record["patient_id"], ref, path, *index_fields(record), blobs))
+            except (OSError, ValueError) as e:
+                report["errors"].append({"source": path, "error": str(e)})
+                continue
+            stored = 0
+            with self.lock:
+                self._delete("source_file = ?", (path,))
+                for entry in prepared:
+                    patient_id, ref = entry[0], entry[1]
+                    owner = self._owner(patient_id)
+                    if owner is not None:
+                        report["errors"].append({"source": ref, "error": f"patient_id {patient_id} is already stored from {owner}"})
+                        continue
+                    self._put(*entry)
+                    stored += 1
+                # A file with duplicates is not marked as ingested, so the next ingest reports them again
+                # (and stores them once the other file no longer holds that patient_id).
+                self.conn.execute("DELETE FROM record_sources WHERE path = ?", (path,))
+                if stored == len(prepared):
+                    self.conn.execute("INSERT INTO record_sources (path, signature) VALUES (?, ?)", (path, signature))
+                self.conn.commit()
+            report["files"] += 1
+            report["records"] += stored
+        return report
+
+    def get(self, patient_id, sections=None):
+        """The normalized record, or only the given top-level sections of it; None if patient_id is not stored."""
+        sql = "SELECT section, data FROM record_sections WHERE patient_id = ?"
+        params = [patient_id]
+        if sections is not None:
+            wanted = [s for s in sections if s != "patient_id"]
+            sql += f" AND section IN ({', '.join('?' for _ in wanted)})" if wanted else " AND 0"
+            params += wanted
+        with self.lock:
+            exists = self.conn.execute("SELECT 1 FROM records WHERE patient_id = ?", (patient_id,)).fetchone()
+            rows = self.conn.execute(sql, params).fetchall()
+        if not exists:
+            return None
+        record = {"patient_id": patient_id}
+        record.update((row["section"], decode_section(row["data"])) for row in rows)
+        return record
+
+    def page(self, order="patient_id", after=None, limit=50, diagnosis_code=None, since=None, until=None):
+        """
+        One page of index rows in `order` (one of PAGE_ORDERS), starting after the cursor `after` (the second
+        value returned for the previous page). diagnosis_code keeps only records with that code; since/until
+        bound the order's date column (records without that date are left out of date-ordered pages).
+        Returns (rows, next cursor or None on the last page).
+        """
+        if order not in PAGE_ORDERS:
+            raise ValueError(f"order must be one of {PAGE_ORDERS}")
+        keys = ["r.patient_id"] if order == "patient_id" else [f"r.{order}", "r.patient_id"]
+        sql = "SELECT r.patient_id, r.source, r.admission_date, r.discharge_date, r.diagnosis_codes, r.stored_bytes FROM records r"
+        clauses, params = [], []
+        if diagnosis_code:
+            sql += " JOIN record_diagnoses d ON d.patient_id = r.patient_id AND d.diagnosis_code = ?"
+            params.append(diagnosis_code)
+        if order != "patient_id":
+            clauses.append(f"r.{order} IS NOT NULL")
+            if since:
+                clauses.append(f"r.{order} >= ?")
+                params.append(since)
+            if until:
+                clauses.append(f"r.{order} < ?")
+                params.append(until)
+        if after is not None:
+            after = [after] if isinstance(after, str) else list(after)
+            if len(after) != len(keys):
+                raise ValueError(f"cursor for order {order!r} needs {len(keys)} values")
+            clauses.append(f"({', '.join(keys)}) > ({', '.join('?' for _ in keys)})")
+            params += after
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += f" ORDER BY {', '.join(keys)} LIMIT ?"
+        params.append(limit + 1)
+        with self.lock:
+            rows = [dict(row) for row in self.conn.execute(sql, params)]
+        if len(rows) <= limit:
+            return rows, None
+        rows = rows[:limit]
+        last = rows[-1]
+        return rows, [last["patient_id"]] if order == "patient_id" else [last[order], last["patient_id"]]
+
+    def refs(self, **filters):
+        """store_ref for every record matching the page() filters, in patient_id order."""
+        refs, cursor = [], None
+        while True:
+            rows, cursor = self.page(after=cursor, limit=500, **filters)
+            refs += [store_ref(self.path, row["patient_id"]) for row in rows]
+            if cursor is None:
+                return refs
+
+    def summary(self):
+        with self.lock:
+            row = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(stored_bytes), 0) FROM records").fetchone()
+            sources = self.conn.execute("SELECT COUNT(*) FROM record_sources").fetchone()[0]
+        return {"records": row[0], "stored_bytes": row[1], "sources": sources}
+
+_record_stores = {}
+_record_stores_lock = threading.Lock()
+
+def get_record_store(path=DEFAULT_RECORD_STORE_PATH):
+    """Process-wide record store for path, shared by all callers."""
+    key = os.path.abspath(path)
+    with _record_stores_lock:
+        store = _record_stores.get(key)
+        if store is None:
+            store = _record_stores[key] = RecordStore(path)
+        return store
+
+def load_stored_record(ref, sections=None):
+    """The record a store_ref points to; ValueError if it is not stored."""
+    store_path, patient_id = split_store_ref(ref)
+    record = get_record_store(store_path).get(patient_id, sections)
+    if record is None:
+        raise ValueError(f"{store_path} has no record {patient_id}")
+    return record
+
+def main():
+    parser = argparse.ArgumentParser(description="Normalize patient records into an indexed SQLite store and query it.")
+    parser.add_argument("--store", default=DEFAULT_RECORD_STORE_PATH, help=f"SQLite store (default: {DEFAULT_RECORD_STORE_PATH})")
+    commands = parser.add_subparsers(dest="command", required=True)
+    ingest_parser = commands.add_parser("ingest", help="Store the records of a directory, .json file or NDJSON bundle")
+    ingest_parser.add_argument("source", nargs="?", default="data")
+    list_parser = commands.add_parser("list", help="Print one page of the index as JSON")
+    list_parser.add_argument("--order", default="patient_id", choices=PAGE_ORDERS)
+    list_parser.add_argument("--diagnosis", default=None, help="Only records with this diagnosis code")
+    list_parser.add_argument("--since", default=None, help="Lower bound (inclusive) on the --order date")
+    list_parser.add_argument("--until", default=None, help="Upper bound (exclusive) on the --order date")
+    list_parser.add_argument("--after", default=None, help="Cursor printed as \"next\" by the previous page (JSON)")
+    list_parser.add_argument("--limit", type=int, default=20)
+    show_parser = commands.add_parser("show", help="Print one normalized record as JSON")
+    show_parser.add_argument("patient_id")
+    show_parser.add_argument("--sections", default=None, help="Comma-separated top-level sections to print")
+    args = parser.parse_args()
+
+    store = RecordStore(args.store)
+    if args.command == "ingest":
+        report = store.ingest(args.source)
+        print(json.dumps({**report, "store": store.summary()}, indent=2))
+    elif args.command == "list":
+        after = json.loads(args.after) if args.after else None
+        rows, cursor = store.page(args.order, after, args.limit, args.diagnosis, args.since, args.until)
+        print(json.dumps({"records": rows, "next": cursor}, indent=2))
+    else:
+        record = store.get(args.patient_id, args.sections.split(",") if args.sections else None)
+        if record is None:
+            parser.error(f"{args.patient_id} is not in {args.store}")
+        print(json.dumps(record, indent=2, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
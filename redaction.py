@@ -0,0 +1,79 @@
+# Declarative PII rules: (path, placeholder). "a.b" walks dict keys; "a[].b" applies to every item of list a.
+# A rule only replaces fields that are present.
+PII_FIELD_PATHS = [
+    ("patient_demographics.name", "REDACTED_NAME"),
+    ("patient_demographics.gender", "REDACTED_GENDER"),
+    ("patient_demographics.age", "REDACTED_AGE"),
+    ("patient.name", "REDACTED_NAME"),
+    ("patient.gender", "REDACTED_GENDER"),
+    ("patient.age", "REDACTED_AGE"),
+    ("notes[].author", "REDACTED_DOCTOR"),
+    ("ward_round_notes[].author", "REDACTED_DOCTOR"),
+]
+
+def parse_path(path):
+    """"notes[].author" -> [("notes", True), ("author", False)]; True marks a list to iterate."""
+    steps = []
+    for part in path.split("."):
+        if part.endswith("[]"):
+            steps.append((part[:-2], True))
+        else:
+            steps.append((part, False))
+    return steps
+
+_parsed_rules = {}
+
+def _compiled(rules):
+    key = tuple(rules)
+    if key not in _parsed_rules:
+        _parsed_rules[key] = [(parse_path(path), placeholder) for path, placeholder in rules]
+    return _parsed_rules[key]
+
+def _apply(node, steps, placeholder, copied):
+    """
+    Returns node with the rule applied, copying only the containers on the path that actually change.
+    `copied` holds ids of containers this redaction already copied, so they can be written in place.
+    """
+    (key, is_list), rest = steps[0], steps[1:]
+    if not isinstance(node, dict) or key not in node:
+        return node
+
+    if not rest:
+        if node[key] == placeholder:
+            return node
+        if id(node) not in copied:
+            node = dict(node)
+            copied.add(id(node))
+        node[key] = placeholder
+        return node
+
+    child = node[key]
+    if is_list:
+        if not isinstance(child, list):
+            return node
+        new_items = [_apply(item, rest, placeholder, copied) for item in child]
+        if all(new is old for new, old in zip(new_items, child)):
+            return node
+        new_child = new_items
+        copied.add(id(new_child))
+    else:
+        new_child = _apply(child, rest, placeholder, copied)
+        if new_child is child:
+            return node
+
+    if id(node) not in copied:
+        node = dict(node)
+        copied.add(id(node))
+    node[key] = new_child
+    return node
+
+def redact(data, rules=PII_FIELD_PATHS):
+    """
+    Returns a redacted view of data. Unchanged sections (flowsheets, labs, ...) are the same objects
+    as in the original, so treat the result as read-only.
+    """
+    copied = set()
+    redacted = data
+    for steps, placeholder in _compiled(rules):
+        redacted = _apply(redacted, steps, placeholder, copied)
+    return redacted
@@ -0,0 +1,337 @@
+import asyncio
+import contextlib
+import contextvars
+import heapq
+import itertools
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from openai import APIConnectionError, InternalServerError, RateLimitError
+
+# Requests and tokens per minute per model (our org's quotas). A model missing here, or set to None, is not limited.
+MODEL_RATE_LIMITS = {
+    "gpt-4": {"rpm": 500, "tpm": 40000},
+    "gpt-4-turbo": {"rpm": 500, "tpm": 150000},
+    "gpt-4o": {"rpm": 500, "tpm": 150000},
+    "gpt-4o-mini": {"rpm": 500, "tpm": 1000000},
+    "gpt-3.5-turbo": {"rpm": 500, "tpm": 1000000},
+}
+# e.g. LLM_RATE_LIMITS='{"gpt-4": {"rpm": 200, "tpm": 20000}}'
+MODEL_RATE_LIMITS.update(json.loads(os.getenv("LLM_RATE_LIMITS", "{}")))
+
+# Cheaper model used for downgradable stages (highlights) while the requested model's budget is tight.
+DOWNGRADE_MODELS = {
+    "gpt-4": "gpt-3.5-turbo",
+    "gpt-4-turbo": "gpt-4o-mini",
+    "gpt-4o": "gpt-4o-mini",
+}
+DOWNGRADE_AT = 0.8  # share of the token budget used in the last minute
+
+# Lower runs first: a clinician waiting in the UI goes ahead of queued batch records.
+PRIORITIES = {"interactive": 0, "batch": 1}
+
+COMPLETION_ESTIMATE = 500  # tokens reserved for the completion until the real usage is known
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+RETRYABLE_ERRORS = (RateLimitError, InternalServerError, APIConnectionError)
+
+_priority = contextvars.ContextVar("llm_priority", default="interactive")
+_duration_part = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_duration_units = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+@contextlib.contextmanager
+def priority(name):
+    """Runs the calls made inside the block (and tasks started from it) at this priority ("interactive" or "batch")."""
+    if name not in PRIORITIES:
+        raise ValueError(f"Unknown priority: {name}")
+    token = _priority.set(name)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+def current_priority():
+    return _priority.get()
+
+def parse_duration(value):
+    """Seconds from a rate-limit header value: "20ms", "1.5s", "6m0s", or a plain number of seconds."""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        parts = _duration_part.findall(value)
+        return sum(float(n) * _duration_units[unit] for n, unit in parts) if parts else None
+
+def _header_number(headers, name):
+    try:
+        return float(headers.get(name))
+    except (TypeError, ValueError):
+        return None
+
+def retry_delay(headers):
+    """How long the server asked us to wait (retry-after-ms, retry-after, then the x-ratelimit reset times), or None."""
+    if not headers:
+        return None
+    retry_ms = _header_number(headers, "retry-after-ms")
+    if retry_ms is not None:
+        return retry_ms / 1000
+    for name in ("retry-after", "x-ratelimit-reset-requests", "x-ratelimit-reset-tokens"):
+        delay = parse_duration(headers.get(name))
+        if delay is not None:
+            return delay
+    return None
+
+class _Budget:
+    def __init__(self):
+        self.sent = deque()  # [sent_at, tokens] per request in the last window
+        self.waiting = []  # heap of (priority, sequence) tickets
+        self.blocked_until = 0.0
+        self.strikes = 0
+
+class RateLimitScheduler:
+    """
+    Client-side scheduler for the OpenAI calls of one process, per model:
+    - keeps requests and (estimated, then actual) tokens within a sliding one-minute window of MODEL_RATE_LIMITS,
+      queueing callers until the window has room; queued callers are served by priority, then arrival
+    - backs off after a 429 (for Retry-After or the x-ratelimit reset time, else exponentially) and pauses
+      when response headers report the quota nearly used up
+    - retries rate-limited and transient errors itself, so the SDK's own retries are turned off for these calls
+    """
+
+    def __init__(self, limits=None, window=60.0, max_attempts=5):
+        self.limits = dict(MODEL_RATE_LIMITS if limits is None else limits)
+        self.window = window
+        self.max_attempts = max_attempts
+        self.lock = threading.Lock()
+        self.cond = threading.Condition(self.lock)
+        self.budgets = {}
+        self.sequence = itertools.count()
+        self.stats = {"requests": 0, "queued": 0, "waited_seconds": 0.0, "rate_limited": 0, "retries": 0,
+                      "paused_by_headers": 0, "downgraded": 0}
+
+    def configure(self, limits):
+        """Replaces the limits table ({model: {"rpm": n, "tpm": n}}; an empty dict disables limiting)."""
+        with self.cond:
+            self.limits = dict(limits)
+            self.cond.notify_all()
+
+    def _budget(self, model):
+        budget = self.budgets.get(model)
+        if budget is None:
+            budget = self.budgets[model] = _Budget()
+        return budget
+
+    def _wait_time(self, model, budget, tokens, now):
+        # Seconds until a request of this many tokens fits the model's window (0 when it fits now).
+        while budget.sent and budget.sent[0][0] <= now - self.window:
+            budget.sent.popleft()
+        wait = max(budget.blocked_until - now, 0.0)
+        limit = self.limits.get(model) or {}
+        rpm, tpm = limit.get("rpm"), limit.get("tpm")
+        if rpm and len(budget.sent) >= rpm:
+            wait = max(wait, budget.sent[len(budget.sent) - rpm][0] + self.window - now)
+        if tpm:
+            excess = sum(n for _, n in budget.sent) + min(tokens, tpm) - tpm
+            for sent_at, n in budget.sent:
+                if excess <= 0:
+                    break
+                excess -= n
+                wait = max(wait, sent_at + self.window - now)
+        return wait
+
+    def _check(self, model, budget, ticket, tokens):
+        # None while another caller is ahead in the queue, else the wait until this one fits.
+        if budget.waiting[0] != ticket:
+            return None
+        return self._wait_time(model, budget, tokens, time.monotonic())
+
+    def _enqueue(self, model, tokens, priority_name):
+        budget = self._budget(model)
+        ticket = (PRIORITIES[priority_name or current_priority()], next(self.sequence))
+        heapq.heappush(budget.waiting, ticket)
+        return budget, ticket
+
+    def _grant(self, model, budget, ticket, tokens, queued_at):
+        heapq.heappop(budget.waiting)
+        now = time.monotonic()
+        entry = [now, tokens]
+        budget.sent.append(entry)
+        self.stats["requests"] += 1
+        if now - queued_at > 0.001:
+            self.stats["queued"] += 1
+            self.stats["waited_seconds"] += now - queued_at
+        self.cond.notify_all()
+        return entry
+
+    def _leave(self, budget, ticket):
+        budget.waiting.remove(ticket)
+        heapq.heapify(budget.waiting)
+        self.cond.notify_all()
+
+    def acquire(self, model, tokens, priority_name=None):
+        """Blocks until a request of about `tokens` tokens may be sent; returns its entry for settle()."""
+        queued_at = time.monotonic()
+        with self.cond:
+            budget, ticket = self._enqueue(model, tokens, priority_name)
+            try:
+                while True:
+                    wait = self._check(model, budget, ticket, tokens)
+                    if wait == 0:
+                        return self._grant(model, budget, ticket, tokens, queued_at)
+                    self.cond.wait(min(wait, 1.0) if wait else 1.0)
+            except BaseException:
+                self._leave(budget, ticket)
+                raise
+
+    async def acquire_async(self, model, tokens, priority_name=None):
+        """acquire() for coroutines: waits with asyncio.sleep, so the event loop keeps serving other records."""
+        queued_at = time.monotonic()
+        with self.lock:
+            budget, ticket = self._enqueue(model, tokens, priority_name)
+        try:
+            while True:
+                with self.lock:
+                    wait = self._check(model, budget, ticket, tokens)
+                    if wait == 0:
+                        return self._grant(model, budget, ticket, tokens, queued_at)
+                await asyncio.sleep(min(wait, 1.0) if wait else 0.05)
+        except BaseException:
+            with self.lock:
+                self._leave(budget, ticket)
+            raise
+
+    def settle(self, entry, tokens):
+        """Replaces a request's token estimate with its actual usage."""
+        with self.cond:
+            entry[1] = tokens
+            self.cond.notify_all()
+
+    def observe(self, model, headers):
+        """Successful response: clears the backoff, and pauses the model when x-ratelimit-* headers report the quota used up."""
+        pause = 0.0
+        if _header_number(headers, "x-ratelimit-remaining-requests") == 0:
+            pause = parse_duration(headers.get("x-ratelimit-reset-requests")) or 0.0
+        remaining_tokens = _header_number(headers, "x-ratelimit-remaining-tokens")
+        if remaining_tokens is not None and remaining_tokens < COMPLETION_ESTIMATE:
+            pause = max(pause, parse_duration(headers.get("x-ratelimit-reset-tokens")) or 0.0)
+        with self.lock:
+            budget = self._budget(model)
+            budget.strikes = 0
+            if pause:
+                budget.blocked_until = max(budget.blocked_until, time.monotonic() + pause)
+                self.stats["paused_by_headers"] += 1
+
+    def _failed(self, model, entry, error):
+        # Returns how long this caller should sleep before retrying; a 429 instead pauses the whole model.
+        with self.cond:
+            entry[1] = 0  # rejected requests use no tokens
+            budget = self._budget(model)
+            budget.strikes += 1
+            self.stats["retries"] += 1
+            backoff = min(BACKOFF_BASE * 2 ** (budget.strikes - 1), BACKOFF_MAX) * random.uniform(1.0, 1.25)
+            if not isinstance(error, RateLimitError):
+                return backoff
+            self.stats["rate_limited"] += 1
+            delay = retry_delay(getattr(getattr(error, "response", None), "headers", None))
+            budget.blocked_until = max(budget.blocked_until, time.monotonic() + (backoff if delay is None else delay))
+            self.cond.notify_all()
+        logging.warning(f"Rate limited on {model}; pausing for {budget.blocked_until - time.monotonic():.1f}s")
+        return 0.0
+
+    def call(self, model, tokens, request, hold=False):
+        """
+        Sends request() within the model's budget. request returns (result, response headers, tokens used or None).
+        Rate-limited and transient errors are retried up to max_attempts times. With hold=True, returns
+        (result, entry) so a streamed call can settle() its usage once the stream is done.
+        """
+        for attempt in range(1, self.max_attempts + 1):
+            entry = self.acquire(model, tokens)
+            try:
+                result, headers, used = request()
+            except RETRYABLE_ERRORS as e:
+                delay = self._failed(model, entry, e)
+                if attempt == self.max_attempts:
+                    raise
+                time.sleep(delay)
+                continue
+            except BaseException:
+                self.settle(entry, 0)
+                raise
+            self.observe(model, headers)
+            if used is not None:
+                self.settle(entry, used)
+            return (result, entry) if hold else result
+
+    async def call_async(self, model, tokens, request):
+        """call() for coroutines; request is an async function with the same return value."""
+        for attempt in range(1, self.max_attempts + 1):
+            entry = await self.acquire_async(model, tokens)
+            try:
+                result, headers, used = await request()
+            except RETRYABLE_ERRORS as e:
+                delay = self._failed(model, entry, e)
+                if attempt == self.max_attempts:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                self.settle(entry, 0)
+                raise
+            self.observe(model, headers)
+            if used is not None:
+                self.settle(entry, used)
+            return result
+
+    def choose_model(self, model, tokens=0):
+        """The model to use for a downgradable stage: DOWNGRADE_MODELS[model] while model's budget is tight."""
+        cheaper = DOWNGRADE_MODELS.get(model)
+        if cheaper is None:
+            return model
+        with self.lock:
+            budget = self._budget(model)
+            now = time.monotonic()
+            tight = bool(budget.waiting) or self._wait_time(model, budget, tokens, now) > 0
+            tpm = (self.limits.get(model) or {}).get("tpm")
+            if tpm and sum(n for _, n in budget.sent) + tokens >= DOWNGRADE_AT * tpm:
+                tight = True
+            if tight:
+                self.stats["downgraded"] += 1
+        if tight:
+            logging.info(f"{model} budget is tight; using {cheaper} for a downgradable stage")
+            return cheaper
+        return model
+
+    def summary(self):
+        now = time.monotonic()
+        with self.lock:
+            stats = dict(self.stats)
+            stats["waited_seconds"] = round(stats["waited_seconds"], 3)
+            models = {}
+            for model, budget in self.budgets.items():
+                self._wait_time(model, budget, 0, now)
+                models[model] = {
+                    "requests_last_minute": len(budget.sent),
+                    "tokens_last_minute": sum(n for _, n in budget.sent),
+                    "waiting": len(budget.waiting),
+                    "paused_for": round(max(budget.blocked_until - now, 0.0), 1),
+                    **(self.limits.get(model) or {}),
+                }
+        stats["models"] = models
+        return stats
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler():
+    """Process-wide scheduler shared by all summary_generator calls (and all Streamlit sessions)."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = RateLimitScheduler()
+        return _scheduler
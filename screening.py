@@ -0,0 +1,113 @@
+import heapq
+import json
+import os
+import re
+from phrase_regex import compile_phrase_regex
+
+DEFAULT_SCREEN_CONFIG = os.getenv(
+    "DISCHARGE_SCREEN_CONFIG",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "config", "discharge_screen.json"),
+)
+
+# Notes often record the time of day in words; map them onto a clock time so they sort correctly.
+TIME_OF_DAY = {
+    "morning": "08:00",
+    "midday": "12:00",
+    "noon": "12:00",
+    "afternoon": "15:00",
+    "evening": "19:00",
+    "night": "22:00",
+}
+
+# A negation cue only reaches the phrase within one clause: sentences, commas and conjunctions end it.
+_clause_break = re.compile(r"[.;:!?,\n]|\b(?:but|and|or|however|although|though|yet|whereas|while)\b")
+
+def note_timestamp(note):
+    """
+    Sort key (ISO date, HH:MM) for a note; time-of-day words ("Morning", ...) map onto clock times.
+    Plain string keys keep top-N selection as cheap as the old sort, without "Morning" sorting after "Evening".
+    """
+    time_text = str(note.get("time", "")).strip()
+    clock = TIME_OF_DAY.get(time_text.lower(), time_text)
+    if len(clock) == 4 and clock[1] == ":":
+        clock = "0" + clock
+    return (note.get("date", "")[:10], clock)
+
+class ScreeningEngine:
+    """
+    Keyword screen for discharge-blocking phrases. All phrases are compiled into one trie-shaped regex,
+    so each note is scanned once however long the phrase list grows. A match is ignored only when a negation
+    cue ("no longer", ...) directly precedes it in the same clause ("no longer requires close monitoring");
+    negation_window allows that many words in between. Anything looser would let a note pass the screen.
+    """
+
+    def __init__(self, warning_phrases, negation_cues=(), negation_window=0):
+        self.warning_phrases = list(warning_phrases)
+        # Phrases are lowercased and matched against lowercased text (about twice as fast as re.IGNORECASE), with any
+        # whitespace between words. Only the start is bounded: like the old substring check, "unfit for discharged"
+        # or "not medically stable-ish" still match, so the screen never clears a note the substring check blocked
+        # for running into a longer word.
+        self.pattern = compile_phrase_regex(lambda pattern: r"\b(?:" + pattern(self.warning_phrases, any_space=True) + ")")
+        self.negation_window = negation_window
+        self.negation = None
+        if negation_cues:
+            # Anchored at the end of the clause text before the phrase: cue, then at most negation_window words.
+            self.negation = compile_phrase_regex(
+                lambda pattern: r"\b(?:" + pattern(negation_cues, any_space=True) + rf")\b\s+(?:\S+\s+){{0,{negation_window}}}\Z"
+            )
+
+    @classmethod
+    def from_config(cls, path=DEFAULT_SCREEN_CONFIG):
+        with open(path, "r", encoding="utf-8") as f:
+            config = json.load(f)
+        return cls(config["warning_phrases"], config.get("negation_cues", []), config.get("negation_window", 0))
+
+    def _is_negated(self, text, start):
+        if self.negation is None:
+            return False
+        clause_start = max((m.end() for m in _clause_break.finditer(text, 0, start)), default=0)
+        return self.negation.search(text[clause_start:start]) is not None
+
+    def recent_notes(self, data, recent_limit=2):
+        """The most recent notes by parsed date/time; recent_limit=None returns every note."""
+        all_notes = data.get("notes", []) + data.get("ward_round_notes", [])
+        if recent_limit is None:
+            return all_notes
+        return heapq.nlargest(recent_limit, all_notes, key=note_timestamp)
+
+    def findings(self, data, recent_limit=2):
+        """Every warning phrase found in the screened notes, with whether it was negated."""
+        results = []
+        for note in self.recent_notes(data, recent_limit):
+            content = (note.get("content") or note.get("note", "")).lower()
+            for match in self.pattern.finditer(content):
+                results.append({
+                    "date": note.get("date", ""),
+                    "time": note.get("time", ""),
+                    "phrase": " ".join(match.group().split()),
+                    "negated": self._is_negated(content, match.start()),
+                })
+        return results
+
+    def is_safe(self, data, recent_limit=2):
+        for note in self.recent_notes(data, recent_limit):
+            content = (note.get("content") or note.get("note", "")).lower()
+            for match in self.pattern.finditer(content):
+                if not self._is_negated(content, match.start()):
+                    return False
+        return True
+
+_default_engine = None
+
+def get_screening_engine():
+    """Engine built from DEFAULT_SCREEN_CONFIG, loaded once per process (see reload_screening_engine)."""
+    global _default_engine
+    if _default_engine is None:
+        _default_engine = ScreeningEngine.from_config()
+    return _default_engine
+
+def reload_screening_engine():
+    """Re-reads the phrase config, e.g. after the clinical governance list is updated."""
+    global _default_engine
+    _default_engine = ScreeningEngine.from_config()
+    return _default_engine
@@ -0,0 +1,467 @@
+"""
+HTTP API for the generation pipeline, so it can be called from the EHR integration, scaled out behind a load
+balancer and load-tested without the Streamlit UI:
+
+    python service.py [--port 8090] [--workers 4] [--queue-size 32] [--base-url http://127.0.0.1:8089/v1]
+
+    POST   /v1/summaries              submit a record; 202 with the job, 429 + Retry-After when the queue is full
+    GET    /v1/summaries/<id>         job status and result; ?wait=30 long-polls until it finishes
+    GET    /v1/summaries/<id>/events  server-sent events for each status change, ending with the result
+    DELETE /v1/summaries/<id>         cancel a queued or running job
+    GET    /healthz                   liveness and queue depth (503 while stopping)
+    GET    /metrics                   job counts and latencies, cache, coalescing and rate-limit stats
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from dotenv import load_dotenv
+from instrumentation import percentile
+from llm_cache import get_cache
+from pipeline import run_record_async
+from scheduler import PRIORITIES, get_scheduler, priority
+from single_flight import get_single_flight
+from summary_generator import close_async_clients, configure_clients
+
+# Largest request body accepted, in bytes (records with big flowsheets run to a few MB).
+MAX_BODY_BYTES = int(os.getenv("SERVICE_MAX_BODY_BYTES", str(32 * 1024 * 1024)))
+# Longest ?wait= a poll may block for, in seconds.
+MAX_WAIT_SECONDS = 60.0
+# Statuses after which a job never changes again.
+FINISHED_STATUSES = {"done", "blocked", "flagged", "error", "cancelled"}
+
+_JOB_PATH = re.compile(r"^/v1/summaries/([0-9a-f]{32})(/events)?$")
+
+class Job:
+    """One submitted record: its options, status history (for the event stream) and pipeline result."""
+
+    def __init__(self, record, api_key, options, job_priority):
+        self.id = uuid.uuid4().hex
+        self.record = record
+        self.api_key = api_key
+        self.options = options
+        self.priority = job_priority
+        self.status = "queued"
+        self.events = [{"status": "queued"}]
+        self.result = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.task = None
+
+    def to_dict(self):
+        job = {
+            "id": self.id,
+            "status": self.status,
+            "priority": self.priority,
+            "submitted_at": datetime.fromtimestamp(self.submitted).strftime("%Y-%m-%d %H:%M:%S"),
+            "queue_seconds": round((self.started or self.finished or time.time()) - self.submitted, 4),
+        }
+        if self.finished is not None:
+            job["latency"] = round(self.finished - self.submitted, 4)
+        if self.result is not None:
+            job["result"] = self.result
+        return job
+
+class WorkerPool:
+    """
+    Runs jobs through pipeline.run_record_async on its own event loop thread, `workers` at a time, from a bounded
+    priority queue: interactive jobs go before batch ones, and submit() refuses work (returns None) once
+    `queue_size` jobs are waiting, so callers back off instead of piling up requests. Finished jobs are kept
+    for polling, up to `max_jobs`.
+    """
+
+    def __init__(self, workers=4, queue_size=32, max_jobs=1000):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.max_jobs = max_jobs
+        self.jobs = OrderedDict()
+        self.latencies = deque(maxlen=1000)
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.stats = {"submitted": 0, "rejected": 0, "cancelled": 0, "failed": 0, "completed": 0}
+        self.queued = 0
+        self.running = 0
+        self.sequence = itertools.count()
+        self.loop = None
+        self.queue = None
+        self.thread = None
+        self.stopping = False
+
+    def start(self):
+        ready = threading.Event()
+
+        def run():
+            self.loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self.loop)
+            self.queue = asyncio.PriorityQueue()
+            tasks = [self.loop.create_task(self._worker()) for _ in range(self.workers)]
+            ready.set()
+            self.loop.run_forever()
+            for task in tasks:
+                task.cancel()
+            self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self.loop.run_until_complete(close_async_clients())
+            self.loop.close()
+
+        self.thread = threading.Thread(target=run, name="service-workers", daemon=True)
+        self.thread.start()
+        ready.wait()
+        return self
+
+    def stop(self):
+        """Stops taking jobs, cancels the running ones and closes the loop's API clients."""
+        with self.lock:
+            self.stopping = True
+            pending = [job for job in self.jobs.values() if job.status not in FINISHED_STATUSES]
+        for job in pending:
+            self.cancel(job.id)
+        if self.thread is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+            self.thread = None
+
+    def submit(self, record, api_key, options=None, job_priority="interactive"):
+        """Queues a job and returns it, or None when the queue is full or the pool is stopping."""
+        job = Job(record, api_key, options or {}, job_priority)
+        with self.lock:
+            if self.stopping or self.queued >= self.queue_size:
+                self.stats["rejected"] += 1
+                return None
+            self.queued += 1
+            self.stats["submitted"] += 1
+            self.jobs[job.id] = job
+            self._evict()
+        entry = (PRIORITIES[job_priority], next(self.sequence), job)
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, entry)
+        return job
+
+    def _evict(self):
+        # Caller holds the lock. Only finished jobs are dropped; oldest first.
+        excess = len(self.jobs) - self.max_jobs
+        for job_id in [job_id for job_id, job in self.jobs.items() if job.status in FINISHED_STATUSES][:max(excess, 0)]:
+            del self.jobs[job_id]
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def wait(self, job, timeout):
+        """Blocks until the job finishes or timeout seconds pass."""
+        with self.changed:
+            self.changed.wait_for(lambda: job.status in FINISHED_STATUSES, timeout)
+
+    def events(self, job, start, timeout):
+        """Status events from index start on, waiting up to timeout seconds for the first one."""
+        with self.changed:
+            self.changed.wait_for(lambda: len(job.events) > start, timeout)
+            return job.events[start:]
+
+    def cancel(self, job_id):
+        """Cancels a queued or running job; False if it is unknown or already finished."""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None or job.status in FINISHED_STATUSES:
+                return False
+            if job.status == "queued":
+                self.queued -= 1
+            self._finish(job, "cancelled", None)
+            task = job.task
+        if task is not None:
+            self.loop.call_soon_threadsafe(task.cancel)
+        return True
+
+    def _set_status(self, job, status):
+        # Caller holds the lock.
+        job.status = status
+        job.events.append({"status": status})
+        self.changed.notify_all()
+
+    def _finish(self, job, status, result):
+        # Caller holds the lock.
+        job.finished = time.time()
+        job.result = result
+        job.record = None
+        self.stats["cancelled" if status == "cancelled" else "failed" if status == "error" else "completed"] += 1
+        if status != "cancelled":
+            self.latencies.append(job.finished - job.submitted)
+        job.events.append({"status": status, "result": result} if result is not None else {"status": status})
+        job.status = status
+        self.changed.notify_all()
+
+    async def _run(self, job):
+        with priority(job.priority):
+            return await run_record_async(job.record, job.api_key, **job.options)
+
+    async def _worker(self):
+        while True:
+            _, _, job = await self.queue.get()
+            with self.lock:
+                if job.status != "queued":
+                    continue
+                self.queued -= 1
+                self.running += 1
+                job.started = time.time()
+                # A task of its own, so cancelling the job does not cancel the worker.
+                job.task = asyncio.create_task(self._run(job))
+                self._set_status(job, "running")
+            try:
+                result = await job.task
+                status = result["status"]
+            except asyncio.CancelledError:
+                if self.stopping:
+                    raise
+                status, result = "cancelled", None
+            except Exception as e:
+                # A malformed record or a failed call ends its job, never the worker.
+                logging.error(f"Service job {job.id} failed: {type(e).__name__}: {e}")
+                status, result = "error", {"status": "error", "error": str(e)}
+            with self.lock:
+                self.running -= 1
+                job.task = None
+                if job.status == "running":
+                    self._finish(job, status, result)
+
+    def summary(self):
+        with self.lock:
+            stats = dict(self.stats)
+            latencies = list(self.latencies)
+            stats.update(queued=self.queued, running=self.running, workers=self.workers, queue_size=self.queue_size)
+        stats["latency_p50"] = round(percentile(latencies, 50), 4)
+        stats["latency_p95"] = round(percentile(latencies, 95), 4)
+        return stats
+
+def parse_submission(body, default_api_key=None, api_key=None):
+    """
+    Validates a POST /v1/summaries body: {"record": {...}, "model", "instruction", "allow_override",
+    "incremental", "combined_review", "priority", "source"}. Returns (record, api_key, options, priority);
+    raises ValueError with the reason.
+    """
+    if not isinstance(body, dict) or not isinstance(body.get("record"), dict):
+        raise ValueError('body must be a JSON object with a "record" object')
+    unknown = set(body) - {"record", "model", "instruction", "allow_override", "incremental", "combined_review", "priority", "source"}
+    if unknown:
+        raise ValueError(f"unknown fields: {sorted(unknown)}")
+    job_priority = body.get("priority", "interactive")
+    if job_priority not in PRIORITIES:
+        raise ValueError(f"priority must be one of {sorted(PRIORITIES)}")
+    api_key = api_key or default_api_key
+    if not api_key:
+        raise ValueError("no OpenAI API key: send X-OpenAI-Key or start the service with OPENAI_API_KEY")
+    options = {
+        "model": str(body.get("model", "gpt-4")),
+        "additional_prompt": str(body.get("instruction", "")),
+        "allow_override": bool(body.get("allow_override", False)),
+        "incremental": bool(body.get("incremental", True)),
+        "combined_review": bool(body.get("combined_review", True)),
+        "source": str(body.get("source", "")),
+    }
+    return body["record"], api_key, options, job_priority
+
+class SummaryService:
+    """Threaded HTTP front end (see the module docstring) over a WorkerPool."""
+
+    def __init__(self, host="127.0.0.1", port=0, api_key=None, token=None, **pool_settings):
+        self.pool = WorkerPool(**pool_settings)
+        self.api_key = api_key
+        self.token = token
+        self.httpd = ThreadingHTTPServer((host, port), _handler(self))
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.pool.start()
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="summary-service", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.pool.stop()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def metrics(self):
+        return {
+            "jobs": self.pool.summary(),
+            "llm_cache": get_cache().summary(),
+            "single_flight": get_single_flight().summary(),
+            "rate_limits": get_scheduler().summary(),
+        }
+
+def _handler(service):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status, body, headers=None):
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _error(self, status, message, headers=None):
+            self._send_json(status, {"error": message}, headers)
+
+        def _authorized(self):
+            if service.token and self.headers.get("Authorization") != f"Bearer {service.token}":
+                self._error(401, "missing or invalid bearer token")
+                return False
+            return True
+
+        def _job(self, path):
+            match = _JOB_PATH.match(path)
+            job = service.pool.get(match.group(1)) if match else None
+            if job is None:
+                self._error(404, f"Unknown path {path}" if not match else "unknown job")
+            return job, bool(match and match.group(2))
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            if url.path == "/healthz":
+                stats = service.pool.summary()
+                health = {"status": "stopping" if service.pool.stopping else "ok", **{k: stats[k] for k in ("queued", "running", "workers", "queue_size")}}
+                self._send_json(503 if service.pool.stopping else 200, health)
+                return
+            if not self._authorized():
+                return
+            if url.path == "/metrics":
+                self._send_json(200, service.metrics())
+                return
+            job, events = self._job(url.path)
+            if job is None:
+                return
+            if events:
+                self._stream(job)
+                return
+            try:
+                wait = min(float(parse_qs(url.query).get("wait", ["0"])[0]), MAX_WAIT_SECONDS)
+            except ValueError:
+                self._error(400, "wait must be a number of seconds")
+                return
+            if wait > 0:
+                service.pool.wait(job, wait)
+            self._send_json(200, job.to_dict())
+
+        def do_POST(self):
+            if not self._authorized():
+                return
+            if urlsplit(self.path).path != "/v1/summaries":
+                self._error(404, f"Unknown path {self.path}")
+                return
+            length = int(self.headers.get("Content-Length") or 0)
+            if length > MAX_BODY_BYTES:
+                self._error(413, f"body larger than {MAX_BODY_BYTES} bytes")
+                self.close_connection = True
+                return
+            try:
+                body = json.loads(self.rfile.read(length) or b"{}")
+                submission = parse_submission(body, service.api_key, self.headers.get("X-OpenAI-Key"))
+            except ValueError as e:
+                self._error(400, str(e))
+                return
+            job = service.pool.submit(*submission)
+            if job is None:
+                # Backpressure: the client should retry after the queue drains a little.
+                self._error(503 if service.pool.stopping else 429, "service is stopping" if service.pool.stopping else "queue is full", {"Retry-After": "1"})
+                return
+            self._send_json(202, job.to_dict(), {"Location": f"/v1/summaries/{job.id}"})
+
+        def do_DELETE(self):
+            if not self._authorized():
+                return
+            job, events = self._job(urlsplit(self.path).path)
+            if job is None:
+                return
+            if events or not service.pool.cancel(job.id):
+                self._error(409, f"job is {job.status}")
+                return
+            self._send_json(200, job.to_dict())
+
+        def _stream(self, job):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            self.close_connection = True
+            sent = 0
+            try:
+                while True:
+                    events = service.pool.events(job, sent, 15)
+                    if not events:
+                        self.wfile.write(b": keep-alive\n\n")
+                    for event in events:
+                        self.wfile.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                    sent += len(events)
+                    if events and events[-1]["status"] in FINISHED_STATUSES:
+                        return
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+    return Handler
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="HTTP API for discharge summary generation.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--workers", type=int, default=4, help="Jobs processed concurrently")
+    parser.add_argument("--queue-size", type=int, default=32, help="Jobs waiting before submissions get 429")
+    parser.add_argument("--api-key", default=None, help="OpenAI API key for requests without X-OpenAI-Key (default: OPENAI_API_KEY)")
+    parser.add_argument("--token", default=None, help="Bearer token clients must send (default: SERVICE_TOKEN, none if unset)")
+    parser.add_argument("--base-url", default=None, help="OpenAI-compatible endpoint, e.g. a local stand-in server (default: OPENAI_BASE_URL)")
+    args = parser.parse_args()
+
+    client_settings = {"max_connections": max(args.workers * 2, 10)}
+    if args.base_url:
+        client_settings["base_url"] = args.base_url
+    configure_clients(**client_settings)
+
+    service = SummaryService(
+        args.host, args.port,
+        api_key=args.api_key or os.getenv("OPENAI_API_KEY"), token=args.token or os.getenv("SERVICE_TOKEN"),
+        workers=max(1, args.workers), queue_size=max(1, args.queue_size),
+    )
+    service.pool.start()
+    print(f"Summary service on {service.url} ({args.workers} workers, queue of {args.queue_size})")
+    try:
+        service.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.pool.stop()
+        service.httpd.server_close()
+        print(json.dumps(service.pool.summary(), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+
+class SingleFlight:
+    """
+    Deduplicates identical calls that are in flight at the same time, across threads (Streamlit sessions)
+    and event loops: the first caller for a key (the leader) makes the call, later callers wait for and
+    share its result. If the leader fails, or does not finish within the waiter's timeout, each waiter makes
+    the call itself, so one session's error (a bad API key, a hung request) is never handed to another.
+    """
+
+    def __init__(self):
+        self.flights = {}
+        self.lock = threading.Lock()
+        self.stats = {"leaders": 0, "coalesced": 0, "leader_failures": 0, "waiter_timeouts": 0}
+
+    def begin(self, key):
+        """Returns (future, is_leader). The leader must call finish(key, ...) exactly once."""
+        with self.lock:
+            future = self.flights.get(key)
+            if future is not None:
+                self.stats["coalesced"] += 1
+                return future, False
+            future = Future()
+            self.flights[key] = future
+            self.stats["leaders"] += 1
+            return future, True
+
+    def finish(self, key, future, result=None, error=None):
+        with self.lock:
+            if self.flights.get(key) is future:
+                del self.flights[key]
+            if error is not None:
+                self.stats["leader_failures"] += 1
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def _waited(self, future):
+        # Called when waiting raised: a future still pending means the waiter timed out rather than the leader failing.
+        if not future.done():
+            with self.lock:
+                self.stats["waiter_timeouts"] += 1
+
+    def wait(self, future, timeout=None):
+        """A waiter's side of begin(): the leader's result; raises its error, or TimeoutError after timeout seconds."""
+        try:
+            return future.result(timeout)
+        except Exception:
+            self._waited(future)
+            raise
+
+    async def wait_async(self, future, timeout=None):
+        try:
+            # shield: a waiter being cancelled (or timing out) must not cancel the shared future under the leader.
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout)
+        except Exception:
+            self._waited(future)
+            raise
+
+    def do(self, key, func, timeout=None):
+        """
+        Calls func() once for all concurrent callers with the same key. Returns (result, coalesced).
+        A waiter gives up on the leader after timeout seconds and calls func() itself.
+        """
+        future, leader = self.begin(key)
+        if not leader:
+            try:
+                return self.wait(future, timeout), True
+            except Exception:
+                return func(), False
+        try:
+            result = func()
+        except BaseException as e:
+            self.finish(key, future, error=e if isinstance(e, Exception) else RuntimeError("Leader call was interrupted"))
+            raise
+        self.finish(key, future, result)
+        return result, False
+
+    async def do_async(self, key, make_coro, timeout=None):
+        """Async variant of do(); make_coro() builds the awaitable only when this caller leads (or must retry)."""
+        future, leader = self.begin(key)
+        if not leader:
+            try:
+                return await self.wait_async(future, timeout), True
+            except Exception:
+                return await make_coro(), False
+        try:
+            result = await make_coro()
+        except BaseException as e:
+            # A cancelled leader (e.g. a stage timeout) hands waiters a plain error so they retry on their own.
+            self.finish(key, future, error=e if isinstance(e, Exception) else RuntimeError("Leader call was cancelled"))
+            raise
+        self.finish(key, future, result)
+        return result, False
+
+    def summary(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats["in_flight"] = len(self.flights)
+        calls = stats["leaders"] + stats["coalesced"]
+        stats["coalesced_rate"] = round(stats["coalesced"] / calls, 3) if calls else 0.0
+        return stats
+
+_single_flight = None
+_single_flight_lock = threading.Lock()
+
+def get_single_flight():
+    """Process-wide single-flight group shared by all summary_generator calls (and all Streamlit sessions)."""
+    global _single_flight
+    with _single_flight_lock:
+        if _single_flight is None:
+            _single_flight = SingleFlight()
+        return _single_flight
@@ -1,13 +1,45 @@
+import asyncio
+import hashlib
 import json
 import logging
+import os
 import re
-from openai import OpenAI
+import threading
+import time
+import weakref
+import httpx
+from openai import OpenAI, AsyncOpenAI, DefaultHttpxClient, DefaultAsyncHttpxClient
+from llm_cache import cache_key, get_cache
+from instrumentation import annotate, record_usage
+from single_flight import get_single_flight
+from scheduler import COMPLETION_ESTIMATE, get_scheduler
+from ingest import load_record
+from record_store import is_record_store_ref, load_stored_record
+from placeholders import PLACEHOLDERS, PLACEHOLDER_PATTERN, fix_placeholder_spacing
+from prompt_builder import (
+    count_tokens,
+    prompt_budget,
+    select_examples,
+    select_safety_examples,
+    dedupe_notes,
+    format_notes,
+    format_meds,
+    condense_notes,
+    condense_trends,
+    format_record,
+)
 
 logging.basicConfig(filename="logs/discharge_summary.log", level=logging.INFO)
 
-def load_patient_data(filepath):
-    with open(filepath, "r") as f:
-        return json.load(f)
+def load_patient_data(filepath, sections=None):
+    """
+    Parses a patient record file, or one record of an NDJSON bundle ("bundle.ndjson#3"), or loads a normalized
+    record from a record store ("cache/records.sqlite#P001", see record_store.py).
+    Pass sections to build only those top-level keys (see ingest.load_record).
+    """
+    if is_record_store_ref(filepath):
+        return load_stored_record(filepath, sections)
+    return load_record(filepath, sections)
 
 def few_shot_examples():
     return """
@@ -180,22 +212,29 @@ Answer: No
 
 
 
+def few_shot_example_list():
+    return few_shot_examples().split("\n\n---\n\n")
+
+def few_shot_safety_example_list():
+    return [e.strip() for e in re.split(r"\n-{3}\n", few_shot_safety_examples())]
+
 def get_doctor_name(data):
     notes = data.get("notes", [])
     if notes and "author" in notes[-1]:
         return notes[-1]["author"]
     return "REDACTED_DOCTOR"
 
-def generate_prompt(data, few_shot=True):
+def generate_prompt(data, few_shot=True, examples=None, notes=None, meds=None, trends=""):
+    """
+    Builds the generation prompt. By default every few-shot example, order and note is included verbatim;
+    the compact builder passes a chosen subset of examples, pre-condensed notes and meds and a trends block instead.
+    """
     diagnosis = ", ".join([d["description"] for d in data.get("diagnoses", [])])
-    meds = "\n".join([
-        f"{m['medication']} {m['dose']} ({m.get('frequency', 'N/A')})"
-        for m in data.get("med_orders", [])
-    ])
-    notes = "\n".join([
-        f"{n.get('date', '')}: {n.get('content', n.get('note', ''))}"
-        for n in data.get("notes", []) + data.get("ward_round_notes", [])
-    ])
+    if meds is None:
+        meds = format_meds(data.get("med_orders", []))
+    if notes is None:
+        notes = format_notes(data.get("notes", []) + data.get("ward_round_notes", []))
+    trends_section = f"\nLab and Vital Trends:  \n{trends}  \n" if trends else ""
 
     prompt_body = f"""
 Date: {data.get('discharge_date', 'Unknown')}
@@ -210,7 +249,7 @@ Clinical Notes:
 
 Medications:  
 {meds}  
-
+{trends_section}
 Please write a detailed discharge summary using the following sections in paragraph form:
 
 - **Patient Information**  
@@ -235,39 +274,434 @@ REDACTED_DOCTOR
 """.strip()
 
     if few_shot:
-        return few_shot_examples() + "\n\n---\n\n" + prompt_body
+        shots = few_shot_examples() if examples is None else "\n\n---\n\n".join(examples)
+        if shots:
+            return shots + "\n\n---\n\n" + prompt_body
     return prompt_body
 
-def get_discharge_summary(data, api_key, few_shot=True, model="gpt-3.5-turbo", additional_instruction=""):
-    prompt = generate_prompt(data, few_shot)
+# Shared client settings. The OpenAI SDK retries 408/409/429/5xx responses with exponential
+# backoff (honouring Retry-After) up to max_retries times; summary_generator's own calls turn that off
+# and are retried by the rate-limit scheduler instead (scheduler.py).
+CLIENT_SETTINGS = {
+    "base_url": os.getenv("OPENAI_BASE_URL") or None,
+    "max_connections": 20,
+    "max_keepalive_connections": 10,
+    "keepalive_expiry": 30.0,
+    "max_retries": 4,
+    "timeout": 120.0,
+}
+
+_clients = {}
+_async_clients = weakref.WeakKeyDictionary()
+_clients_lock = threading.Lock()
+
+def configure_clients(**settings):
+    """Updates CLIENT_SETTINGS (e.g. base_url for a local stand-in server) and drops clients built with the old ones."""
+    unknown = set(settings) - set(CLIENT_SETTINGS)
+    if unknown:
+        raise ValueError(f"Unknown client settings: {sorted(unknown)}")
+    with _clients_lock:
+        CLIENT_SETTINGS.update(settings)
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+        _async_clients.clear()
+
+def _limits():
+    return httpx.Limits(
+        max_connections=CLIENT_SETTINGS["max_connections"],
+        max_keepalive_connections=CLIENT_SETTINGS["max_keepalive_connections"],
+        keepalive_expiry=CLIENT_SETTINGS["keepalive_expiry"],
+    )
+
+def get_client(api_key):
+    """Returns the shared OpenAI client (and its keep-alive connection pool) for this API key and base URL."""
+    key = (api_key, CLIENT_SETTINGS["base_url"])
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = OpenAI(
+                api_key=api_key,
+                base_url=CLIENT_SETTINGS["base_url"],
+                max_retries=CLIENT_SETTINGS["max_retries"],
+                timeout=CLIENT_SETTINGS["timeout"],
+                http_client=DefaultHttpxClient(limits=_limits()),
+            )
+            _clients[key] = client
+        return client
+
+def get_async_client(api_key):
+    """
+    Returns the shared AsyncOpenAI client for this API key and base URL.
+    Async connection pools belong to one event loop, so clients are kept per running loop.
+    """
+    loop = asyncio.get_running_loop()
+    key = (api_key, CLIENT_SETTINGS["base_url"])
+    with _clients_lock:
+        loop_clients = _async_clients.setdefault(loop, {})
+        client = loop_clients.get(key)
+        if client is None:
+            client = AsyncOpenAI(
+                api_key=api_key,
+                base_url=CLIENT_SETTINGS["base_url"],
+                max_retries=CLIENT_SETTINGS["max_retries"],
+                timeout=CLIENT_SETTINGS["timeout"],
+                http_client=DefaultAsyncHttpxClient(limits=_limits()),
+            )
+            loop_clients[key] = client
+        return client
+
+async def close_async_clients():
+    """Closes the async clients opened on the running loop; call before the loop shuts down."""
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        loop_clients = _async_clients.pop(loop, {})
+    for client in loop_clients.values():
+        await client.close()
+
+def _endpoint():
+    # The base URL the clients actually send to: the OpenAI SDK falls back to OPENAI_BASE_URL, then the public API.
+    return CLIENT_SETTINGS["base_url"] or os.getenv("OPENAI_BASE_URL") or "https://api.openai.com/v1"
+
+def _call_key(model, temperature, prompt):
+    """Response cache key for one chat call to the configured endpoint."""
+    return cache_key(model, temperature, prompt, _endpoint())
+
+def _flight_key(key, api_key):
+    # Only calls made with the same API key share one in-flight request (the cache itself is shared across keys).
+    return f"{key}:{hashlib.sha256((api_key or '').encode('utf-8')).hexdigest()[:16]}"
+
+def _cached(key, use_cache):
+    if not use_cache:
+        return None
+    cached = get_cache().get(key)
+    annotate(cache="miss" if cached is None else "hit")
+    return cached
+
+def _prepare_call(prompt, model, temperature, use_cache, downgrade):
+    """
+    Returns (model, cache key, token estimate, cached content or None). A downgradable stage switches to
+    the scheduler's cheaper model when the requested model's budget is tight (after checking the cache for both).
+    """
+    annotate(model=model, cache="bypass")
+    key = _call_key(model, temperature, prompt)
+    tokens = count_tokens(prompt, model) + COMPLETION_ESTIMATE
+    cached = _cached(key, use_cache)
+    if cached is None and downgrade:
+        cheaper = get_scheduler().choose_model(model, tokens)
+        if cheaper != model:
+            model, key = cheaper, _call_key(cheaper, temperature, prompt)
+            annotate(model=model, downgraded=True)
+            cached = _cached(key, use_cache)
+    return model, key, tokens, cached
+
+def _create(api_key, **params):
+    raw = get_client(api_key).with_options(max_retries=0).chat.completions.with_raw_response.create(**params)
+    return raw.parse(), raw.headers
+
+async def _create_async(api_key, **params):
+    raw = await get_async_client(api_key).with_options(max_retries=0).chat.completions.with_raw_response.create(**params)
+    return raw.parse(), raw.headers
+
+def _total_tokens(usage):
+    return getattr(usage, "total_tokens", None)
+
+def _chat_params(prompt, model, temperature, tool):
+    params = {"model": model, "messages": [{"role": "user", "content": prompt}], "temperature": temperature}
+    if tool is not None:
+        params["tools"] = [tool]
+        params["tool_choice"] = {"type": "function", "function": {"name": tool["function"]["name"]}}
+    return params
+
+def _reply(response, tool):
+    # With a tool, the reply is the forced function call's JSON arguments (or the text if the model answered in text).
+    message = response.choices[0].message
+    if tool is not None and message.tool_calls:
+        return message.tool_calls[0].function.arguments
+    return message.content
+
+def _keyed_prompt(prompt, tool):
+    # The tool schema is part of the request, so it is part of the cache/in-flight key and the token estimate.
+    return prompt if tool is None else prompt + "\n" + json.dumps(tool, sort_keys=True)
+
+def _chat(prompt, api_key, model, temperature, use_cache, downgrade=False, tool=None, valid=None):
+    """
+    Single-prompt chat completion, served from the response cache when use_cache is set.
+    Identical calls already in flight (e.g. two sessions generating the same record) share one API request,
+    which is sent through the rate-limit scheduler. With a tool (function definition), the model is made
+    to call it and the call's JSON arguments are returned. With valid, only replies it accepts are cached.
+    """
+    model, key, tokens, cached = _prepare_call(_keyed_prompt(prompt, tool), model, temperature, use_cache, downgrade)
+    if cached is not None and (valid is None or valid(cached)):
+        return cached
+
+    def request():
+        response, headers = _create(api_key, **_chat_params(prompt, model, temperature, tool))
+        return response, headers, _total_tokens(response.usage)
+
+    def call():
+        response = get_scheduler().call(model, tokens, request)
+        record_usage(model, response.usage)
+        return _reply(response, tool)
+
+    content, coalesced = get_single_flight().do(_flight_key(key, api_key), call, CLIENT_SETTINGS["timeout"])
+    if coalesced:
+        annotate(coalesced=True)
+    elif use_cache and (valid is None or valid(content)):
+        get_cache().set(key, content, model)
+    return content
+
+async def _chat_async(prompt, api_key, model, temperature, use_cache, downgrade=False, tool=None, valid=None):
+    model, key, tokens, cached = _prepare_call(_keyed_prompt(prompt, tool), model, temperature, use_cache, downgrade)
+    if cached is not None and (valid is None or valid(cached)):
+        return cached
+
+    async def request():
+        response, headers = await _create_async(api_key, **_chat_params(prompt, model, temperature, tool))
+        return response, headers, _total_tokens(response.usage)
+
+    async def call():
+        response = await get_scheduler().call_async(model, tokens, request)
+        record_usage(model, response.usage)
+        return _reply(response, tool)
+
+    content, coalesced = await get_single_flight().do_async(_flight_key(key, api_key), call, CLIENT_SETTINGS["timeout"])
+    if coalesced:
+        annotate(coalesced=True)
+    elif use_cache and (valid is None or valid(content)):
+        get_cache().set(key, content, model)
+    return content
+
+def _finish_summary_prompt(prompt, additional_instruction):
     if additional_instruction.strip():
         prompt += f"\n\n# Additional Instruction:\n{additional_instruction.strip()}"
     prompt += "\n\nIMPORTANT: Keep placeholders like REDACTED_NAME and REDACTED_DOCTOR exactly as written."
+    return prompt
+
+def build_compact_summary_prompt(data, few_shot=True, additional_instruction="", model="gpt-4", max_examples=2):
+    """
+    Token-budgeted generation prompt: the most relevant few-shot examples for the diagnoses,
+    de-duplicated notes and medication orders, and condensed lab/vital trends. While over the model's budget it drops
+    examples, then condenses older notes, then drops trends.
+    Returns (prompt, report) where report compares token counts with the full prompt.
+    """
+    budget = prompt_budget(model)
+    query = " ".join(d.get("description", "") for d in data.get("diagnoses", []))
+    examples = select_examples(few_shot_example_list(), query, max_examples) if few_shot else []
+    notes = dedupe_notes(data.get("notes", []) + data.get("ward_round_notes", []))
+    keep_recent = len(notes)
+    meds = format_meds(data.get("med_orders", []), dedupe=True)
+    trends = condense_trends(data)
+
+    while True:
+        notes_text = format_notes(notes) if keep_recent >= len(notes) else condense_notes(notes, keep_recent)
+        prompt = _finish_summary_prompt(
+            generate_prompt(data, few_shot=bool(examples), examples=examples, notes=notes_text, meds=meds, trends=trends),
+            additional_instruction,
+        )
+        tokens = count_tokens(prompt, model)
+        if tokens <= budget:
+            break
+        if len(examples) > 1:
+            examples = examples[:-1]
+        elif keep_recent > 2:
+            keep_recent = max(2, keep_recent // 2)
+        elif examples:
+            examples = []
+        elif trends:
+            trends = ""
+        else:
+            logging.warning(f"Prompt still exceeds the {model} budget ({tokens} > {budget} tokens)")
+            break
+
+    baseline = count_tokens(_finish_summary_prompt(generate_prompt(data, few_shot), additional_instruction), model)
+    report = {
+        "baseline_tokens": baseline,
+        "prompt_tokens": tokens,
+        "saved_tokens": baseline - tokens,
+        "budget": budget,
+        "examples": len(examples),
+        "notes_kept": len(notes) if keep_recent + 1 >= len(notes) else keep_recent + 1,
+        "notes_total": len(data.get("notes", []) + data.get("ward_round_notes", [])),
+    }
+    return prompt, report
+
+def build_summary_prompt(data, few_shot=True, additional_instruction="", model="gpt-4", compact=True):
+    if not compact:
+        return _finish_summary_prompt(generate_prompt(data, few_shot), additional_instruction)
+    prompt, report = build_compact_summary_prompt(data, few_shot, additional_instruction, model)
+    annotate(prompt_tokens_estimated=report["prompt_tokens"], prompt_tokens_saved=report["saved_tokens"])
+    logging.info(f"Compact prompt: {report['prompt_tokens']} tokens (saved {report['saved_tokens']} of {report['baseline_tokens']})")
+    return prompt
+
+def get_discharge_summary(data, api_key, few_shot=True, model="gpt-3.5-turbo", additional_instruction="", use_cache=False, compact=True):
+    # Generation runs at temperature 0.6, so it bypasses the cache unless explicitly asked.
+    prompt = build_summary_prompt(data, few_shot, additional_instruction, model, compact)
+    return fix_placeholder_spacing(_chat(prompt, api_key, model, 0.6, use_cache))
+
+class PlaceholderSpacingStream:
+    """
+    Applies fix_placeholder_spacing to streamed text chunk by chunk.
+    The tail of the buffer is held back so a placeholder (or the letter next to it) split across
+    chunks is only fixed once it is complete; the concatenated output equals fixing the full text.
+    """
+
+    _pattern = PLACEHOLDER_PATTERN
+    _holdback = max(len(ph) for ph in PLACEHOLDERS) + 1
+
+    def __init__(self):
+        self.pending = ""
+
+    def feed(self, chunk):
+        text = self.pending + chunk
+        cut = len(text) - self._holdback
+        if cut <= 0:
+            self.pending = text
+            return ""
+        # Never split a placeholder from itself or from the characters either side of it
+        # (walking backwards handles runs of adjacent placeholders).
+        for match in reversed(list(self._pattern.finditer(text))):
+            if match.start() <= cut <= match.end():
+                cut = match.start() - 1
+        if cut <= 0:
+            self.pending = text
+            return ""
+        self.pending = text[cut:]
+        return fix_placeholder_spacing(text[:cut])
+
+    def flush(self):
+        text, self.pending = self.pending, ""
+        return fix_placeholder_spacing(text)
+
+def _stream_summary(prompt, api_key, model, metrics):
+    """
+    Streams a summary at temperature 0.6. If the same prompt is already being generated (streamed or not)
+    by another session, waits for that result and yields it in one piece instead of making a second request.
+    """
+    metrics = {} if metrics is None else metrics
+    start = time.perf_counter()
+    key = _flight_key(_call_key(model, 0.6, prompt), api_key)
+    flights = get_single_flight()
+    future, leader = flights.begin(key)
+    if not leader:
+        annotate(model=model, cache="bypass", coalesced=True)
+        try:
+            content = flights.wait(future, CLIENT_SETTINGS["timeout"])
+        except Exception:
+            content = None
+        if content is not None:
+            metrics["ttft"] = metrics["total"] = round(time.perf_counter() - start, 4)
+            yield fix_placeholder_spacing(content)
+            return
+        # The other session's request failed or is taking too long; make our own (without joining the flight group).
+        yield from _stream_chunks(prompt, api_key, model, metrics, start, [])
+        return
+
+    parts = []
+    try:
+        yield from _stream_chunks(prompt, api_key, model, metrics, start, parts)
+    except BaseException as e:
+        flights.finish(key, future, error=e if isinstance(e, Exception) else RuntimeError("Summary stream was abandoned"))
+        raise
+    flights.finish(key, future, "".join(parts))
+
+def _stream_chunks(prompt, api_key, model, metrics, start, parts):
+    """Yields placeholder-fixed text from one streamed request, appending the raw deltas to parts."""
+    fixer = PlaceholderSpacingStream()
+
+    def request():
+        stream, headers = _create(
+            api_key,
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.6,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        return stream, headers, None
+
+    scheduler = get_scheduler()
+    stream, entry = scheduler.call(model, count_tokens(prompt, model) + COMPLETION_ESTIMATE, request, hold=True)
+    annotate(model=model, cache="bypass")
+
+    for chunk in stream:
+        if getattr(chunk, "usage", None):
+            record_usage(model, chunk.usage)
+            scheduler.settle(entry, _total_tokens(chunk.usage))
+        if not chunk.choices or not chunk.choices[0].delta.content:
+            continue
+        if "ttft" not in metrics:
+            metrics["ttft"] = round(time.perf_counter() - start, 4)
+            logging.info(f"Summary stream time to first token: {metrics['ttft']}s ({model})")
+        parts.append(chunk.choices[0].delta.content)
+        text = fixer.feed(chunk.choices[0].delta.content)
+        if text:
+            yield text
+
+    text = fixer.flush()
+    if text:
+        yield text
+    metrics["total"] = round(time.perf_counter() - start, 4)
+
+def stream_discharge_summary(data, api_key, few_shot=True, model="gpt-3.5-turbo", additional_instruction="", metrics=None, compact=True):
+    """
+    Streaming variant of get_discharge_summary: yields placeholder-fixed text as tokens arrive.
+    If a metrics dict is passed, "ttft" (time to first token) and "total" are recorded in seconds.
+    """
+    prompt = build_summary_prompt(data, few_shot, additional_instruction, model, compact)
+    yield from _stream_summary(prompt, api_key, model, metrics)
+
+def build_update_prompt(previous_summary, new_entries, additional_instruction="", model="gpt-4"):
+    """
+    Narrow regeneration prompt used by incremental.py: the previous (redacted) summary plus only the
+    notes, labs and vitals recorded since it was written, instead of the whole record and few-shot examples.
+    """
+    notes = new_entries.get("notes", []) + new_entries.get("ward_round_notes", [])
+    sections = []
+    if notes:
+        sections.append("New Clinical Notes:  \n" + format_notes(notes))
+    trends = condense_trends({"labs": new_entries.get("labs", []), "flowsheets": new_entries.get("flowsheets", [])})
+    if trends:
+        sections.append("New Lab and Vital Results:  \n" + trends)
+    new_information = "\n\n".join(sections)
 
-    client = OpenAI(api_key=api_key)
-    response = client.chat.completions.create(
-        model=model,
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0.6
-    )
+    prompt = f"""
+Below is the current discharge summary for a patient, followed by clinical information recorded after it was written.
+Revise the summary so it reflects the new information. Keep the same sections, paragraph form and tone, and keep
+content that is still accurate unchanged. Update the Summary of Care, Disposition and Follow-up Plan where the new
+information changes them.
 
-    result = response.choices[0].message.content
+Current Summary:
+{previous_summary}
 
-    placeholders = [
-        "REDACTED_NAME", "REDACTED_AGE", "REDACTED_GENDER",
-        "REDACTED_ADMIT_DATE", "REDACTED_DISCHARGE_DATE", "REDACTED_DOCTOR"
-    ]
-    for ph in placeholders:
-        result = re.sub(rf'([a-zA-Z]){ph}', r'\1 ' + ph, result)
-        result = re.sub(rf'{ph}([a-zA-Z])', ph + r' \1', result)
+{new_information}
 
-    return result
+Return the complete revised discharge summary.
+""".strip()
+    prompt = _finish_summary_prompt(prompt, additional_instruction)
+    annotate(prompt_tokens_estimated=count_tokens(prompt, model), incremental=True)
+    return prompt
+
+def update_discharge_summary(previous_summary, new_entries, api_key, model="gpt-3.5-turbo", additional_instruction=""):
+    prompt = build_update_prompt(previous_summary, new_entries, additional_instruction, model)
+    return fix_placeholder_spacing(_chat(prompt, api_key, model, 0.6, False))
+
+def stream_summary_update(previous_summary, new_entries, api_key, model="gpt-3.5-turbo", additional_instruction="", metrics=None):
+    """Streaming variant of update_discharge_summary, with the same metrics as stream_discharge_summary."""
+    prompt = build_update_prompt(previous_summary, new_entries, additional_instruction, model)
+    yield from _stream_summary(prompt, api_key, model, metrics)
+
+HIGHLIGHT_CATEGORIES = [
+    "diagnosis", "duration", "medication", "investigation_result", "lab_result", "clinical_trend", "recovery_status",
+    "discharge_criteria", "followup_action", "followup_timing", "red_flag_instruction", "patient_info",
+]
+SAFETY_VERDICTS = ["Yes", "No", "Uncertain"]
 
-def extract_highlights(summary_text, api_key, model="gpt-4"):
-    prompt = f"""
+def build_highlights_prompt(summary_text):
+    return f"""
 From the discharge summary below, extract a JSON list of important clinical highlights. 
 Each item should include a \"text\" field with the exact phrase and a \"category\" field from this set:
-["diagnosis", "duration", "medication", "investigation_result", "lab_result", "clinical_trend", "recovery_status", "discharge_criteria", "followup_action", "followup_timing", "red_flag_instruction", "patient_info"]
+{json.dumps(HIGHLIGHT_CATEGORIES)}
 
 Return ONLY valid JSON like:
 [
@@ -279,28 +713,45 @@ SUMMARY:
 {summary_text}
 """
 
-    client = OpenAI(api_key=api_key)
-    response = client.chat.completions.create(
-        model=model,
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0
-    )
-
+def parse_highlights(content):
     try:
-        return json.loads(response.choices[0].message.content)
+        return json.loads(content)
     except Exception as e:
         logging.error(f"Highlight JSON parse failed: {e}")
         return []
 
-def validate_discharge_safety(summary_text, api_key, model="gpt-4"):
-    prompt = f"""
+def _valid_highlights(content):
+    # Only a reply that parses to a highlight list is cached, so a malformed one is retried next time.
+    try:
+        return isinstance(json.loads(content), list)
+    except (TypeError, ValueError):
+        return False
+
+def extract_highlights(summary_text, api_key, model="gpt-4", use_cache=True):
+    # Highlights are the one stage that may run on a cheaper model when the budget is tight.
+    prompt = build_highlights_prompt(summary_text)
+    return parse_highlights(_chat(prompt, api_key, model, 0, use_cache, downgrade=True, valid=_valid_highlights))
+
+def build_safety_prompt(summary_text, compact=True, max_examples=4):
+    """
+    With compact=True, only the safety examples most relevant to the text are included (always at least
+    one "Yes" and one "No"), and a record dict is rendered as compact text rather than its Python repr.
+    """
+    examples = few_shot_safety_examples()
+    if compact:
+        if isinstance(summary_text, dict):
+            summary_text = format_record(summary_text)
+        examples = "\n\n---\n\n".join(
+            select_safety_examples(few_shot_safety_example_list(), summary_text, max_examples)
+        )
+    return f"""
 Evaluate this discharge summary and determine whether, based on the documented care and outcome, the patient was discharged in a medically explainable way.
 
 Consider whether diagnostic workup, clinical stability, and discharge criteria are clearly documented. If there are unresolved symptoms, incomplete monitoring, or premature discharge, mark it as "No" or "Uncertain" and explain why.
 
 Return one of: "Yes", "No", or "Uncertain", and explain why using reasoning steps.
 
-{few_shot_safety_examples()}
+{examples}
 
 ---
 
@@ -308,11 +759,181 @@ Summary:
 {summary_text}
 """
 
-    client = OpenAI(api_key=api_key)
-    response = client.chat.completions.create(
-        model=model,
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0
-    )
+def validate_discharge_safety(summary_text, api_key, model="gpt-4", use_cache=True, compact=True):
+    prompt = build_safety_prompt(summary_text, compact)
+    return _chat(prompt, api_key, model, 0, use_cache).strip()
+
+# Function the combined review call must answer with: highlights, then the reasoning, then the verdict.
+REVIEW_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "report_review",
+        "description": "Reports the clinical highlights of a discharge summary and whether the discharge was medically explainable.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "highlights": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "text": {"type": "string"},
+                            "category": {"type": "string", "enum": HIGHLIGHT_CATEGORIES},
+                        },
+                        "required": ["text", "category"],
+                        "additionalProperties": False,
+                    },
+                },
+                "reasoning": {"type": "string"},
+                "verdict": {"type": "string", "enum": SAFETY_VERDICTS},
+            },
+            "required": ["highlights", "reasoning", "verdict"],
+            "additionalProperties": False,
+        },
+    },
+}
+REVIEW_ATTEMPTS = 3
+
+def build_review_prompt(summary_text, compact=True, max_examples=4):
+    """
+    One prompt for both post-generation stages: the highlight list and the safety verdict with its reasoning,
+    returned through REVIEW_TOOL. The summary is sent once instead of twice.
+    """
+    examples = few_shot_safety_examples()
+    if compact:
+        examples = "\n\n---\n\n".join(select_safety_examples(few_shot_safety_example_list(), summary_text, max_examples))
+    return f"""
+Review the discharge summary below and report the result with the report_review function.
+
+highlights: the important clinical highlights, each with the exact phrase as written in the summary and its category.
+
+reasoning and verdict: determine whether, based on the documented care and outcome, the patient was discharged in a medically explainable way. Consider whether diagnostic workup, clinical stability, and discharge criteria are clearly documented. If there are unresolved symptoms, incomplete monitoring, or premature discharge, the verdict is "No" or "Uncertain". Explain why using reasoning steps, then give the verdict: "Yes", "No", or "Uncertain".
+
+Examples of the safety judgement:
+
+{examples}
+
+---
 
-    return response.choices[0].message.content.strip()
+SUMMARY:
+{summary_text}
+"""
+
+def parse_review(arguments):
+    """
+    Validates the report_review arguments against REVIEW_TOOL and returns {"highlights", "reasoning", "verdict",
+    "safety"}, where safety is the reasoning and an "Answer:" line as validate_discharge_safety would return it.
+    Raises ValueError describing the first problem found.
+    """
+    try:
+        review = json.loads(arguments or "")
+    except ValueError as e:
+        raise ValueError(f"arguments are not valid JSON ({e})")
+    if not isinstance(review, dict):
+        raise ValueError("arguments are not a JSON object")
+    missing = {"highlights", "reasoning", "verdict"} - set(review)
+    if missing:
+        raise ValueError(f"missing fields: {sorted(missing)}")
+    if review["verdict"] not in SAFETY_VERDICTS:
+        raise ValueError(f"verdict must be one of {SAFETY_VERDICTS}, got {review['verdict']!r}")
+    if not isinstance(review["reasoning"], str) or not review["reasoning"].strip():
+        raise ValueError("reasoning must be a non-empty string")
+    if not isinstance(review["highlights"], list):
+        raise ValueError("highlights must be a list")
+    for i, item in enumerate(review["highlights"]):
+        if not isinstance(item, dict) or not isinstance(item.get("text"), str) or not item["text"].strip():
+            raise ValueError(f"highlights[{i}] needs a non-empty text")
+        if item.get("category") not in HIGHLIGHT_CATEGORIES:
+            raise ValueError(f"highlights[{i}] has an unknown category {item.get('category')!r}")
+    reasoning = review["reasoning"].strip()
+    return {
+        "highlights": [{"text": item["text"], "category": item["category"]} for item in review["highlights"]],
+        "reasoning": reasoning,
+        "verdict": review["verdict"],
+        "safety": f"Reasoning:\n{reasoning}\n\nAnswer: {review['verdict']}",
+    }
+
+def _retry_prompt(prompt, error):
+    if error is None:
+        return prompt
+    return prompt + f"\n\nYour previous reply was invalid: {error}. Call report_review again with arguments that match its schema exactly."
+
+def _cached_review(key, use_cache):
+    # Only validated replies are cached, so a malformed reply is never served again.
+    cached = get_cache().get(key) if use_cache else None
+    if cached is None:
+        return None
+    annotate(cache="hit")
+    return parse_review(cached)
+
+def _review_reply(key, arguments, attempt, model, use_cache):
+    """
+    Validates one review reply, shared by review_summary and review_summary_async. Returns (review, None) for a
+    valid reply, which is cached; (None, error) for an invalid one, to be retried with _retry_prompt(prompt, error).
+    """
+    try:
+        review = parse_review(arguments)
+    except ValueError as e:
+        logging.warning(f"Review reply invalid (attempt {attempt + 1}): {e}")
+        return None, e
+    annotate(review_attempts=attempt + 1)
+    if use_cache:
+        get_cache().set(key, arguments, model)
+    return review, None
+
+def review_summary(summary_text, api_key, model="gpt-4", use_cache=True, compact=True):
+    """
+    Highlights and post-generation safety verdict in one structured call (see build_review_prompt).
+    An invalid reply is retried with the validation error appended, up to REVIEW_ATTEMPTS calls; then ValueError.
+    """
+    prompt = build_review_prompt(summary_text, compact)
+    key = _call_key(model, 0, _keyed_prompt(prompt, REVIEW_TOOL))
+    review = _cached_review(key, use_cache)
+    if review is not None:
+        return review
+    error = None
+    for attempt in range(REVIEW_ATTEMPTS):
+        arguments = _chat(_retry_prompt(prompt, error), api_key, model, 0, False, tool=REVIEW_TOOL)
+        review, error = _review_reply(key, arguments, attempt, model, use_cache)
+        if review is not None:
+            return review
+    raise ValueError(f"Review reply still invalid after {REVIEW_ATTEMPTS} attempts: {error}")
+
+# --- Async variants (used by the concurrent pipeline in pipeline.py) ---
+
+async def get_discharge_summary_async(data, api_key, few_shot=True, model="gpt-3.5-turbo", additional_instruction="", use_cache=False, compact=True):
+    prompt = build_summary_prompt(data, few_shot, additional_instruction, model, compact)
+    return fix_placeholder_spacing(await _chat_async(prompt, api_key, model, 0.6, use_cache))
+
+async def update_discharge_summary_async(previous_summary, new_entries, api_key, model="gpt-3.5-turbo", additional_instruction=""):
+    prompt = build_update_prompt(previous_summary, new_entries, additional_instruction, model)
+    return fix_placeholder_spacing(await _chat_async(prompt, api_key, model, 0.6, False))
+
+async def extract_highlights_async(summary_text, api_key, model="gpt-4", use_cache=True):
+    prompt = build_highlights_prompt(summary_text)
+    return parse_highlights(await _chat_async(prompt, api_key, model, 0, use_cache, downgrade=True, valid=_valid_highlights))
+
+async def validate_discharge_safety_async(summary_text, api_key, model="gpt-4", use_cache=True, compact=True):
+    prompt = build_safety_prompt(summary_text, compact)
+    return (await _chat_async(prompt, api_key, model, 0, use_cache)).strip()
+
+async def review_summary_async(summary_text, api_key, model="gpt-4", use_cache=True, compact=True):
+    prompt = build_review_prompt(summary_text, compact)
+    key = _call_key(model, 0, _keyed_prompt(prompt, REVIEW_TOOL))
+    review = _cached_review(key, use_cache)
+    if review is not None:
+        return review
+    error = None
+    for attempt in range(REVIEW_ATTEMPTS):
+        arguments = await _chat_async(_retry_prompt(prompt, error), api_key, model, 0, False, tool=REVIEW_TOOL)
+        review, error = _review_reply(key, arguments, attempt, model, use_cache)
+        if review is not None:
+            return review
+    raise ValueError(f"Review reply still invalid after {REVIEW_ATTEMPTS} attempts: {error}")
+
+def parse_safety_verdict(safety_text):
+    """Returns "Yes", "No" or "Uncertain" from a safety response, or None if no verdict line is found."""
+    match = re.search(r"(?i)^answer:\s*(yes|no|uncertain)", safety_text or "", re.MULTILINE)
+    if match:
+        return match.group(1).capitalize()
+    return None
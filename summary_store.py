@@ -0,0 +1,233 @@
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+DEFAULT_SUMMARY_STORE_PATH = os.getenv("SUMMARY_STORE_PATH", "logs/summaries.sqlite")
+
+RATINGS = ("clarity", "specificity", "correctness", "sections", "no_pii")
+# Columns the aggregate queries may filter or group on (all indexed except diagnosis/view).
+GROUP_COLUMNS = ("model", "diagnosis", "filename", "patient_id", "verdict", "view", "day")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS summaries (
+    id INTEGER PRIMARY KEY,
+    created TEXT NOT NULL,
+    filename TEXT,
+    patient_id TEXT,
+    model TEXT,
+    diagnosis TEXT,
+    summary_mode TEXT,
+    instruction TEXT,
+    summary TEXT,
+    highlights TEXT,
+    safety_post TEXT,
+    verdict TEXT,
+    source TEXT,
+    source_key TEXT UNIQUE
+);
+CREATE INDEX IF NOT EXISTS idx_summaries_filename ON summaries (filename);
+CREATE INDEX IF NOT EXISTS idx_summaries_patient ON summaries (patient_id);
+CREATE INDEX IF NOT EXISTS idx_summaries_model ON summaries (model);
+CREATE INDEX IF NOT EXISTS idx_summaries_created ON summaries (created);
+CREATE INDEX IF NOT EXISTS idx_summaries_verdict ON summaries (verdict);
+
+CREATE TABLE IF NOT EXISTS evaluations (
+    id INTEGER PRIMARY KEY,
+    created TEXT NOT NULL,
+    summary_id INTEGER REFERENCES summaries (id),
+    filename TEXT,
+    patient_id TEXT,
+    model TEXT,
+    diagnosis TEXT,
+    view TEXT,
+    clarity INTEGER,
+    specificity INTEGER,
+    correctness INTEGER,
+    sections INTEGER,
+    no_pii INTEGER,
+    highlight_coverage REAL,
+    readability REAL,
+    verdict TEXT,
+    raw TEXT,
+    source TEXT,
+    source_key TEXT UNIQUE
+);
+CREATE INDEX IF NOT EXISTS idx_evaluations_filename ON evaluations (filename);
+CREATE INDEX IF NOT EXISTS idx_evaluations_patient ON evaluations (patient_id);
+CREATE INDEX IF NOT EXISTS idx_evaluations_model ON evaluations (model);
+CREATE INDEX IF NOT EXISTS idx_evaluations_created ON evaluations (created);
+CREATE INDEX IF NOT EXISTS idx_evaluations_verdict ON evaluations (verdict);
+CREATE INDEX IF NOT EXISTS idx_evaluations_model_diagnosis ON evaluations (model, diagnosis);
+"""
+
+_SUMMARY_FIELDS = ("created", "filename", "patient_id", "model", "diagnosis", "summary_mode", "instruction",
+                   "summary", "highlights", "safety_post", "verdict", "source", "source_key")
+_EVALUATION_FIELDS = ("created", "summary_id", "filename", "patient_id", "model", "diagnosis", "view", *RATINGS,
+                      "highlight_coverage", "readability", "verdict", "raw", "source", "source_key")
+
+def _now():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+def diagnosis_text(data):
+    """The record's diagnosis descriptions joined with "; " (what the dashboard filters on)."""
+    return "; ".join(d.get("description", "") for d in data.get("diagnoses", []) if d.get("description")) or None
+
+def coverage_value(coverage):
+    """0.8 from "80%" (as shown in the app), a float as is, None when missing."""
+    if isinstance(coverage, str):
+        coverage = coverage.strip().rstrip("%")
+        try:
+            return float(coverage) / 100
+        except ValueError:
+            return None
+    return coverage
+
+class SummaryStore:
+    """
+    SQLite store of generated (de-identified) summaries and clinician evaluations, indexed for the
+    dashboard's aggregate queries. Identified summaries are not stored; they can be rebuilt from the record.
+    """
+
+    def __init__(self, path=DEFAULT_SUMMARY_STORE_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+        self.conn.commit()
+
+    def _insert(self, table, fields, values):
+        row = {field: values.get(field) for field in fields}
+        row["created"] = row["created"] or _now()
+        if isinstance(row.get("highlights"), (list, dict)):
+            row["highlights"] = json.dumps(row["highlights"], ensure_ascii=False)
+        if isinstance(row.get("raw"), dict):
+            row["raw"] = json.dumps(row["raw"], ensure_ascii=False)
+        columns = ", ".join(fields)
+        placeholders = ", ".join("?" for _ in fields)
+        with self.lock:
+            cursor = self.conn.execute(
+                f"INSERT OR IGNORE INTO {table} ({columns}) VALUES ({placeholders})",
+                [row[field] for field in fields],
+            )
+            self.conn.commit()
+        return cursor.lastrowid if cursor.rowcount else None
+
+    def add_summary(self, **values):
+        """Stores one generated summary; returns its id (None if source_key was already stored)."""
+        return self._insert("summaries", _SUMMARY_FIELDS, values)
+
+    def add_evaluation(self, **values):
+        """Stores one evaluation; ratings are 1-5, highlight_coverage a fraction or "80%"."""
+        values["highlight_coverage"] = coverage_value(values.get("highlight_coverage"))
+        return self._insert("evaluations", _EVALUATION_FIELDS, values)
+
+    def _where(self, filters):
+        clauses, params = [], []
+        for column, value in filters.items():
+            if value is None or value == "":
+                continue
+            if column == "diagnosis":
+                clauses.append("diagnosis LIKE ?")
+                params.append(f"%{value}%")
+            elif column == "since":
+                clauses.append("created >= ?")
+                params.append(value)
+            elif column == "until":
+                clauses.append("created < ?")
+                params.append(value)
+            elif column in GROUP_COLUMNS:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+            else:
+                raise ValueError(f"Unknown filter: {column}")
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def _group(self, group_by):
+        unknown = set(group_by) - set(GROUP_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown group columns: {sorted(unknown)}")
+        return [("substr(created, 1, 10) AS day" if column == "day" else column) for column in group_by]
+
+    def rating_averages(self, group_by=("model",), **filters):
+        """
+        Average ratings per group, e.g. rating_averages(("model",), diagnosis="pneumonia").
+        Filters: any of GROUP_COLUMNS except day (diagnosis matches a substring), plus since/until timestamps.
+        """
+        where, params = self._where(filters)
+        select = self._group(group_by)
+        averages = ", ".join(f"ROUND(AVG({rating}), 2) AS {rating}" for rating in RATINGS)
+        sql = (
+            f"SELECT {', '.join(select + ['COUNT(*) AS evaluations', averages])}, "
+            f"ROUND(AVG(highlight_coverage), 3) AS highlight_coverage, ROUND(AVG(readability), 1) AS readability "
+            f"FROM evaluations{where}"
+            + (f" GROUP BY {', '.join(group_by)} ORDER BY {', '.join(group_by)}" if group_by else "")
+        )
+        with self.lock:
+            return [dict(row) for row in self.conn.execute(sql, params)]
+
+    def verdict_counts(self, group_by=("model",), **filters):
+        """Post-generation safety verdicts of stored summaries, counted per group."""
+        filters.pop("view", None)
+        where, params = self._where(filters)
+        select = self._group(group_by)
+        columns = ", ".join(select + [
+            "COUNT(*) AS summaries",
+            "SUM(verdict = 'Yes') AS yes",
+            "SUM(verdict = 'No') AS no",
+            "SUM(verdict = 'Uncertain') AS uncertain",
+            "SUM(verdict IS NULL) AS unparsed",
+        ])
+        sql = f"SELECT {columns} FROM summaries{where}" + (f" GROUP BY {', '.join(group_by)} ORDER BY {', '.join(group_by)}" if group_by else "")
+        with self.lock:
+            return [dict(row) for row in self.conn.execute(sql, params)]
+
+    def recent_summaries(self, limit=20, **filters):
+        filters.pop("view", None)
+        where, params = self._where(filters)
+        sql = (
+            "SELECT id, created, filename, patient_id, model, diagnosis, summary_mode, verdict, summary "
+            f"FROM summaries{where} ORDER BY created DESC, id DESC LIMIT ?"
+        )
+        with self.lock:
+            return [dict(row) for row in self.conn.execute(sql, params + [limit])]
+
+    def summary_before(self, filename, created):
+        """(id, model) of the latest summary for filename stored at or before created, or (None, None)."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT id, model FROM summaries WHERE filename = ? AND created <= ? ORDER BY created DESC, id DESC LIMIT 1",
+                (filename, created or "9999"),
+            ).fetchone()
+        return (row["id"], row["model"]) if row else (None, None)
+
+    def distinct(self, column, table="summaries"):
+        if column not in GROUP_COLUMNS or column == "day" or table not in ("summaries", "evaluations"):
+            raise ValueError(f"Unknown column: {column}")
+        with self.lock:
+            rows = self.conn.execute(f"SELECT DISTINCT {column} FROM {table} WHERE {column} IS NOT NULL ORDER BY {column}")
+            return [row[0] for row in rows]
+
+    def summary(self):
+        with self.lock:
+            return {
+                "summaries": self.conn.execute("SELECT COUNT(*) FROM summaries").fetchone()[0],
+                "evaluations": self.conn.execute("SELECT COUNT(*) FROM evaluations").fetchone()[0],
+            }
+
+_summary_store = None
+_summary_store_lock = threading.Lock()
+
+def get_summary_store():
+    """Process-wide summary store shared by all Streamlit sessions."""
+    global _summary_store
+    with _summary_store_lock:
+        if _summary_store is None:
+            _summary_store = SummaryStore()
+        return _summary_store
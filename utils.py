@@ -1,53 +1,22 @@
-import copy
+from placeholders import substitute
+from redaction import redact
+from screening import get_screening_engine
 
 def is_safe_for_discharge(data, recent_limit=2):
     """
     Checks only the most recent N notes for discharge-blocking phrases.
     This prevents false negatives if patient status improved later.
+    Phrases and negation cues come from config/discharge_screen.json (see screening.py).
     """
-    discharge_warning_phrases = [
-        "not safe for discharge",
-        "condition remains critical",
-        "requires close monitoring",
-        "unfit for discharge",
-        "not medically stable",
-    ]
-
-    all_notes = data.get("notes", []) + data.get("ward_round_notes", [])
-    # Sort by date (descending) and get the most recent N notes
-    recent_notes = sorted(
-        all_notes,
-        key=lambda x: x.get("date", "") + x.get("time", ""),
-        reverse=True
-    )[:recent_limit]
-
-    for note in recent_notes:
-        content = note.get("content") or note.get("note", "")
-        for phrase in discharge_warning_phrases:
-            if phrase in content.lower():
-                return False
-    return True
+    return get_screening_engine().is_safe(data, recent_limit)
 
 def redact_pii(data):
-    """Redacts PII from patient data before sending to LLM."""
-    redacted = copy.deepcopy(data)
-
-    # Redact patient info
-    if "patient" in redacted:
-        redacted["patient_demographics"]["name"] = "REDACTED_NAME"
-        redacted["patient_demographics"]["gender"] = "REDACTED_GENDER"
-        redacted["patient_demographics"]["age"] = "REDACTED_AGE"
-
-    # Redact note authors
-    for note in redacted.get("notes", []):
-        if "author" in note:
-            note["author"] = "REDACTED_DOCTOR"
-
-    for note in redacted.get("ward_round_notes", []):
-        if "author" in note:
-            note["author"] = "REDACTED_DOCTOR"
-
-    return redacted
+    """
+    Redacts PII from patient data before sending to LLM.
+    Only the containers holding PII fields are copied (see redaction.PII_FIELD_PATHS); everything
+    else is shared with the original record, so the result must be treated as read-only.
+    """
+    return redact(data)
 
 def insert_pii(text, data):
     """Replaces placeholders with actual patient information (for personal mode display)."""
@@ -61,9 +30,7 @@ def insert_pii(text, data):
         "REDACTED_DOCTOR": get_doctor_name(data),
     }
 
-    for placeholder, actual in replacements.items():
-        text = text.replace(placeholder, actual)
-    return text
+    return substitute(text, replacements, fix_spacing=False)
 
 def get_doctor_name(data):
     notes = data.get("notes", []) + data.get("ward_round_notes", [])
@@ -0,0 +1,305 @@
+import re
+from collections import Counter
+from itertools import chain
+import numpy as np
+from screening import TIME_OF_DAY
+
+FEVER_THRESHOLD_C = 38.0
+SPO2_TARGET = 94.0
+
+# One line per cell: an optional number (or "systolic/diastolic" pair) followed by the unit.
+# Comparators are dropped, so "<5 mg/L" reads as 5.
+_cell = re.compile(r"^[ \t]*(?:[<>≤≥]=?[ \t]*)?(?:(-?\d+(?:\.\d+)?)(?:[ \t]*/[ \t]*(-?\d+(?:\.\d+)?))?)?[ \t]*(.*)$", re.MULTILINE)
+# Suffixes flowsheet_columns gives the two rows of a paired field; only stripped from names that are not fields themselves.
+_paired_suffix = re.compile(r"_(?:systolic|diastolic|2)$")
+_NO_TIME = np.datetime64("NaT", "m")
+
+def _day(text):
+    try:
+        return np.datetime64(text[:10], "m")
+    except ValueError:
+        return _NO_TIME
+
+def _minutes(text):
+    text = text.strip()
+    hours, _, minutes = (TIME_OF_DAY.get(text.lower(), text) or "00:00").partition(":")
+    try:
+        return int(hours) * 60 + int(minutes[:2] or 0)
+    except ValueError:
+        return 0
+
+def _timestamps(dates, times):
+    """
+    datetime64[m] array from date and time strings ("08:00", "Morning", ...). Each distinct date and time is
+    parsed once; an unparseable date gives NaT and an unparseable time falls back to midnight.
+    """
+    days, day_index = np.unique(np.array(dates, dtype=str), return_inverse=True)
+    clocks, clock_index = np.unique(np.array(["" if time is None else time for time in times], dtype=str), return_inverse=True)
+    day_values = np.array([_day(day) for day in days], dtype="datetime64[m]")
+    offsets = np.array([_minutes(clock) for clock in clocks], dtype="timedelta64[m]")
+    return day_values[day_index] + offsets[clock_index]
+
+def parse_column(cells):
+    """
+    Parses unit-suffixed strings ("38.5°C", "92%", "130/85 mmHg") into float arrays.
+    Returns (values, second_values or None, unit): second_values holds the part after "/" when the column
+    has paired readings such as blood pressure. Cells in a minority unit, or without a number, are NaN.
+    Each distinct cell is parsed once (charted vitals repeat a small set of values) and broadcast back.
+    """
+    try:
+        counts = Counter(cells)
+    except TypeError:  # nested lists/objects in a cell
+        cells = [None if cell is None else str(cell) for cell in cells]
+        counts = Counter(cells)
+    distinct = list(counts)
+    position = dict(zip(distinct, range(len(distinct))))
+    inverse = np.fromiter(map(position.__getitem__, cells), dtype=np.intp, count=len(cells))
+
+    text = ["" if cell is None else str(cell).replace("\n", " ") for cell in distinct]
+    matches = _cell.findall("\n".join(text))
+    if len(matches) != len(text):
+        matches = [_cell.match(cell).groups() for cell in text]
+    first, second, units = zip(*matches) if matches else ((), (), ())
+    units = [unit.strip() for unit in units]
+
+    weights = Counter()
+    for u, value, cell in zip(units, first, distinct):
+        if value:
+            weights[u] += counts[cell]
+    unit = weights.most_common(1)[0][0] if weights else ""
+    keep = np.array([bool(value) and u == unit for u, value in zip(units, first)], dtype=bool)
+    values = np.array([value or "nan" for value in first], dtype=np.float64)
+    values[~keep] = np.nan
+    if unit in ("°F", "F"):
+        values = (values - 32) * 5 / 9
+        unit = "°C"
+    if not any(second):
+        return values[inverse], None, unit
+    second_values = np.array([value or "nan" for value in second], dtype=np.float64)
+    second_values[~keep] = np.nan
+    return values[inverse], second_values[inverse], unit
+
+def flowsheet_columns(rows):
+    """
+    Typed columns for flowsheet rows: (times, names, units, matrix) with rows sorted by time and one matrix
+    row per vital sign (blood pressure becomes systolic and diastolic rows); missing readings are NaN.
+    """
+    times = _timestamps([row.get("date", "") for row in rows], [row.get("time", "") for row in rows])
+    order = np.argsort(times, kind="stable")
+    fields = [field for field in dict.fromkeys(chain.from_iterable(rows)) if field not in ("date", "time")]
+    names, units, series = [], [], []
+    for field in fields:
+        values, second, unit = parse_column([row.get(field) for row in rows])
+        if second is None:
+            names.append(field)
+            units.append(unit)
+            series.append(values)
+        else:
+            names += [f"{field}_systolic", f"{field}_diastolic"] if "pressure" in field else [field, f"{field}_2"]
+            units += [unit, unit]
+            series += [values, second]
+    matrix = np.vstack(series)[:, order] if series else np.empty((0, len(rows)))
+    return times[order], names, units, matrix
+
+def lab_columns(labs):
+    """
+    Typed columns for lab panels: one matrix row per test and one column per panel, NaN where a test was
+    not run. A test reported twice in one panel gets an extra column with the same timestamp.
+    """
+    names = list(dict.fromkeys(test.get("name", "") for entry in labs for test in entry.get("tests", [])))
+    position = {name: i for i, name in enumerate(names)}
+    cells = [[] for _ in names]
+    dates, times = [], []
+    for entry in labs:
+        start = len(dates)
+        for test in entry.get("tests", []):
+            row = cells[position[test.get("name", "")]]
+            column = max(start, len(row))
+            if column == len(dates):
+                dates.append(entry.get("date", ""))
+                times.append(entry.get("time", ""))
+            row.extend([None] * (column - len(row)))
+            row.append(test.get("result"))
+    for row in cells:
+        row.extend([None] * (len(dates) - len(row)))
+
+    stamps = _timestamps(dates, times)
+    order = np.argsort(stamps, kind="stable")
+    units, series = [], []
+    for row in cells:
+        values, _, unit = parse_column(row)
+        units.append(unit)
+        series.append(values)
+    matrix = np.vstack(series)[:, order] if series else np.empty((0, len(dates)))
+    return stamps[order], names, units, matrix
+
+def trend_stats(times, matrix):
+    """
+    Vectorized per-series statistics for a (series, observations) matrix with NaN for missing readings:
+    count, first, last, min, max, the index of the first/last reading, and the least-squares slope per day.
+    """
+    valid = ~np.isnan(matrix)
+    count = valid.sum(axis=1)
+    observations = matrix.shape[1]
+    first_index = valid.argmax(axis=1)
+    last_index = observations - 1 - valid[:, ::-1].argmax(axis=1)
+    series = np.arange(matrix.shape[0])
+
+    known = ~np.isnat(times)
+    timed = valid & known
+    base = times[known].min() if known.any() else np.datetime64(0, "m")
+    days = np.where(known, (times - base) / np.timedelta64(1, "D"), 0)
+    timed_count = np.maximum(timed.sum(axis=1), 1)
+    mean_day = np.where(timed, days, 0).sum(axis=1) / timed_count
+    mean_value = np.where(timed, matrix, 0).sum(axis=1) / timed_count
+    dx = np.where(timed, days - mean_day[:, None], 0)
+    dy = np.where(timed, matrix - mean_value[:, None], 0)
+    sxx = (dx * dx).sum(axis=1)
+    slope = np.divide((dx * dy).sum(axis=1), sxx, out=np.full(len(sxx), np.nan), where=sxx > 0)
+
+    return {
+        "count": count,
+        "first": matrix[series, first_index],
+        "last": matrix[series, last_index],
+        "min": np.where(valid, matrix, np.inf).min(axis=1, initial=np.inf),
+        "max": np.where(valid, matrix, -np.inf).max(axis=1, initial=-np.inf),
+        "first_index": first_index,
+        "last_index": last_index,
+        "slope_per_day": slope,
+    }
+
+def _number(value):
+    return f"{value:.4g}"
+
+def _when(stamp):
+    if np.isnat(stamp):
+        return "unknown time"
+    text = str(stamp).replace("T", " ")
+    return text[:-6] if text.endswith(" 00:00") else text
+
+def _hours(start, end):
+    return _number((end - start) / np.timedelta64(1, "h"))
+
+def _label(name):
+    # Flowsheet keys ("heart_rate") read as words; lab names ("CRP", "Troponin T") are kept as written.
+    return name.replace("_", " ").capitalize() if name.islower() else name
+
+def describe_trends(times, names, units, matrix, title):
+    """
+    One compact line per series: first -> last, plus the range when it is not just the end points and the
+    slope per day from three readings on. The reading count and time window shared by most series are
+    stated once in a "<title> (...)" header line instead of on every line.
+    """
+    if not len(names) or not matrix.shape[1]:
+        return []
+    stats = trend_stats(times, matrix)
+    windows = [
+        (int(stats["count"][i]), _when(times[stats["first_index"][i]]), _when(times[stats["last_index"][i]]))
+        for i in range(len(names))
+    ]
+    shared = Counter(window for window in windows if window[0] > 1).most_common(1)
+    shared = shared[0][0] if shared and shared[0][1] > 1 else None
+
+    lines = [f"{title} ({shared[0]} readings, {shared[1]} to {shared[2]}):"] if shared else []
+    for i, name in enumerate(names):
+        count, start, end = windows[i]
+        if not count:
+            continue
+        unit = f" {units[i]}" if units[i] else ""
+        first, last, low, high = (stats[key][i] for key in ("first", "last", "min", "max"))
+        if count == 1:
+            lines.append(f"{_label(name)}: {_number(first)}{unit} ({start})")
+            continue
+        details = []
+        if {low, high} != {first, last}:
+            details.append(f"range {_number(low)}-{_number(high)}")
+        if count > 2 and not np.isnan(stats["slope_per_day"][i]):
+            details.append(f"{stats['slope_per_day'][i]:+.2g}/day")
+        if windows[i] != shared:
+            details.append(f"{count} readings, {start} to {end}")
+        suffix = f" ({', '.join(details)})" if details else ""
+        lines.append(f"{_label(name)}: {_number(first)} -> {_number(last)}{unit}{suffix}")
+    return lines
+
+def _find(names, *keys):
+    return next((i for i, name in enumerate(names) if any(key in name.lower() for key in keys)), None)
+
+def fever_course(times, names, units, matrix):
+    """When the patient became afebrile (temperature below FEVER_THRESHOLD_C until the last reading)."""
+    i = _find(names, "temp")
+    if i is None or units[i] not in ("°C", "C"):
+        return None
+    valid = ~np.isnan(matrix[i])
+    temps, stamps = matrix[i][valid], times[valid]
+    if not len(temps):
+        return None
+    febrile = np.flatnonzero(temps >= FEVER_THRESHOLD_C)
+    if not len(febrile):
+        return f"Afebrile throughout (max {_number(temps.max())} °C)"
+    last_fever = febrile[-1]
+    if last_fever == len(temps) - 1:
+        return f"Febrile at last reading ({_number(temps[-1])} °C, {_when(stamps[-1])})"
+    since = stamps[last_fever + 1]
+    return (
+        f"Afebrile since {_when(since)} ({_hours(since, stamps[-1])} h to last reading; "
+        f"last fever {_number(temps[last_fever])} °C on {_when(stamps[last_fever])})"
+    )
+
+def spo2_recovery(times, names, units, matrix):
+    """When oxygen saturation reached SPO2_TARGET and stayed there until the last reading."""
+    i = _find(names, "oxygen_saturation", "spo2", "sats")
+    if i is None:
+        return None
+    valid = ~np.isnan(matrix[i])
+    sats, stamps = matrix[i][valid], times[valid]
+    if not len(sats):
+        return None
+    below = np.flatnonzero(sats < SPO2_TARGET)
+    target = _number(SPO2_TARGET)
+    if not len(below):
+        return f"SpO2 >= {target}% throughout (lowest {_number(sats.min())}%)"
+    if below[-1] == len(sats) - 1:
+        return f"SpO2 below {target}% at last reading ({_number(sats[-1])}%, {_when(stamps[-1])})"
+    since = stamps[below[-1] + 1]
+    return (
+        f"SpO2 >= {target}% sustained since {_when(since)} ({_hours(stamps[0], since)} h after first reading; "
+        f"lowest {_number(sats.min())}%)"
+    )
+
+def _present(cells):
+    # Cells that hold a result (numeric or not), keyed by field or test name.
+    return Counter(name for name, value in cells if value is not None and str(value).strip())
+
+def _covered(columns, present):
+    """
+    The fields (keys of present) whose every result is in the matrix as a number. A field with any free-text
+    or minority-unit result is left out, so the caller's string series keeps all of its results.
+    """
+    times, names, units, matrix = columns
+    parsed = Counter()
+    for name, row in zip(names, matrix):
+        # flowsheet_columns splits a paired field ("blood_pressure") into blood_pressure_systolic/_diastolic, or x/x_2.
+        field = name if name in present else _paired_suffix.sub("", name)
+        parsed[field] = max(parsed[field], int((~np.isnan(row)).sum()))
+    return {field for field, count in present.items() if parsed[field] == count}
+
+def trend_lines(data):
+    """
+    Compact trend lines for a record's numeric labs and vitals, plus fever and SpO2 course.
+    Returns (lines, covered): covered names the lab tests and flowsheet fields whose results are all summarized
+    here, so callers can render the others (free text such as "Within normal limits") as they are.
+    """
+    lines = []
+    covered = set()
+    labs = data.get("labs") or []
+    if labs:
+        columns = lab_columns(labs)
+        lines += describe_trends(*columns, "Labs")
+        covered |= _covered(columns, _present((test.get("name", ""), test.get("result")) for entry in labs for test in entry.get("tests", [])))
+    rows = data.get("flowsheets") or []
+    if rows:
+        columns = flowsheet_columns(rows)
+        lines += describe_trends(*columns, "Vitals")
+        lines += [line for line in (fever_course(*columns), spo2_recovery(*columns)) if line]
+        covered |= _covered(columns, _present((field, value) for row in rows for field, value in row.items() if field not in ("date", "time")))
+    return lines, covered